@@ -0,0 +1,230 @@
+# Bootstrap confidence intervals and permutation tests for contrasts between the conditions of an experiment
+#
+# A contrast is a dictionary with condition names as keys and weights as values, e.g. {'HighTI': 1, 'LowTI': -1}
+# or the interaction of a 2x2 design (see interaction). All resamples are drawn as index arrays and evaluated
+# with batched NumPy operations, chunk_size bounds the number of values that are resampled at once.
+
+import json
+import os
+
+import numpy as np
+
+
+def interaction(a1b1, a1b0, a0b1, a0b0):
+    '''
+    Interaction contrast of a 2x2 design: (a1b1 - a1b0) - (a0b1 - a0b0)
+
+    :param a1b1: (string) name of the condition with both factors high, the others accordingly
+    :return: (dict) weights of the conditions
+    '''
+    return {a1b1: 1., a1b0: -1., a0b1: -1., a0b0: 1.}
+
+
+def get_values(results, contrast):
+    '''
+    :param results: (dict) has the condition names as keys and the attributions as values
+    :param contrast: (dict) weights of the conditions
+    :return: values (list of np.array), weights (np.array) of the conditions of the contrast
+    '''
+
+    missing = [name for name in contrast if name not in results]
+    if missing:
+        raise KeyError(f'No results for the conditions {", ".join(missing)}')
+    values = [np.asarray(results[name], dtype=float) for name in contrast]
+    if any(len(elem) == 0 for elem in values):
+        raise ValueError('Every condition of the contrast needs results, e.g. an online run keeps none')
+    return values, np.array([float(elem) for elem in contrast.values()])
+
+
+def stack_paired(values):
+    '''
+    :param values: (list of np.array) attributions of the conditions
+    :return: (np.array) participants x conditions
+    '''
+
+    if len(set(len(elem) for elem in values)) != 1:
+        raise ValueError('Paired resampling needs the same number of participants in every condition')
+    return np.stack(values, axis=1)
+
+
+def chunks(n_resamples, size, chunk_size):
+    '''
+    :param n_resamples: (int) number of resamples
+    :param size: (int) number of values of one resample
+    :param chunk_size: (int) maximal number of values that are resampled at once
+    :return: generator of (int) number of resamples of each chunk
+    '''
+
+    step = max(1, chunk_size // max(size, 1))
+    for start in range(0, n_resamples, step):
+        yield min(step, n_resamples - start)
+
+
+def estimate(results, contrast):
+    '''
+    :param results: (dict) has the condition names as keys and the attributions as values
+    :param contrast: (dict) weights of the conditions
+    :return: (float) weighted sum of the mean attributions
+    '''
+
+    values, weights = get_values(results, contrast)
+    return float(sum(weight * elem.mean() for weight, elem in zip(weights, values)))
+
+
+def bootstrap(results, contrast, n_resamples=10000, confidence=0.95, paired=False, seed=None, chunk_size=10 ** 7):
+    '''
+    Percentile bootstrap of a contrast. Without pairing the participants of each condition are resampled
+    independently, with pairing participant i is resampled in all conditions at once (common random numbers).
+
+    :param results: (dict) has the condition names as keys and the attributions as values
+    :param contrast: (dict) weights of the conditions
+    :param n_resamples: (int) number of bootstrap resamples
+    :param confidence: (float) level of the confidence interval
+    :param paired: (bool) if true the conditions are resampled by participant
+    :param seed: (int) seed of the resampling
+    :param chunk_size: (int) maximal number of values that are resampled at once
+
+    :return: (dict) with the keys 'estimate', 'se', 'ci' (lower and upper bound), 'confidence' and 'n_resamples'
+    '''
+
+    values, weights = get_values(results, contrast)
+    rng = np.random.default_rng(seed)
+    statistics = []
+    if paired:
+        # Weighted sum of the conditions of each participant, the contrast is its mean
+        scores = stack_paired(values) @ weights
+        n = len(scores)
+        for size in chunks(n_resamples, n, chunk_size):
+            statistics.append(scores[rng.integers(0, n, (size, n))].mean(axis=1))
+    else:
+        total = sum(len(elem) for elem in values)
+        for size in chunks(n_resamples, total, chunk_size):
+            statistic = np.zeros(size)
+            for weight, elem in zip(weights, values):
+                statistic += weight * elem[rng.integers(0, len(elem), (size, len(elem)))].mean(axis=1)
+            statistics.append(statistic)
+    statistics = np.concatenate(statistics)
+    alpha = 1 - confidence
+    return {'estimate': float(sum(weight * elem.mean() for weight, elem in zip(weights, values))),
+            'se': float(statistics.std(ddof=1)),
+            'ci': [float(elem) for elem in np.quantile(statistics, [alpha / 2, 1 - alpha / 2])],
+            'confidence': confidence, 'n_resamples': n_resamples}
+
+
+def permutation_test(results, contrast, n_resamples=10000, paired=False, seed=None, chunk_size=10 ** 7, strata=None):
+    '''
+    Two-sided permutation test of the null hypothesis that the contrast is zero. Without pairing the
+    attributions are shuffled across the conditions, with pairing the conditions are shuffled within each
+    participant. The weights of the contrast have to sum to zero.
+
+    Shuffling all conditions is only exact if they are exchangeable under the null hypothesis, i.e. for
+    two conditions. A main effect of a factorial design is tested with a restricted permutation: the strata
+    group the conditions that share the levels of the other factors and the attributions are only shuffled
+    within a stratum, e.g. [['PI0SA1', 'PI0SA0'], ['PI1SA1', 'PI1SA0']] for the main effect of SA. The
+    interaction of a 2x2 design has no exact permutation test, bootstrap it instead.
+
+    :param results: (dict) has the condition names as keys and the attributions as values
+    :param contrast: (dict) weights of the conditions
+    :param n_resamples: (int) number of permutations
+    :param paired: (bool) if true the conditions are permuted within each participant
+    :param seed: (int) seed of the permutations
+    :param chunk_size: (int) maximal number of values that are permuted at once
+    :param strata: (list of lists) condition names that are shuffled among each other, needed for more than
+                   two conditions
+
+    :return: (dict) with the keys 'estimate', 'p_value' and 'n_resamples'
+    '''
+
+    if strata is None:
+        if len(contrast) > 2:
+            raise ValueError('Shuffling more than two conditions at once is not exact if the other effects are not zero, '
+                             'give the strata of a restricted permutation')
+        strata = [list(contrast)]
+    names = [name for stratum in strata for name in stratum]
+    if sorted(names) != sorted(contrast):
+        raise ValueError('Every condition of the contrast has to be in exactly one stratum')
+    if any(not np.isclose(sum(float(contrast[name]) for name in stratum), 0) for stratum in strata):
+        raise ValueError('The weights of a contrast that is tested with permutations have to sum to zero in every stratum')
+    # Conditions ordered by stratum, adding the index of the stratum to the random keys of the shuffle keeps
+    # every value within its stratum
+    values, weights = get_values(results, {name: contrast[name] for name in names})
+    block = np.concatenate([np.full(len(stratum), float(i)) for i, stratum in enumerate(strata)])
+    rng = np.random.default_rng(seed)
+    if paired:
+        data = stack_paired(values)
+        observed = (data @ weights).mean()
+        n, k = data.shape
+        exceed = 0
+        for size in chunks(n_resamples, n * k, chunk_size):
+            order = np.argsort(rng.random((size, n, k)) + block, axis=-1)
+            permuted = np.take_along_axis(np.broadcast_to(data, (size, n, k)), order, axis=-1)
+            exceed += np.sum(np.abs((permuted @ weights).mean(axis=1)) >= abs(observed) - 1e-12)
+    else:
+        pooled = np.concatenate(values)
+        # Weight of each value in the contrast, i.e. the contrast is pooled @ element_weights
+        element_weights = np.concatenate([np.full(len(elem), weight / len(elem)) for weight, elem in zip(weights, values)])
+        block = np.repeat(block, [len(elem) for elem in values])
+        observed = pooled @ element_weights
+        exceed = 0
+        for size in chunks(n_resamples, len(pooled), chunk_size):
+            order = np.argsort(rng.random((size, len(pooled))) + block, axis=1)
+            exceed += np.sum(np.abs(pooled[order] @ element_weights) >= abs(observed) - 1e-12)
+    return {'estimate': float(observed), 'p_value': float((exceed + 1) / (n_resamples + 1)), 'n_resamples': n_resamples}
+
+
+def analyse(experiment, contrasts, n_resamples=10000, confidence=0.95, paired=None, seed=None, strata=None):
+    '''
+    Bootstrap of each contrast of an experiment. Contrasts of two conditions and contrasts with strata are
+    also tested with permutations, the others (e.g. the interaction of a 2x2 design) only get a confidence interval.
+
+    :param experiment: (Experiment) that has been run
+    :param contrasts: (dict) has the names of the contrasts as keys and the weights of the conditions as values
+    :param n_resamples: (int) number of resamples of the bootstrap and of the permutation test
+    :param confidence: (float) level of the confidence intervals
+    :param paired: (bool) resample by participant, by default true if the run used common random numbers
+    :param seed: (int) seed of the resampling
+    :param strata: (dict) has the names of contrasts as keys and the strata of their restricted permutation
+                   as values, see permutation_test
+
+    :return: (dict) has the names of the contrasts as keys and dictionaries with the estimate, standard error,
+                    confidence interval and p-value as values
+    '''
+
+    if paired is None:
+        paired = experiment.common_random_numbers
+    strata = strata or {}
+    analysis = {}
+    for i, (name, contrast) in enumerate(contrasts.items()):
+        stream = None if seed is None else [seed, i]
+        result = bootstrap(experiment.results, contrast, n_resamples, confidence, paired, stream)
+        weights = np.array(list(contrast.values()), dtype=float)
+        if name in strata or (len(contrast) == 2 and np.isclose(weights.sum(), 0)):
+            result['p_value'] = permutation_test(experiment.results, contrast, n_resamples, paired, stream,
+                                                 strata=strata.get(name))['p_value']
+        result.update({'weights': {key: float(value) for key, value in contrast.items()}, 'paired': paired})
+        analysis[name] = result
+    return analysis
+
+
+def export(analysis, experiment, directory):
+    '''
+    Save an analysis as JSON next to the plot of the experiment (see Experiment.plot_result)
+
+    :param analysis: (dict) see analyse
+    :param experiment: (Experiment)
+    :param directory: (string)
+    :return: (string) path of the file
+    '''
+
+    path = os.path.join(directory, experiment.name + ' Analysis.json')
+    with open(path, 'w') as f:
+        json.dump({'experiment': experiment.name, 'seed': getattr(experiment, 'seed', None),
+                   'contrasts': analysis}, f, indent=2)
+    return path
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    results = {'high': rng.normal(0.3, 1, 100), 'low': rng.normal(0, 1, 100)}
+    print(bootstrap(results, {'high': 1, 'low': -1}, seed=0))
+    print(permutation_test(results, {'high': 1, 'low': -1}, seed=0))
@@ -0,0 +1,201 @@
+# Benchmarks of the inference and experiment hot paths
+#
+# Times LW.inferLW, the branches of Human.inference and full runs of the experiments in experiments.py
+# for a sweep over the number of particles (L) and participants (N). The results are saved as JSON
+# so that runs can be compared, e.g.
+#
+#   python3 benchmarks.py --L 10 100 1000 --N 10 100 --output benchmark.json
+
+import argparse
+from collections import OrderedDict
+import json
+import platform
+import time
+
+import numpy as np
+import pyro
+import pyro.distributions
+import torch
+
+from experiment import Experiment
+from inference_util import LW
+from utils import Variable
+
+
+# Fixed values of the Variables that force Human.inference through one of its branches
+branches = OrderedDict()
+branches['Step 4'] = {'SA': Variable(0,'SA','fixed',{'fixed':0}), 'success': 0}
+branches['Step 6'] = {'SA': Variable(0,'SA','fixed',{'fixed':1}), 'success': 1}
+branches['Step 8'] = {'SA': Variable(0,'SA','fixed',{'fixed':1}), 'PI': Variable(0,'PI','fixed',{'fixed':1}), 'success': 0}
+branches['Step 9'] = {'SA': Variable(0,'SA','fixed',{'fixed':1}), 'PI': Variable(0,'PI','fixed',{'fixed':-1}), 'success': 0}
+# Number of inference calls of a participant in each branch
+calls = {'Step 4': 1, 'Step 6': 1, 'Step 8': 1, 'Step 9': 2}
+
+# Ways of running the inference that are compared, every mode states whether the NumPy backend is used
+modes = OrderedDict()
+modes['sequential'] = {'inference_options': {'vectorized': False, 'fast_backend': False}, 'batched': False}
+modes['vectorized'] = {'inference_options': {'vectorized': True, 'fast_backend': False}, 'batched': False}
+modes['batched'] = {'inference_options': {'vectorized': True, 'fast_backend': False}, 'batched': True}
+modes['numpy'] = {'inference_options': {'vectorized': True, 'fast_backend': True}, 'batched': False}
+modes['qmc'] = {'inference_options': {'qmc': True, 'fast_backend': False}, 'batched': False}
+modes['quadrature'] = {'inference_options': {'engine': 'quadrature', 'fast_backend': False}, 'batched': False}
+modes['rao-blackwell'] = {'inference_options': {'engine': 'rao-blackwell', 'fast_backend': False}, 'batched': False}
+modes['importance'] = {'inference_options': {'engine': 'importance', 'fast_backend': False}, 'batched': False}
+
+def beta_binomial_model(n,a,b):
+    theta = pyro.sample('theta', pyro.distributions.Beta(a,b))
+    k = pyro.sample('successes', pyro.distributions.Binomial(n, theta))
+    return k
+
+
+def timeit(function, repeat):
+    '''
+    Best wall-clock time of a number of calls
+
+    :param function: (callable) without arguments
+    :param repeat: (int) number of calls
+    :return: (float) seconds
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_lw(Ls, repeat):
+    '''
+    Time LW.inferLW on the Beta-Binomial model of inference_util.py
+
+    :param Ls: (list) numbers of particles
+    :param repeat: (int)
+    :return: (list) of result dictionaries
+    '''
+    n = torch.tensor(10,dtype=torch.float32)
+    a = torch.tensor(5,dtype=torch.float32)
+    b = torch.tensor(10,dtype=torch.float32)
+    obs = {'successes': torch.tensor(4,dtype=torch.float32)}
+
+    results = []
+    for vectorized in [False, True]:
+        lw = LW(beta_binomial_model, f={'identity':lambda x:x}, vectorized=vectorized)
+        for L in Ls:
+            seconds = timeit(lambda: lw.inferLW(L,obs,n,a,b), repeat)
+            results.append({'mode': 'vectorized' if vectorized else 'sequential', 'L': L,
+                            'seconds': seconds, 'particles/sec': L / seconds})
+            print(f'LW {results[-1]["mode"]} L={L}: {L / seconds:.0f} particles/sec')
+    return results
+
+
+def bench_human(setup, Ls, Ns, repeat):
+    '''
+    Time Human.inference for each of its branches. Every branch and mode gets a new Human and new Variables
+    from setup, so the modes do not see the state (e.g. sampled values) that the previous ones left behind.
+
+    :param setup: (callable) returns the Human and the default variables of the participant, see experiments.setup
+    :param Ls: (list) numbers of particles
+    :param Ns: (list) numbers of participants
+    :param repeat: (int)
+    :return: (list) of result dictionaries
+    '''
+    results = []
+    for branch, condition in branches.items():
+        for mode, options in modes.items():
+            human, variables = setup()
+            for L in Ls:
+                for N in Ns:
+                    vs = dict(variables)
+                    vs.update(condition)
+                    vs['L'] = L
+                    vs['inference_options'] = options['inference_options']
+
+                    def participants():
+                        if options['batched']:
+                            human.set_variables(vs, True)
+                            return human.batch_inference(N)
+                        attributions = []
+                        for _ in range(N):
+                            human.set_variables(vs, True)
+                            attributions.append(human.inference())
+                        return attributions
+
+                    seconds = timeit(participants, repeat)
+                    results.append({'branch': branch, 'mode': mode, 'L': L, 'N': N, 'seconds': seconds,
+                                    'participants/sec': N / seconds,
+                                    'particles/sec': N * L * calls[branch] / seconds})
+                    print(f'Human {branch} {mode} L={L} N={N}: {N / seconds:.1f} participants/sec')
+    return results
+
+
+def bench_experiments(setup, names, Ls, Ns, workers, repeat):
+    '''
+    Time Experiment.run for the experiments in experiments.py. Every experiment and mode is built from a new
+    Human and new Variables from setup.
+
+    :param setup: (callable) returns the Human and the default variables, see experiments.setup
+    :param names: (list) names of the experiments, see experiments.build_experiment
+    :param Ls: (list) numbers of particles
+    :param Ns: (list) numbers of participants per condition
+    :param workers: (int) number of processes
+    :param repeat: (int)
+    :return: (list) of result dictionaries
+    '''
+    results = []
+    from experiments import build_experiment
+
+    for name in names:
+        for mode, options in modes.items():
+            experiment = build_experiment(name, *setup())
+            for L in Ls:
+                for N in Ns:
+                    vs = dict(experiment.variables)
+                    vs['L'] = L
+                    vs['inference_options'] = options['inference_options']
+                    new_experiment = Experiment(experiment.name, experiment.human, vs)
+                    for condition in experiment.conditions:
+                        new_experiment.register_condition(dict(condition, N=N))
+
+                    seconds = timeit(lambda: new_experiment.run(batched=options['batched'], workers=workers, seed=0), repeat)
+                    participants = N * new_experiment.n_conditions
+                    results.append({'experiment': experiment.name, 'mode': mode, 'L': L, 'N': N, 'workers': workers,
+                                    'seconds': seconds, 'participants/sec': participants / seconds})
+                    print(f'Experiment {experiment.name} {mode} L={L} N={N}: {participants / seconds:.1f} participants/sec')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the inference and experiment hot paths')
+    parser.add_argument('--L', type=int, nargs='+', default=[10, 100, 1000], help='numbers of particles')
+    parser.add_argument('--N', type=int, nargs='+', default=[10, 100], help='numbers of participants')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes for the experiment runs')
+    parser.add_argument('--repeat', type=int, default=3, help='the best of repeat runs is reported')
+    parser.add_argument('--skip', nargs='*', default=[], choices=['lw', 'human', 'experiments'],
+                        help='benchmarks that are not run')
+    parser.add_argument('--output', default='benchmark.json', help='file the results are saved to')
+    args = parser.parse_args()
+
+    results = OrderedDict()
+    results['meta'] = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+                       'torch': torch.__version__, 'pyro': pyro.__version__, 'numpy': np.__version__,
+                       'machine': platform.machine(), 'L': args.L, 'N': args.N, 'workers': args.workers,
+                       'repeat': args.repeat}
+
+    if 'lw' not in args.skip:
+        results['lw'] = bench_lw(args.L, args.repeat)
+    if 'human' not in args.skip or 'experiments' not in args.skip:
+        from experiments import experiments
+        from experiments import setup
+
+    if 'human' not in args.skip:
+        results['human'] = bench_human(setup, args.L, args.N, args.repeat)
+    if 'experiments' not in args.skip:
+        results['experiments'] = bench_experiments(setup, list(experiments), args.L, args.N, args.workers, args.repeat)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
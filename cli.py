@@ -0,0 +1,257 @@
+# Command line interface to the experiments
+#
+#   cog-sim list
+#   cog-sim run duval-silvia task-importance --workers 4 --seed 0 --store results --plots plots
+#   cog-sim run --config experiment.json
+#   cog-sim plot results/task-importance --plots plots
+#   cog-sim run duval-silvia --seed 0 --analyse      # confidence intervals and p-values of the contrasts
+#   cog-sim sweep task-importance --points 11 --N 50 --workers 4
+#   cog-sim run --all --seed 0 --cache cache      # later runs only simulate changed conditions
+#   cog-sim run task-importance --sequential "HighTI - LowTI" --max-N 500
+#
+# torch, pyro and matplotlib are only imported by the commands that need them. Without a display
+# matplotlib uses the Agg backend, so the commands run on headless nodes.
+
+import argparse
+import os
+import sys
+
+
+def use_headless_backend(force=False):
+    '''
+    Let matplotlib use the Agg backend if there is no display (or if force is true).
+    Has to be called before matplotlib is imported.
+
+    :param force: (bool)
+    '''
+    if force or (sys.platform.startswith('linux') and not os.environ.get('DISPLAY')
+                 and not os.environ.get('WAYLAND_DISPLAY')):
+        os.environ['MPLBACKEND'] = 'Agg'
+
+
+def make_directory(directory):
+    '''
+    :param directory: (string) created if it does not exist
+    :return: (string) the directory
+    '''
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    return directory
+
+
+def get_cache(args):
+    '''
+    :return: (ConditionCache) of the --cache directory, None if it is not given
+    '''
+    if not args.cache:
+        return None
+    from store import ConditionCache
+
+    return ConditionCache(args.cache)
+
+
+def list_experiments(args):
+    '''
+    Print the names of the experiments that can be run
+    '''
+    from experiments import experiments
+    from experiments import sweeps
+
+    for name, (_, description) in experiments.items():
+        print(f'{name:20s}{description}')
+    print('\nSweeps (cog-sim sweep):')
+    for name, (_, description) in sweeps.items():
+        print(f'{name:20s}{description}')
+    return 0
+
+
+def run_experiments(args):
+    '''
+    Run the experiments given by name or by a configuration file and plot their results
+    '''
+    from experiments import build_experiment
+    from experiments import contrasts
+    from experiments import experiments
+    from experiments import setup
+
+    names = list(experiments) if args.all else args.names
+    if not names and not args.config:
+        print('Name an experiment, use --all or --config (see cog-sim list)')
+        return 1
+    unknown = [name for name in names if name not in experiments]
+    if unknown:
+        print(f'Unknown experiment {", ".join(unknown)}, see cog-sim list')
+        return 1
+
+    if args.sequential and (args.store or args.cache or args.online):
+        print('A sequential run cannot be combined with --store, --cache or --online')
+        return 1
+
+    human, variables = setup()
+    if args.L is not None:
+        variables['L'] = args.L
+    runs = [(name, build_experiment(name, human, variables)) for name in names]
+    if args.config:
+        from run_experiments import build_experiment as build_from_config
+        from run_experiments import load_config
+
+        config = load_config(args.config)
+        runs.append((os.path.splitext(os.path.basename(args.config))[0], build_from_config(config, human, variables)))
+
+    for name, experiment in runs:
+        experiment.summary()
+        if args.dry_run:
+            continue
+        store = None
+        if args.store:
+            from store import ResultStore
+
+            store = ResultStore(os.path.join(args.store, name))
+        if args.sequential:
+            if args.sequential not in contrasts.get(name, {}):
+                print(f'Unknown contrast {args.sequential} of {name}, choose from {", ".join(contrasts.get(name, {}))}')
+                return 1
+            experiment.run(batched=args.batched, workers=args.workers, seed=args.seed,
+                           common_random_numbers=args.common_random_numbers,
+                           sequential={'contrast': contrasts[name][args.sequential], 'batch_size': args.batch_size,
+                                       'max_N': args.max_N, 'alpha': args.alpha, 'tolerance': args.tolerance})
+        else:
+            experiment.run(batched=args.batched, workers=args.workers, seed=args.seed, store=store,
+                           common_random_numbers=args.common_random_numbers, cache=get_cache(args),
+                           online=args.online)
+        experiment.plot_result(False, make_directory(args.plots))
+        if args.analyse and name in contrasts:
+            from analysis import analyse
+            from analysis import export
+            from experiments import strata
+
+            analysis = analyse(experiment, contrasts[name], args.resamples, seed=args.seed, strata=strata.get(name))
+            print(f'Analysis saved to {export(analysis, experiment, args.plots)}')
+    return 0
+
+
+def run_sweep(args):
+    '''
+    Run a sweep, plot its dose-response curves and save them as .npz
+    '''
+    from experiments import setup
+    from experiments import sweeps
+
+    if args.name not in sweeps:
+        print(f'Unknown sweep {args.name}, see cog-sim list')
+        return 1
+
+    human, variables = setup()
+    if args.L is not None:
+        variables['L'] = args.L
+    sweep = sweeps[args.name][0](human, variables, args.points, args.N)
+    if args.dry_run:
+        sweep.build_experiment().summary()
+        return 0
+    store = None
+    if args.store:
+        from store import ResultStore
+
+        store = ResultStore(os.path.join(args.store, f'sweep-{args.name}'))
+    sweep.run(batched=args.batched, workers=args.workers, seed=args.seed, store=store,
+              common_random_numbers=args.common_random_numbers, cache=get_cache(args), online=args.online)
+    directory = make_directory(args.plots)
+    sweep.plot_result(False, directory)
+    sweep.save(os.path.join(directory, f'sweep-{args.name}.npz'))
+    return 0
+
+
+def plot_results(args):
+    '''
+    Plot the results of runs that were saved in result stores
+    '''
+    from experiment import Experiment
+    from store import ResultStore
+
+    for directory in args.stores:
+        store = ResultStore(directory)
+        experiment = Experiment(store.manifest.get('experiment', os.path.basename(os.path.normpath(directory))), None, {})
+        experiment.load_results(store)
+        if not experiment.results:
+            print(f'No results in {directory}')
+            continue
+        experiment.plot_result(False, make_directory(args.plots))
+    return 0
+
+
+def get_parser():
+    '''
+    :return: (argparse.ArgumentParser)
+    '''
+    parser = argparse.ArgumentParser(prog='cog-sim', description='Simulate experiments on the self-serving bias')
+    parser.add_argument('--headless', action='store_true', help='always use the Agg backend of matplotlib')
+    commands = parser.add_subparsers(dest='command')
+
+    parser_list = commands.add_parser('list', help='list the experiments')
+    parser_list.set_defaults(function=list_experiments)
+
+    parser_run = commands.add_parser('run', help='run experiments and plot their results')
+    parser_run.add_argument('names', nargs='*', help='names of the experiments (see cog-sim list)')
+    parser_run.add_argument('--all', action='store_true', help='run all experiments')
+    parser_run.add_argument('--config', help='JSON configuration of an experiment (see run_experiments.py)')
+    parser_run.add_argument('--workers', type=int, default=1, help='number of processes')
+    parser_run.add_argument('--seed', type=int, default=None, help='seed of the experiments')
+    parser_run.add_argument('--batched', action='store_true', help='simulate the participants of a condition at once')
+    parser_run.add_argument('--common-random-numbers', action='store_true',
+                            help='use the same random numbers for participant i of every condition')
+    parser_run.add_argument('--L', type=int, default=None, help='number of particles of the inference')
+    parser_run.add_argument('--online', action='store_true',
+                            help='only keep running summaries of the attributions (constant memory)')
+    parser_run.add_argument('--cache', help='directory of the cache of condition results, only runs with --seed hit it')
+    parser_run.add_argument('--store', help='directory the results are streamed to, one subdirectory per experiment')
+    parser_run.add_argument('--plots', default='plots', help='directory the plots are saved to')
+    parser_run.add_argument('--analyse', action='store_true',
+                            help='bootstrap and permutation tests of the contrasts, saved next to the plots')
+    parser_run.add_argument('--resamples', type=int, default=10000, help='number of resamples of the analysis')
+    parser_run.add_argument('--sequential', metavar='CONTRAST',
+                            help='add participants in batches until this contrast of experiments.contrasts is resolved')
+    parser_run.add_argument('--batch-size', type=int, default=10, help='participants per condition and look')
+    parser_run.add_argument('--max-N', type=int, default=None, help='maximal number of participants per condition')
+    parser_run.add_argument('--alpha', type=float, default=0.05, help='error probability of the sequential run')
+    parser_run.add_argument('--tolerance', type=float, default=None,
+                            help='also stop once the confidence interval is narrower than this')
+    parser_run.add_argument('--dry-run', action='store_true', help='only print the summaries of the experiments')
+    parser_run.set_defaults(function=run_experiments)
+
+    parser_sweep = commands.add_parser('sweep', help='run a sweep and plot its dose-response curves')
+    parser_sweep.add_argument('name', help='name of the sweep (see cog-sim list)')
+    parser_sweep.add_argument('--points', type=int, default=11, help='number of points of the grid')
+    parser_sweep.add_argument('--N', type=int, default=100, help='number of participants at each point')
+    parser_sweep.add_argument('--workers', type=int, default=1, help='number of processes')
+    parser_sweep.add_argument('--seed', type=int, default=None, help='seed of the sweep')
+    parser_sweep.add_argument('--batched', action='store_true', help='simulate the participants of a point at once')
+    parser_sweep.add_argument('--common-random-numbers', action='store_true',
+                              help='use the same random numbers for participant i of every condition')
+    parser_sweep.add_argument('--L', type=int, default=None, help='number of particles of the inference')
+    parser_sweep.add_argument('--online', action='store_true',
+                              help='only keep running summaries of the attributions (constant memory)')
+    parser_sweep.add_argument('--cache', help='directory of the cache of condition results, only runs with --seed hit it')
+    parser_sweep.add_argument('--store', help='directory the results are streamed to')
+    parser_sweep.add_argument('--plots', default='plots', help='directory the plot and the results are saved to')
+    parser_sweep.add_argument('--dry-run', action='store_true', help='only print the summary of the sweep')
+    parser_sweep.set_defaults(function=run_sweep)
+
+    parser_plot = commands.add_parser('plot', help='plot the results in result stores')
+    parser_plot.add_argument('stores', nargs='+', help='directories of the result stores')
+    parser_plot.add_argument('--plots', default='plots', help='directory the plots are saved to')
+    parser_plot.set_defaults(function=plot_results)
+    return parser
+
+
+def main(argv=None):
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    use_headless_backend(args.headless)
+    return args.function(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
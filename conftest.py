@@ -0,0 +1 @@
+# The modules of the framework are top-level modules, pytest puts this directory on the path for the tests
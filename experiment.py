@@ -1,10 +1,64 @@
 
+import itertools
+import json
+import math
+import multiprocessing
 import os
+import time
+import zlib
 
-import matplotlib.pyplot as plt
 import numpy as np
 from tqdm import tqdm
 
+from profiling import Profiler
+from stats import RunningStats
+from stats import obrien_fleming
+from stats import student_t_quantile
+from utils import Variable
+
+# torch, pyro and matplotlib are imported where they are needed, so that setting up an experiment,
+# its summary and plotting stored results start fast
+
+# Experiment that is run by the worker processes, it is inherited when the workers are forked
+_experiment = None
+
+
+def _init_worker():
+    '''
+    Avoid oversubscription of the cores by the intra-op threads of torch
+    '''
+    import torch
+
+    torch.set_num_threads(1)
+
+
+def _run_task(task):
+    '''
+    Simulates a chunk of participants in a worker process
+
+    :param task: (tuple) condition index, first participant, last participant (exclusive), batched, profile
+    :return: (list) participant records
+    '''
+    return list(_experiment.iter_participants(*task))
+
+
+def participant_value(value, index=None):
+    '''
+    Value of a Variable for one participant as a float
+
+    :param value: (float/tensor) value of the Variable, a tensor with one entry per participant for a batch
+    :param index: (int) index of the participant in the batch
+
+    :return: (float)
+    '''
+    import torch
+
+    value = torch.as_tensor(value)
+    if index is not None and value.dim() > 0:
+        return value[index].item()
+    return value.item()
+
+
 class Experiment(object):
     '''
     Class to support simulating an experiment
@@ -30,6 +84,12 @@ class Experiment(object):
         self.n_conditions = 0
         self.human = human
         self.variables = variables
+        # If true all conditions use the same random streams, see Experiment.run
+        self.common_random_numbers = False
+        # Values of the Variables of the participants of each condition of the current run, see get_draws
+        self.draws = {}
+        # Running summaries of the attributions of each condition of an online run, see Experiment.run
+        self.summaries = None
 
 
     def register_condition(self, condition):
@@ -46,33 +106,558 @@ class Experiment(object):
         self.conditions.append(condition)
 
 
-    def run(self):
+    def get_condition_variables(self, condition):
+        '''
+        Set up a dictionary that contains the values of the variables in a condition.
+        The Variables are copied, so the values of the participants are not written to the shared
+        Variables of the experiment (or of other conditions and experiments).
+
+        :param condition: (dict) description of the experimental condition
+        :return: (dict)
+        '''
+
+        vs = dict(self.variables)
+        for var_name, var_value in condition.items():
+            if var_name != 'N' and var_name != 'name':
+                vs[var_name] = var_value
+        for var_name, var_value in vs.items():
+            if isinstance(var_value, Variable):
+                vs[var_name] = Variable(var_value.internal, var_value.name, var_value.dist, var_value.param)
+        return vs
+
+    def get_condition_key(self, index, batched=False):
+        '''
+        Hash of everything the results of a condition depend on: the variables of the condition (distributions
+        and parameters of the Variables, N, L, the functions f, the inference options and e.g. the posterior
+        tables), the participant (its parameters and the source of the modules of the Human, the intuitive theory,
+        its NumPy version and registered structure, the inference engine and the experiment), the seed, common random numbers, batched and the index of the condition (the random streams
+        are derived from it). The name of the condition is not part of it.
+
+        :param index: (int) index of the condition
+        :param batched: (bool) whether the participants are simulated at once
+        :return: (string)
+        '''
+        import inference_util
+        import numpy_backend
+        import utils
+        from generative_processes import get_structure
+        from store import source_of
+        from store import specification_hash
+
+        condition = self.conditions[index]
+        human = self.human
+        vs = self.get_condition_variables(condition)
+        # The code that actually runs: the NumPy version of the intuitive theory, its registered structure
+        # (Rao-Blackwell engine) and the modules of the selected engine and of its posterior tables
+        options = vs.get('inference_options', {})
+        engine = inference_util.engines.get(options.get('engine', 'LW'))
+        backend = numpy_backend.get_backend(human.intuitive_theory)
+        specification = {
+            'variables': vs,
+            'N': condition['N'],
+            'human': (type(human).__qualname__, human.concept, human.relevance, human.intuitive_theory_params,
+                      human.inference_params, human.intuitive_theory),
+            'backend': backend,
+            'structure': get_structure(human.intuitive_theory),
+            'engine': getattr(engine, '__qualname__', None),
+            'sources': [source_of(type(human)), source_of(human.intuitive_theory), source_of(inference_util),
+                        source_of(numpy_backend), source_of(backend), source_of(engine), source_of(utils),
+                        source_of(Experiment)] + [source_of(type(elem)) for elem in options.get('tables', ())],
+            'seed': self.seed,
+            'common_random_numbers': self.common_random_numbers,
+            'batched': batched,
+            # The random streams do not depend on the condition with common random numbers
+            'index': None if self.common_random_numbers else index,
+        }
+        return specification_hash(specification)
+
+    def get_seed(self, *keys):
+        '''
+        Derive the seed of a random stream (e.g. of one participant) from the seed of the experiment
+
+        :param keys: (int) e.g. index of the condition and of the participant
+        :return: (int)
+        '''
+
+        return int(np.random.SeedSequence([self.seed, *keys]).generate_state(1)[0])
+
+    def get_stream_seed(self, index, *keys):
+        '''
+        Seed of a random stream of a condition. With common random numbers the stream does not depend on
+        the condition, i.e. participant i of every condition gets the same random numbers.
+
+        :param index: (int) index of the condition
+        :param keys: (int) e.g. index of the participant
+        :return: (int)
+        '''
+
+        if self.common_random_numbers:
+            return self.get_seed(*keys)
+        return self.get_seed(index, *keys)
+
+    def draw_values(self, index, vs, N):
+        '''
+        Draw the values of the Variables of all participants of a condition, one call per Variable.
+        The random stream is derived from the seed of the experiment and the index of the condition,
+        so every task of the condition draws the same values.
+        With common random numbers each Variable has its own stream that is shared by all conditions,
+        so a Variable that is e.g. fixed in one condition does not shift the draws of the others.
+
+        :param index: (int) index of the condition
+        :param vs: (dict) variables of the condition
+        :param N: (int) number of participants
+
+        :return: (dict) has the variable names as keys and tensors of shape (N,) as values
+        '''
+        import pyro
+
+        if self.common_random_numbers:
+            values = {}
+            for name, elem in sorted(vs.items()):
+                if isinstance(elem, Variable):
+                    # The second key separates the streams of the Variables from the ones of the participants
+                    pyro.set_rng_seed(self.get_seed(zlib.crc32(name.encode()), 0))
+                    values[name] = elem.sample_batch(N)
+            return values
+        pyro.set_rng_seed(self.get_seed(index))
+        return {name: elem.sample_batch(N) for name, elem in sorted(vs.items()) if isinstance(elem, Variable)}
+
+    def get_draws(self, index):
+        '''
+        Values of the Variables of all participants of a condition. They are drawn once per run and shared by
+        all tasks of the condition (the worker processes inherit them).
+
+        :param index: (int) index of the condition
+        :return: (dict) see draw_values
+        '''
+
+        if index not in self.draws:
+            condition = self.conditions[index]
+            self.draws[index] = self.draw_values(index, self.get_condition_variables(condition), condition['N'])
+        return self.draws[index]
+
+    def iter_participants(self, index, start, stop, batched=False, profile=False, progress=False):
+        '''
+        Simulate the participants start,...,stop-1 of a condition. Each participant has its own random stream,
+        so the result does not depend on how the participants are split up.
+
+        Yields a record for each participant, a dictionary with the keys 'participant', 'attribution',
+        'branch', 'values' (the values of the Variables) and 'seconds'. If profile is true the profiling record is
+        added under 'profile' (for a batch of participants only to the first record).
+
+        :param index: (int) index of the condition
+        :param start: (int) index of the first participant
+        :param stop: (int) index after the last participant
+        :param batched: (bool) if true all participants are simulated at once (Human.batch_inference)
+        :param profile: (bool) if true the inference of each participant is profiled
+        :param progress: (bool) show a progress bar
+        '''
+        import pyro
+
+        condition = self.conditions[index]
+        vs = self.get_condition_variables(condition)
+        draws = self.get_draws(index)
+        profiler = Profiler() if profile else None
+        if batched:
+            pyro.set_rng_seed(self.get_stream_seed(index, start))
+            self.human.profiler = profiler
+            self.human.set_variables(vs, False)
+            if profile:
+                profiler.start_participant()
+            begin = time.perf_counter()
+            attributions = self.human.batch_inference(stop - start, {name: value[start:stop] for name, value in draws.items()})
+            # The time of the batch is split evenly across its participants
+            seconds = (time.perf_counter() - begin) / max(stop - start, 1)
+            if profile:
+                profiler.end_participant(self.human.branch, stop - start)
+            self.human.profiler = None
+            values = self.human.get_sampled_values()
+            for j, attribution in enumerate(attributions):
+                record = {'participant': start + j, 'attribution': attribution, 'branch': self.human.branch[j],
+                          'values': {name: participant_value(value, j) for name, value in values.items()},
+                          'seconds': seconds}
+                if profile and j == 0:
+                    record['profile'] = profiler.records[0]
+                yield record
+            return
+
+        participants = tqdm(range(start, stop), desc=f'Condition {condition["name"]}', disable=not progress)
+        for i in participants:
+            pyro.set_rng_seed(self.get_stream_seed(index, i))
+            self.human.profiler = profiler
+            # Create a participant from the values that were drawn for it
+            for name, value in draws.items():
+                vs[name].current_value = value[i]
+            self.human.set_variables(vs, False)
+            # Do inference and save it
+            if profile:
+                profiler.start_participant()
+            begin = time.perf_counter()
+            attribution = self.human.inference()
+            seconds = time.perf_counter() - begin
+            if profile:
+                profiler.end_participant(self.human.branch)
+            self.human.profiler = None
+            record = {'participant': i, 'attribution': attribution, 'branch': self.human.branch,
+                      'values': {name: participant_value(value) for name, value in self.human.get_sampled_values().items()},
+                      'seconds': seconds}
+            if profile:
+                record['profile'] = profiler.records.pop()
+            yield record
+
+    def run_tasks(self, tasks, workers):
+        '''
+        Run the tasks serially or on a pool of processes and yield the participant records in the order of the tasks
+
+        :param tasks: (list) arguments of iter_participants
+        :param workers: (int) number of processes
+
+        :return: generator of (int) condition index, (dict) participant record
+        '''
+
+        # Draw the values of the conditions before the workers are forked
+        for index in sorted(set(task[0] for task in tasks)):
+            self.get_draws(index)
+        if workers > 1:
+            global _experiment
+            _experiment = self
+            try:
+                with multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker) as pool:
+                    outputs = tqdm(pool.imap(_run_task, tasks), total=len(tasks), desc=f'Experiment {self.name}')
+                    for task, records in zip(tasks, outputs):
+                        for record in records:
+                            yield task[0], record
+            finally:
+                # Also if the consumer stops early
+                _experiment = None
+        else:
+            for task in tasks:
+                for record in self.iter_participants(*task, progress=True):
+                    yield task[0], record
+
+    def iter_run(self, batched=False, workers=1, seed=None, profile=False, store=None, common_random_numbers=False,
+                 cache=None):
+        '''
+        Run each condition and yield the record of each participant as soon as it is produced (with several workers
+        as soon as its chunk of participants is done). The records are dictionaries with the keys
+        'condition' (name), 'condition_index', 'participant' (index), 'attribution', 'branch' (the step of
+        Human.inference), 'values' (e.g. of SA, PI and TI) and 'seconds' (simulation time, None for records that
+        are loaded from the cache). If profile is true the profiling record is added under 'profile'.
+
+        The records are streamed to the store and the finished conditions are added to the cache, see Experiment.run
+        for the arguments. Participants that are already in the store are not simulated again and not yielded.
+        '''
+
+        if store is not None and store.get_seed() is not None:
+            if seed is not None and seed != store.get_seed():
+                raise ValueError(f'The store contains a run with seed {store.get_seed()}, not {seed}')
+            if store.manifest.get('common_random_numbers', False) != common_random_numbers:
+                raise ValueError(f'The store contains a run with common_random_numbers={not common_random_numbers}')
+            seed = store.get_seed()
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.common_random_numbers = common_random_numbers
+        self.draws = {}
+        if store is not None and store.get_seed() is None:
+            store.manifest['experiment'] = self.name
+            store.manifest['common_random_numbers'] = common_random_numbers
+            store.set_seed(self.seed)
+        print(f'Experiment {self.name} starts')
+
+        # Conditions that were simulated in an earlier run are loaded from the cache
+        keys = {}
+        cached = []
+        if cache is not None:
+            from store import array_to_records
+
+            for index, elem in enumerate(self.conditions):
+                keys[index] = self.get_condition_key(index, batched)
+                array = cache.load(keys[index])
+                if array is None:
+                    continue
+                del keys[index]
+                first = store.count(elem['name']) if store is not None else 0
+                cached.extend((index, dict(record, seconds=None)) for record in array_to_records(array[first:]))
+                print(f'Condition {elem["name"]} is loaded from the cache')
+        records = {index: [] for index in keys} if store is None else {}
+
+        # Split the experiment into tasks, a batched condition is always a single task.
+        # Participants that are already in the store are skipped. The random stream of a batch depends on its
+        # first participant, so an interrupted batched condition is simulated again from the start and only its
+        # missing participants are kept, i.e. a resumed run reproduces an uninterrupted one.
+        tasks = []
+        firsts = {}
+        for index, elem in enumerate(self.conditions):
+            if cache is not None and index not in keys:
+                continue
+            first = firsts[index] = store.count(elem['name']) if store is not None else 0
+            if batched:
+                if first < elem['N']:
+                    tasks.append((index, 0, elem['N'], batched, profile))
+                continue
+            chunk = elem['N'] - first if workers == 1 else math.ceil(elem['N'] / (4 * workers))
+            for start in range(first, elem['N'], max(chunk, 1)):
+                tasks.append((index, start, min(start + chunk, elem['N']), batched, profile))
+
+        try:
+            for index, record in itertools.chain(cached, self.run_tasks(tasks, workers)):
+                if record['participant'] < firsts.get(index, 0):
+                    continue
+                name = self.conditions[index]['name']
+                if store is not None:
+                    store.append(name, record)
+                if index in records:
+                    records[index].append(record)
+                yield dict(record, condition=name, condition_index=index)
+        finally:
+            # Also write the buffered records if the consumer stops early
+            if store is not None:
+                store.flush()
+
+        # Add the simulated conditions to the cache
+        if cache is not None:
+            from store import records_to_array
+
+            for index, key in keys.items():
+                name = self.conditions[index]['name']
+                array = store.load(name) if store is not None else records_to_array(records[index])
+                if len(array) == self.conditions[index]['N']:
+                    cache.save(key, array, {'experiment': self.name, 'condition': name})
+
+    def run(self, batched=False, workers=1, seed=None, profile=False, store=None, common_random_numbers=False,
+            cache=None, online=False, sequential=None):
         '''
         Run each condition. Store the attribution results in a dictionary where the keys are the experiments names.
         The attribution results are a list of internal attribution scores.
+
+        :param batched: (bool) if true all participants of a condition are simulated at once (Human.batch_inference)
+        :param workers: (int) number of processes the participants and conditions are spread across
+        :param seed: (int) seed of the experiment, the results are the same for any number of workers.
+                           If None a random seed is drawn and stored in self.seed
+        :param profile: (bool) if true the inference is profiled, a Profiler per condition is kept in self.profiles
+        :param store: (ResultStore) if given, the record of each participant is streamed to the store instead of
+                                    being kept in memory and self.results reads the attributions from disk.
+                                    A run that was interrupted is resumed from the last written chunk.
+        :param common_random_numbers: (bool) if true participant i of every condition gets the same random numbers
+                                             (values of the Variables and particles of the inference), so differences
+                                             between conditions are paired, see Experiment.contrast
+        :param cache: (ConditionCache) if given, conditions whose specification (see get_condition_key) was
+                                       simulated before are loaded from the cache instead of being simulated, the
+                                       other conditions are added to it. Only runs with a given seed can hit.
+        :param online: (bool) if true only a running summary of the attributions of each condition is kept in
+                              self.summaries (constant memory), self.results stays empty unless a store is given.
+                              Together with a cache a store is needed.
+        :param sequential: (dict) if given, the participants are added in batches until a contrast is resolved,
+                                  the dictionary contains the arguments of Experiment.run_sequential
         '''
 
+        if sequential is not None:
+            if store is not None or cache is not None or online or profile:
+                raise ValueError('A sequential run cannot be combined with a store, a cache, online or profile')
+            return self.run_sequential(batched=batched, workers=workers, seed=seed,
+                                       common_random_numbers=common_random_numbers, **sequential)
+        if online and cache is not None and store is None:
+            # The records of a condition would be kept in memory until it can be added to the cache
+            raise ValueError('An online run with a cache needs a store')
+
         # Dictionary that stores results
-        self.results = {}
-        # Repeat for each condition
-        print(f'Experiment {self.name} starts')
-        for elem in self.conditions:
-            attributions = []
-            # set up a dictionary that contains the values of the variables in that condition
-            vs = self.variables
-            for var_name, var_value in elem.items():
-                if var_name != 'N' and var_name != 'name':
-                    vs[var_name] = var_value
-
-            # Repeat the number of participants in a condition
-            participants = tqdm(range(elem['N']),desc=f'Condition {elem["name"]}')
-            for _ in participants:
-                # Create a participant
-                self.human.set_variables(vs, True)
-                # Do inference and save it
-                attributions.append(self.human.inference())
-            # save results for that condition
-            self.results[elem['name']] = attributions
+        self.results = {elem['name']: [] for elem in self.conditions} if not online else {}
+        self.summaries = {elem['name']: RunningStats() for elem in self.conditions} if online else None
+        self.profiles = {elem['name']: Profiler() for elem in self.conditions} if profile else {}
+        if online and store is not None:
+            # Participants of an interrupted run that are already in the store are not simulated again
+            for name, summary in self.summaries.items():
+                summary.update(store.load(name)['attribution'])
+
+        # save results for each condition
+        for record in self.iter_run(batched, workers, seed, profile, store, common_random_numbers, cache):
+            if online:
+                self.summaries[record['condition']].update(record['attribution'])
+            elif store is None:
+                self.results[record['condition']].append(record['attribution'])
+            if 'profile' in record:
+                self.profiles[record['condition']].records.append(record['profile'])
+
+        if store is not None:
+            summaries = self.summaries
+            self.load_results(store)
+            # Keep the summaries of an online run
+            self.summaries = summaries
+
+    def run_sequential(self, contrast, batch_size=10, max_N=None, alpha=0.05, tolerance=None, batched=False,
+                       workers=1, seed=None, common_random_numbers=False):
+        '''
+        Add participants to all conditions in batches until the confidence interval of a contrast excludes zero,
+        is narrower than tolerance or max_N participants per condition are reached.
+
+        The type I error is controlled with an O'Brien-Fleming type alpha spending function (Lan & DeMets),
+        alpha(t) = 2 - 2 Phi(z_{1-alpha/2} / sqrt(t)) with t = n / max_N. The interval at each look has the level
+        1 - (alpha(t_k) - alpha(t_{k-1})) and uses the quantile of Student's t distribution with n - 1 degrees of
+        freedom, so by the union bound the intervals of all looks together exclude the true value with a probability
+        of at most alpha. Unless batched, participant i gets the same random numbers as in a run with max_N
+        participants per condition, i.e. the results are a prefix of that run.
+
+        :param contrast: (dict) has condition names as keys and weights as values, e.g. {'HighTI': 1, 'LowTI': -1}
+        :param batch_size: (int) number of participants that are added to each condition per look
+        :param max_N: (int) maximal number of participants per condition, by default the largest N of the conditions
+        :param alpha: (float) error probability of all looks together
+        :param tolerance: (float) the run also stops once the interval is narrower than tolerance
+        :param batched, workers, seed, common_random_numbers: see Experiment.run
+
+        :return: (dict) also kept in self.sequential, with the keys 'looks' (N, estimate, se, alpha and interval
+                        of each look), 'N' and 'reason' (why the run stopped)
+        '''
+
+        if max_N is None:
+            max_N = max(elem['N'] for elem in self.conditions)
+        weights = {name: float(value) for name, value in contrast.items()}
+        unknown = [name for name in weights if name not in [elem['name'] for elem in self.conditions]]
+        if unknown:
+            raise KeyError(f'Unknown conditions {", ".join(unknown)}')
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.common_random_numbers = common_random_numbers
+        self.results = {elem['name']: [] for elem in self.conditions}
+        self.summaries = None
+        self.profiles = {}
+        print(f'Experiment {self.name} starts sequentially')
+
+        # The values of the Variables are drawn for max_N participants, so every look draws the same ones
+        conditions = self.conditions
+        self.conditions = [dict(elem, N=max_N) for elem in conditions]
+        self.draws = {}
+        spent = 0.
+        looks = []
+        reason = 'max N'
+        n = 0
+        try:
+            while n < max_N:
+                stop = min(n + batch_size, max_N)
+                chunk = stop - n if batched or workers == 1 else math.ceil((stop - n) / workers)
+                tasks = [(index, start, min(start + chunk, stop), batched, False)
+                         for index in range(len(self.conditions)) for start in range(n, stop, chunk)]
+                for index, record in self.run_tasks(tasks, workers):
+                    self.results[self.conditions[index]['name']].append(record['attribution'])
+                n = stop
+
+                ## Spend the part of alpha of this look
+                level = obrien_fleming(alpha, n / max_N)
+                look_alpha = level - spent
+                spent = level
+                estimate, se = (float(elem) for elem in self.contrast_estimate(weights, common_random_numbers))
+                if look_alpha <= 0 or not np.isfinite(se):
+                    looks.append({'N': n, 'estimate': estimate, 'se': se, 'alpha': look_alpha, 'ci': None})
+                    continue
+                # n - 1 degrees of freedom, conservative for unpaired contrasts (Welch's are at least as many)
+                half = student_t_quantile(1 - look_alpha / 2, n - 1) * se
+                looks.append({'N': n, 'estimate': estimate, 'se': se, 'alpha': look_alpha,
+                              'ci': [estimate - half, estimate + half]})
+                if estimate - half > 0 or estimate + half < 0:
+                    reason = 'excludes zero'
+                    break
+                if tolerance is not None and 2 * half < tolerance:
+                    reason = 'tolerance'
+                    break
+        finally:
+            self.conditions = conditions
+            # The values were drawn for max_N participants
+            self.draws = {}
+        self.sequential = {'looks': looks, 'N': n, 'reason': reason}
+        print(f'Stopped after {n} participants per condition ({reason})')
+        return self.sequential
+
+    def contrast_estimate(self, weights, paired=False):
+        '''
+        Weighted sum of the mean attributions of the conditions and its standard error
+
+        :param weights: (dict) has condition names as keys and weights as values
+        :param paired: (bool) if true the weighted sum is formed per participant (common random numbers)
+
+        :return: estimate (float), se (float)
+        '''
+
+        values = [np.asarray(self.results[name], dtype=float) for name in weights]
+        w = np.array(list(weights.values()))
+        if any(len(elem) < 2 for elem in values):
+            return float('nan'), float('nan')
+        if paired:
+            scores = np.stack(values, axis=1) @ w
+            return scores.mean(), scores.std(ddof=1) / np.sqrt(len(scores))
+        estimate = sum(weight * elem.mean() for weight, elem in zip(w, values))
+        return estimate, np.sqrt(sum(weight ** 2 * elem.var(ddof=1) / len(elem) for weight, elem in zip(w, values)))
+
+    def load_results(self, store):
+        '''
+        Read the results of the conditions lazily from a ResultStore.
+        If no conditions are registered all conditions of the store are read.
+
+        :param store: (ResultStore)
+        '''
+
+        self.results = store.results([elem['name'] for elem in self.conditions] or None)
+        self.summaries = None
+
+    def get_summaries(self):
+        '''
+        :return: (dict) has the condition names as keys and RunningStats of their attributions as values,
+                        the ones of an online run or computed from self.results
+        '''
+
+        if self.summaries is not None:
+            return self.summaries
+        summaries = {}
+        for name, value in self.results.items():
+            summaries[name] = RunningStats()
+            summaries[name].update(value)
+        return summaries
+
+    def profile_report(self):
+        '''
+        Report of the profiling of the last run (see Experiment.run)
+
+        :return: (dict) has the condition names as keys and the reports of their Profilers as values
+        '''
+
+        return {name: profiler.report() for name, profiler in self.profiles.items()}
+
+    def export_profile(self, path):
+        '''
+        Save the profiling report and the records of all participants of the last run as JSON
+
+        :param path: (string)
+        '''
+
+        with open(path, 'w') as f:
+            json.dump({name: {'report': profiler.report(), 'participants': profiler.records}
+                       for name, profiler in self.profiles.items()}, f, indent=2)
+
+    def contrast(self, a, b, paired=None):
+        '''
+        Difference of the mean attributions of two conditions
+
+        :param a: (string) name of the first condition
+        :param b: (string) name of the second condition
+        :param paired: (bool) if true participant i of a is compared with participant i of b, by default
+                              true if the last run used common random numbers
+
+        :return: mean (float), se (float) of the difference a - b
+        '''
+
+        if a not in self.results or b not in self.results:
+            # Online run: only the summaries of the conditions are known
+            if paired:
+                raise ValueError('Paired contrasts need the attributions of the participants, run without online')
+            a_stats, b_stats = self.summaries[a], self.summaries[b]
+            return a_stats.mean - b_stats.mean, np.sqrt(a_stats.variance(1) / a_stats.n + b_stats.variance(1) / b_stats.n)
+        a_values = np.asarray(self.results[a], dtype=float)
+        b_values = np.asarray(self.results[b], dtype=float)
+        if paired is None:
+            paired = self.common_random_numbers
+        if paired:
+            if len(a_values) != len(b_values):
+                raise ValueError(f'Paired contrasts need the same number of participants, {a} has {len(a_values)} and {b} {len(b_values)}')
+            diff = a_values - b_values
+            return diff.mean(), diff.std(ddof=1) / np.sqrt(len(diff))
+        se = np.sqrt(a_values.var(ddof=1) / len(a_values) + b_values.var(ddof=1) / len(b_values))
+        return a_values.mean() - b_values.mean(), se
 
     def z_transform(self, attr, mean, std):
         '''
@@ -90,21 +675,29 @@ class Experiment(object):
 
         :return z-values: (dict) Has experiment names as keys and the means of the z-values as values
         '''
-        total = []
-        for l in self.results.values():
-            total += l
+        import matplotlib.pyplot as plt
 
-        # Calculate the mean and std of all values for z-transformation
-        mean = np.mean(total)
-        std = np.std(total)
+        # Calculate the mean and std of all values for z-transformation from the pooled summaries of the conditions
+        summaries = self.get_summaries()
+        pooled = RunningStats.combine(summaries.values())
+        mean = pooled.mean
+        std = pooled.std()
 
-        z_values = {name: np.mean(self.z_transform(value, mean, std)) for name, value in self.results.items()}
-        z_std = {name: np.std(self.z_transform(value, mean, std))/np.sqrt(len(value)) for name, value in self.results.items()}
+        z_values = {name: (elem.mean - mean) / std for name, elem in summaries.items()}
+        z_std = {name: elem.std() / std / np.sqrt(elem.n) for name, elem in summaries.items()}
+        lengths = set(elem.n for elem in summaries.values())
+        if self.summaries is None and self.common_random_numbers and len(lengths) == 1 and len(summaries) > 1:
+            # Paired participants: within-participant error bars (Cousineau-Morey), the variation
+            # that is common to all conditions is removed
+            z = np.stack([self.z_transform(value, mean, std) for value in self.results.values()])
+            within = z - z.mean(axis=0) + z.mean()
+            correction = np.sqrt(len(z) / (len(z) - 1))
+            z_std = {name: correction * np.std(value) / np.sqrt(len(value)) for name, value in zip(self.results, within)}
 
         # Plot or save the different values for each experimental group
         names = z_values.keys()
         means = z_values.values()
-        x = np.arange(self.n_conditions)
+        x = np.arange(len(z_values))
         plt.clf()
         plt.errorbar(x,means,yerr=z_std.values(),fmt='o')
         plt.xticks(x, names)
@@ -1,69 +1,73 @@
-
 import os
 
 from collections import OrderedDict
 
-
-
-from experiment import Experiment
-from generative_processes import intuitive_theory
-from human import Human
-from utils import Variable
 # Simulation of a number of experiments on the self-serving bias
+#
+# Importing this module is cheap, torch and pyro are only imported once an experiment is built.
+# Each experiment is set up by a builder function that is registered in the experiments dictionary,
+# see build_experiment and cli.py
 
 ####################################################################################################################
 '''
-General Setup 
+General Setup
 '''
 ####################################################################################################################
 
 
+def setup():
+    '''
+    Set up the default variables and the simulated participant that are shared by the experiments
 
-variables = {}
+    :return: human (Human), variables (dict)
+    '''
+    from generative_processes import intuitive_theory
+    from human import Human
+    from utils import Variable
 
-default = OrderedDict()
-default['mean'] = 0
-default['std'] = 1
-positive_bias = OrderedDict()
-positive_bias['mean'] = 0.5
-positive_bias['std'] = 1
-negative_bias = OrderedDict()
-negative_bias['mean'] = -0.5
-negative_bias['std'] = 1
+    variables = {}
 
-# Experimental parameters
+    default = OrderedDict()
+    default['mean'] = 0
+    default['std'] = 1
+    positive_bias = OrderedDict()
+    positive_bias['mean'] = 0.5
+    positive_bias['std'] = 1
+    negative_bias = OrderedDict()
+    negative_bias['mean'] = -0.5
+    negative_bias['std'] = 1
 
-# Task importance
-variables['TI'] = Variable(1,'TI','fixed',{'fixed':1})
+    # Experimental parameters
 
-# Controlled parameters
-variables['SA'] = Variable(0,'SA','Normal',positive_bias)
-variables['PI'] = Variable(0,'PI','Normal',negative_bias)
-variables['success'] = 0
+    # Task importance
+    variables['TI'] = Variable(1,'TI','fixed',{'fixed':1})
 
-# IT Process parameters
-variables['skill'] = Variable(1,'skill','Normal',default)
-variables['effort'] = Variable(1,'effort','Normal',default)
-variables['external'] = Variable(0,'external','Normal',default)
-variables['luck'] = Variable(0,'luck','Normal',default)
+    # Controlled parameters
+    variables['SA'] = Variable(0,'SA','Normal',positive_bias)
+    variables['PI'] = Variable(0,'PI','Normal',negative_bias)
+    variables['success'] = 0
 
-# Inferencee parameters
-variables['L']=100
-variables['f']={'mean':lambda x:x,'2ndMoment':lambda x:x**2}
+    # IT Process parameters
+    variables['skill'] = Variable(1,'skill','Normal',default)
+    variables['effort'] = Variable(1,'effort','Normal',default)
+    variables['external'] = Variable(0,'external','Normal',default)
+    variables['luck'] = Variable(0,'luck','Normal',default)
 
+    # Inferencee parameters
+    variables['L']=100
+    variables['f']={'mean':lambda x:x,'2ndMoment':lambda x:x**2}
+    # Draw all particles of an inference call in one traced execution, LW uses the NumPy version of the
+    # intuitive theory automatically where one is registered
+    variables['inference_options']={'vectorized':True}
 
-intuitive_theory_params = ['skill','effort','external','luck']
-self_concept = ['skill','effort']
-relevance = ['TI']
-inference_params = ['L']
 
-human = Human(self_concept,relevance,intuitive_theory_params,intuitive_theory,inference_params)
+    intuitive_theory_params = ['skill','effort','external','luck']
+    self_concept = ['skill','effort']
+    relevance = ['TI']
+    inference_params = ['L']
 
-# Create a directory to save the plots in
-directory = os.path.join(os.getcwd(),'plots')
-# Check whether directory exists, if not create it
-if not os.path.exists(directory):
-    os.makedirs(directory)
+    human = Human(self_concept,relevance,intuitive_theory_params,intuitive_theory,inference_params)
+    return human, variables
 
 ####################################################################################################################
 '''
@@ -72,95 +76,225 @@ DUAL PROCESS THEORY - https://psycnet.apa.org/record/2001-05824-004
 ####################################################################################################################
 
 
-
-
-ExperimentDP = Experiment('Duval & Silvia - Simulation',human,variables)
-
-condition1 = {'N':10,'name':'PI0SA0',
-              'SA':Variable(0,'SA','fixed',{'fixed':0}),
-              'PI':Variable(0,'PI','fixed',{'fixed':0}),
-              'success':0}
-condition2 = {'N':10,'name':'PI0SA1',
-              'SA':Variable(0,'SA','fixed',{'fixed':1}),
-              'PI':Variable(0,'PI','fixed',{'fixed':0}),
-              'success':0}
-condition3 = {'N':10,'name':'PI1SA0',
-              'SA':Variable(0,'SA','fixed',{'fixed':0}),
-              'PI':Variable(0,'PI','fixed',{'fixed':1}),
-              'success':0}
-condition4 = {'N':10,'name':'PI1SA1',
-              'SA':Variable(0,'SA','fixed',{'fixed':1}),
-              'PI':Variable(0,'PI','fixed',{'fixed':1}),
-              'success':0}
-
-ExperimentDP.register_condition(condition1)
-ExperimentDP.register_condition(condition2)
-ExperimentDP.register_condition(condition3)
-ExperimentDP.register_condition(condition4)
-
-ExperimentDP.run()
-directory = os.path.join(os.getcwd(),'plots')
-# Check whether directory exists, if not create it
-if not os.path.exists(directory):
-    os.makedirs(directory)
-ExperimentDP.plot_result(False,directory)
+def duval_silvia(human, variables):
+    '''
+    :param human: (Human)
+    :param variables: (dict) default variables, see setup
+    :return: (Experiment)
+    '''
+    from experiment import Experiment
+    from utils import Variable
+
+    ExperimentDP = Experiment('Duval & Silvia - Simulation',human,variables)
+
+    condition1 = {'N':10,'name':'PI0SA0',
+                  'SA':Variable(0,'SA','fixed',{'fixed':0}),
+                  'PI':Variable(0,'PI','fixed',{'fixed':0}),
+                  'success':0}
+    condition2 = {'N':10,'name':'PI0SA1',
+                  'SA':Variable(0,'SA','fixed',{'fixed':1}),
+                  'PI':Variable(0,'PI','fixed',{'fixed':0}),
+                  'success':0}
+    condition3 = {'N':10,'name':'PI1SA0',
+                  'SA':Variable(0,'SA','fixed',{'fixed':0}),
+                  'PI':Variable(0,'PI','fixed',{'fixed':1}),
+                  'success':0}
+    condition4 = {'N':10,'name':'PI1SA1',
+                  'SA':Variable(0,'SA','fixed',{'fixed':1}),
+                  'PI':Variable(0,'PI','fixed',{'fixed':1}),
+                  'success':0}
+
+    ExperimentDP.register_condition(condition1)
+    ExperimentDP.register_condition(condition2)
+    ExperimentDP.register_condition(condition3)
+    ExperimentDP.register_condition(condition4)
+    return ExperimentDP
 
 ####################################################################################################################
 '''
 Testing for a main effect of task importance as was shown in - https://journals.sagepub.com/doi/abs/10.1037/1089-2680.3.1.23
 
-Task importance should increase the self-serving-bias. 
+Task importance should increase the self-serving-bias.
 '''
 ####################################################################################################################
-condition1 = {'N':100,'name':'HighTI',
-              'TI':Variable(0,'SA','fixed',{'fixed':4}),
-              'success':0}
-condition2 = {'N':100,'name':'LowTI',
-              'TI':Variable(0,'SA','fixed',{'fixed':-1}),
-              'success':0}
 
-ExperimentTI = Experiment('Effect of Task Importance',human,variables)
 
-ExperimentTI.register_condition(condition1)
-ExperimentTI.register_condition(condition2)
+def task_importance(human, variables):
+    '''
+    :param human: (Human)
+    :param variables: (dict) default variables, see setup
+    :return: (Experiment)
+    '''
+    from experiment import Experiment
+    from utils import Variable
+
+    condition1 = {'N':100,'name':'HighTI',
+                  'TI':Variable(0,'SA','fixed',{'fixed':4}),
+                  'success':0}
+    condition2 = {'N':100,'name':'LowTI',
+                  'TI':Variable(0,'SA','fixed',{'fixed':-1}),
+                  'success':0}
 
-ExperimentTI.run()
-ExperimentTI.plot_result(False,directory)
+    ExperimentTI = Experiment('Effect of Task Importance',human,variables)
+
+    ExperimentTI.register_condition(condition1)
+    ExperimentTI.register_condition(condition2)
+    return ExperimentTI
 
 
 ####################################################################################################################
 '''
-Testing the effect of cognitive load: 
+Testing the effect of cognitive load:
 '''
 ####################################################################################################################
 
-condition1 = {'N':100,'name':'Load','SA':Variable(0,'SA','fixed',{'fixed':0}),'success':0}
-condition2 = {'N':100,'name':'No-Load','SA':Variable(0,'SA','fixed',{'fixed':1}),'success':0}
 
-ExperimentCL = Experiment('Effect of Cognitive Load',human,variables)
+def cognitive_load(human, variables):
+    '''
+    :param human: (Human)
+    :param variables: (dict) default variables, see setup
+    :return: (Experiment)
+    '''
+    from experiment import Experiment
+    from utils import Variable
+
+    condition1 = {'N':100,'name':'Load','SA':Variable(0,'SA','fixed',{'fixed':0}),'success':0}
+    condition2 = {'N':100,'name':'No-Load','SA':Variable(0,'SA','fixed',{'fixed':1}),'success':0}
 
-ExperimentCL.register_condition(condition1)
-ExperimentCL.register_condition(condition2)
+    ExperimentCL = Experiment('Effect of Cognitive Load',human,variables)
 
-ExperimentCL.run()
-ExperimentCL.plot_result(False,directory)
+    ExperimentCL.register_condition(condition1)
+    ExperimentCL.register_condition(condition2)
+    return ExperimentCL
 
 ####################################################################################################################
 '''
-Main effect of self-worth: 
+Main effect of self-worth:
 '''
 ####################################################################################################################
 
-new_experiment = Experiment('role of self-worth',human,variables)
 
-low_param = {'mean':-1,'std':1}
-high_param = {'mean':1,'std':1}
+def self_worth(human, variables):
+    '''
+    :param human: (Human)
+    :param variables: (dict) default variables, see setup
+    :return: (Experiment)
+    '''
+    from experiment import Experiment
+    from utils import Variable
+
+    new_experiment = Experiment('role of self-worth',human,variables)
 
-condition1 = {'name': 'high self-worth','N':100,'skill':Variable(1,'skill','Normal',high_param),'effort':Variable(1,'effort','Normal',high_param)}
-condition2 = {'name': 'low self-worth','N':100,'skill':Variable(1,'skill','Normal',low_param),'effort':Variable(1,'effort','Normal',low_param)}
+    low_param = {'mean':-1,'std':1}
+    high_param = {'mean':1,'std':1}
+
+    condition1 = {'name': 'high self-worth','N':100,'skill':Variable(1,'skill','Normal',high_param),'effort':Variable(1,'effort','Normal',high_param)}
+    condition2 = {'name': 'low self-worth','N':100,'skill':Variable(1,'skill','Normal',low_param),'effort':Variable(1,'effort','Normal',low_param)}
+
+    new_experiment.register_condition(condition1)
+    new_experiment.register_condition(condition2)
+    return new_experiment
+
+
+# All experiments, the keys are the names used on the command line, the values are the builder
+# functions and a short description
+experiments = OrderedDict()
+experiments['duval-silvia'] = (duval_silvia, 'Dual process theory (Duval & Silvia)')
+experiments['task-importance'] = (task_importance, 'Main effect of task importance')
+experiments['cognitive-load'] = (cognitive_load, 'Effect of cognitive load')
+experiments['self-worth'] = (self_worth, 'Main effect of self-worth')
+
+# Contrasts between the conditions of each experiment, see analysis.py. The keys of the weights are
+# condition names, the Duval & Silvia design is a 2x2 of self-awareness and probability of improvement
+contrasts = OrderedDict()
+contrasts['duval-silvia'] = OrderedDict([
+    ('SA', {'PI0SA1': 0.5, 'PI1SA1': 0.5, 'PI0SA0': -0.5, 'PI1SA0': -0.5}),
+    ('PI', {'PI1SA0': 0.5, 'PI1SA1': 0.5, 'PI0SA0': -0.5, 'PI0SA1': -0.5}),
+    ('SA x PI', {'PI1SA1': 1, 'PI1SA0': -1, 'PI0SA1': -1, 'PI0SA0': 1})])
+contrasts['task-importance'] = OrderedDict([('HighTI - LowTI', {'HighTI': 1, 'LowTI': -1})])
+contrasts['cognitive-load'] = OrderedDict([('Load - No-Load', {'Load': 1, 'No-Load': -1})])
+contrasts['self-worth'] = OrderedDict([('high - low self-worth', {'high self-worth': 1, 'low self-worth': -1})])
+
+# Strata of the restricted permutation tests of main effects (see analysis.permutation_test), the conditions are
+# only shuffled within the levels of the other factor. The interaction of duval-silvia is only bootstrapped.
+strata = {'duval-silvia': {'SA': [['PI0SA1', 'PI0SA0'], ['PI1SA1', 'PI1SA0']],
+                           'PI': [['PI1SA0', 'PI0SA0'], ['PI1SA1', 'PI0SA1']]}}
+
+
+####################################################################################################################
+'''
+Sweeps: dose-response curves instead of two hand-picked points
+'''
+####################################################################################################################
 
-new_experiment.register_condition(condition1)
-new_experiment.register_condition(condition2)
 
-new_experiment.run()
-new_experiment.plot_result(False,directory)
\ No newline at end of file
+def task_importance_sweep(human, variables, points=11, N=100):
+    '''
+    :param human: (Human)
+    :param variables: (dict) default variables, see setup
+    :param points: (int) number of points of the grid
+    :param N: (int) number of participants at each point
+    :return: (Sweep)
+    '''
+    import numpy as np
+
+    from sweep import Sweep
+
+    sweep = Sweep('Effect of Task Importance', human, variables, N, {'success': 0})
+    sweep.add_axis('TI', 'fixed', np.linspace(-1, 4, points))
+    return sweep
+
+
+def self_worth_sweep(human, variables, points=11, N=100):
+    '''
+    :param human: (Human)
+    :param variables: (dict) default variables, see setup
+    :param points: (int) number of points of the grid
+    :param N: (int) number of participants at each point
+    :return: (Sweep)
+    '''
+    import numpy as np
+
+    from sweep import Sweep
+
+    sweep = Sweep('role of self-worth', human, variables, N)
+    sweep.add_axis('skill', 'mean', np.linspace(-1, 1, points))
+    sweep.add_axis('success', None, [0, 1])
+    return sweep
+
+
+sweeps = OrderedDict()
+sweeps['task-importance'] = (task_importance_sweep, 'Mean attribution over the fixed value of TI')
+sweeps['self-worth'] = (self_worth_sweep, 'Mean attribution over the mean of skill, after failure and success')
+
+
+def build_experiment(name, human=None, variables=None):
+    '''
+    Set up one of the registered experiments
+
+    :param name: (string) key of the experiment in the experiments dictionary
+    :param human: (Human) by default the participant of setup is used
+    :param variables: (dict) by default the variables of setup are used
+
+    :return: (Experiment)
+    '''
+    if name not in experiments:
+        raise KeyError(f'Unknown experiment {name}, choose from {", ".join(experiments)}')
+    if human is None or variables is None:
+        human, variables = setup()
+    return experiments[name][0](human, variables)
+
+
+if __name__ == '__main__':
+    # Create a directory to save the plots in
+    directory = os.path.join(os.getcwd(),'plots')
+    # Check whether directory exists, if not create it
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # Seeded runs that load unchanged conditions from a cache: cog-sim run --all --seed 0 --cache cache
+    human, variables = setup()
+    for name in experiments:
+        experiment = build_experiment(name, human, variables)
+        experiment.run()
+        experiment.plot_result(False,directory)
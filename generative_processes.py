@@ -1,12 +1,44 @@
 ### Here all classes related to generative processes should be contained
+### Each generative process can have a NumPy version that is registered next to it (see numpy_backend.py)
+### and a description of its structure that specialised inference engines can use (see register_structure)
 
+import weakref
 
-import pyro
-import pyro.distributions
-
+from numpy_backend import bernoulli_logits_site
+from numpy_backend import register_backend
+from numpy_backend import variable_site
 from utils import sigmoid
 
 
+# Structures of the registered generative processes, keyed by the generative process
+structures = weakref.WeakKeyDictionary()
+
+
+def register_structure(model, structure):
+    '''
+    Register the structure of a generative process whose Variables (its arguments) have Normal distributions
+    and whose observations depend on them only linearly (see inference_util.RaoBlackwell)
+
+    :param model: (callable) generative process
+    :param structure: (dict) 'outcome': name of a Bernoulli site with success probability sigmoid(sum of the Variables),
+                             'observation' (optional): a Gaussian observation of a sum of some of the Variables,
+                                                       a dict with the name of the 'site', the names of the
+                                                       Variables in the sum ('concept') and the 'std'
+    '''
+    structures[model] = structure
+
+
+def get_structure(model):
+    '''
+    :param model: (callable) generative process
+    :return: (dict) the registered structure, None if there is none
+    '''
+    try:
+        return structures.get(model)
+    except TypeError:
+        return None
+
+
 def intuitive_theory(Skill, Effort, External, Luck):
     '''
 
@@ -17,6 +49,9 @@ def intuitive_theory(Skill, Effort, External, Luck):
 
     :return: A dictionary of the sampled values, keys are variable names, values are the sampled values.
     '''
+    import pyro
+    import pyro.distributions
+
     # Sample skill
     skill = pyro.sample(Skill.name, Skill.return_dist())
     # Sample Effort
@@ -31,4 +66,25 @@ def intuitive_theory(Skill, Effort, External, Luck):
     success = pyro.sample('success', pyro.distributions.Bernoulli(success_prob))
     # Create a dictionary with a the sampled variables
     dic = {Skill.name: skill, Effort.name: effort, External.name: external, Luck.name: luck, 'success': success}
-    return dic
\ No newline at end of file
+    return dic
+
+
+def intuitive_theory_numpy(trace, Skill, Effort, External, Luck):
+    '''
+    NumPy version of intuitive_theory
+
+    :param trace: (NumpyTrace)
+
+    :return: A dictionary of the sampled values, keys are variable names, values are the sampled values.
+    '''
+    skill = trace.sample(Skill.name, variable_site(Skill))
+    effort = trace.sample(Effort.name, variable_site(Effort))
+    external = trace.sample(External.name, variable_site(External))
+    luck = trace.sample(Luck.name, variable_site(Luck))
+    # Success probability is the sigmoid of the sum
+    success = trace.sample('success', bernoulli_logits_site(skill + effort + external + luck))
+    return {Skill.name: skill, Effort.name: effort, External.name: external, Luck.name: luck, 'success': success}
+
+
+register_backend(intuitive_theory, intuitive_theory_numpy)
+register_structure(intuitive_theory, {'outcome': 'success'})
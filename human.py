@@ -1,9 +1,12 @@
 # Classes that help set up a participant
+# torch and pyro are only imported once a participant does inference
 
-import pyro
-
+from generative_processes import get_structure
+from generative_processes import register_structure
 from utils import Variable
-from inference_util import LW
+from numpy_backend import get_backend
+from numpy_backend import normal_site
+from numpy_backend import register_backend
 
 
 class Human(object):
@@ -14,7 +17,8 @@ class Human(object):
     with the participant.
     '''
 
-    def __init__(self, self_concept, relevance, intuitive_theory_params, intuitive_theory, inference_params):
+    def __init__(self, self_concept, relevance, intuitive_theory_params, intuitive_theory, inference_params, cache=None,
+                 profiler=None):
         '''
 
         :param self_concept: (list) names of variables that describe the self.
@@ -22,28 +26,49 @@ class Human(object):
         :param intuitive_theory_params: (list)
         :param intuitive_theory: (callable) generative process
         :param inference_params: (list) names of variables that describe the inference procedure
+        :param cache: (InferenceCache) if given, the automatic inference (Step 2) is looked up in the cache
+        :param profiler: (Profiler) if given, statistics of the inference calls are recorded
         '''
         self.concept = self_concept
         self.relevance = relevance
         self.intuitive_theory = intuitive_theory
         self.intuitive_theory_params = intuitive_theory_params
         self.inference_params = inference_params
+        self.cache = cache
+        self.profiler = profiler
+        # Step of the process model in which the last attribution was made
+        self.branch = None
+        # Values that were drawn per participant in the last batch of participants
+        self.batch_values = {}
 
     def set_variables(self, variables, sample):
         '''
         Sets the variables for the current condition the human is in
 
         :param variables: (dict) contains all the variables that describe an experimental condition
-        :param sample: (bool) whether the variables should be sampled
+        :param sample: (bool) whether the variables should be sampled, i.e. whether a new participant is drawn.
+                              If false the current values of the Variables are used.
         '''
 
         self.variables = variables
         if sample:
-            for elem in self.variables:
+            for elem in self.variables.values():
                 if isinstance(elem, Variable):
                     elem.sample()
 
 
+    def get_sampled_values(self):
+        '''
+        Values of the Variables of the last participant. After batch_inference the values that
+        were drawn per participant are tensors with one entry per participant.
+
+        :return: (dict) has the variable names as keys
+        '''
+
+        values = {name: elem.get_current_value() for name, elem in self.variables.items() if isinstance(elem, Variable)}
+        values.update(self.batch_values)
+        return values
+
     def get_inference_params(self):
         '''
         Returns a list of the variables that specify the inference procedure of the condition
@@ -53,6 +78,24 @@ class Human(object):
 
         return [self.variables[elem] for elem in self.inference_params]
 
+    def get_inference_class(self, model, **kwargs):
+        '''
+        Creates the inference class for a generative process. Options of the inference class
+        (e.g. vectorized) are taken from the 'inference_options' entry of the variables, its 'engine'
+        entry selects the inference class (see inference_util.engines, default 'LW').
+
+        :param model: (callable) generative process
+        :param kwargs: options that overwrite the ones of the variables
+        :return: (LW)
+        '''
+        from inference_util import engines
+
+        options = dict(self.variables.get('inference_options', {}))
+        engine = engines[options.pop('engine', 'LW')]
+        options['profiler'] = self.profiler
+        options.update(kwargs)
+        return engine(model, self.variables['f'], **options)
+
     def get_intuitive_theory_params(self):
         '''
         A list of variables that are part of the intuitive theory
@@ -94,6 +137,9 @@ class Human(object):
         '''
 
         def new_it(*args):
+            import pyro
+            import pyro.distributions
+
             # Run the initial intuitive theory
             sampled_var = self.intuitive_theory(*args)
             mean = 0
@@ -103,6 +149,26 @@ class Human(object):
             self.worth = pyro.sample('self-worth', pyro.distributions.Normal(mean, 1))
             return self.worth
 
+        # Extend the NumPy version of the intuitive theory in the same way
+        backend = get_backend(self.intuitive_theory)
+        if backend is not None:
+            def new_it_numpy(trace, *args):
+                sampled_var = backend(trace, *args)
+                mean = 0
+                for elem in self.concept:
+                    mean += sampled_var[elem]
+                return trace.sample('self-worth', normal_site(mean, 1))
+            register_backend(new_it, new_it_numpy)
+
+        # The self-worth is a Gaussian observation of the sum of the self-concept
+        structure = get_structure(self.intuitive_theory)
+        if structure is not None and 'observation' not in structure:
+            register_structure(new_it, dict(structure, observation={'site': 'self-worth', 'concept': list(self.concept),
+                                                                    'std': 1.}))
+
+        # The extended intuitive theory is identified by the theory and the self-concept, see inference_util.model_key
+        new_it.specification = {'intuitive_theory': self.intuitive_theory, 'concept': list(self.concept)}
+
         # return the extended intuitive theory
         return new_it
 
@@ -122,6 +188,19 @@ class Human(object):
         return diff
 
 
+    def shift(self, prior, post, internal):
+        '''
+        Summed absolute change of the means of the internal or external variables of the intuitive theory.
+
+        :param prior: (dict) for each unobserved variable of the intuitive theory contains estimates
+        :param post: (dict) for each unobserved variable of the intuitive theory contains estimates
+        :param internal: (0/1) whether the internal or the external variables are summed up
+
+        :return: (float/tensor)
+        '''
+
+        return sum([abs(post[elem.name]['mean'] - prior[elem.name]['mean']) for elem in self.get_intuitive_theory_params() if elem.internal == internal])
+
     def do_attribution(self, prior, post, alpha, beta):
         '''
         Given prior and posterior means of the unobserved variables, determine the difference and weight it
@@ -135,9 +214,7 @@ class Human(object):
         :return: (float) Rating by how much the outcome is attributed internally
         '''
 
-        internal = sum([abs(post[elem.name]['mean'] - prior[elem.name]['mean']) for elem in self.get_intuitive_theory_params() if elem.internal == 1])
-        external = sum([abs(post[elem.name]['mean'] - prior[elem.name]['mean']) for elem in self.get_intuitive_theory_params() if elem.internal == 0])
-        attr = alpha * internal - beta * external
+        attr = alpha * self.shift(prior, post, 1) - beta * self.shift(prior, post, 0)
         return attr.item()
 
     def do_attribution_internal(self, prior, post, alpha):
@@ -145,8 +222,7 @@ class Human(object):
         Does the same as do_attribution but ignores the external variables
         '''
 
-        internal = sum([abs(post[elem.name]['mean'] - prior[elem.name]['mean']) for elem in self.get_intuitive_theory_params() if elem.internal == 1])
-        attr = alpha * internal
+        attr = alpha * self.shift(prior, post, 1)
         return attr.item()
 
 
@@ -171,12 +247,15 @@ class Human(object):
                 If prob. of improv. is low:
                     Step 9. Do attribution based on inference with fixed self-worth
 
+        The step in which the attribution is made (4, 6, 8 or 9) is kept in self.branch.
+
         :return: A value that quantifies how strong the internal attribution is
         '''
 
         ## Step 1:  Observe the outcome
 
         obs = {'success': self.variables['success']}
+        self.batch_values = {}
 
         ## Step 2:  Perform inference only letting the internal variables vary ##
 
@@ -188,17 +267,20 @@ class Human(object):
                 obs[elem.name] = prior[elem.name]['mean']
 
         # Create the LW-inference class
-        inference_class = LW(self.intuitive_theory, self.variables['f'])
-        estimates, logW_sum = inference_class.inferLW(*self.get_inference_params(), obs, *self.get_intuitive_theory_params())
+        inference_class = self.get_inference_class(self.intuitive_theory)
+        if self.cache is not None:
+            estimates, logW_sum = self.cache.inferLW(inference_class, *self.get_inference_params(), obs, *self.get_intuitive_theory_params())
+        else:
+            estimates, logW_sum = inference_class.inferLW(*self.get_inference_params(), obs, *self.get_intuitive_theory_params())
 
         # Extract results
         post = {elem.name: estimates[elem.name] for elem in self.get_intuitive_theory_params()}
 
         ## Step 3: Check whether self-awareness is high
 
-        self.variables['SA'].sample()
         if not (self.variables['SA'] > 0):
             ## Step 4: Low self-awareness uses the results from automatic inference to do attribution
+            self.branch = 4
             return self.do_attribution_internal(prior, post, 1)
         else:
             ## Step 5: Determine discrepancy between inferred values and self-concept
@@ -211,25 +293,134 @@ class Human(object):
 
             if diff >= 0:
                 ## Step 6: Attirbution based on automatic inference with focus on internal variables
+                self.branch = 6
                 return self.do_attribution_internal(prior, post, 1 + diff)
             else:
                 ## Step 7 Determine the probability of improvement
-                self.variables['PI'].sample()
                 if self.variables['PI'] > 0:
                     ## Step 8: Do attribution on automatic inference
+                    self.branch = 8
                     return self.do_attribution_internal(prior, post, 1)
                 else:
                     ## Step 9: Do attribution based on inference with fixed self-worth
+                    self.branch = 9
 
-                    # Determine self-worth before the event happened
-                    self_worth = self.get_self_worth(prior)
-                    # Extend the intutive theory to contain self-worth
-                    self_worth_model = self.decorate_self_worth()
-                    # Condition the model on self_worth and do inference
-                    obs = {'self-worth': self_worth, 'success': self.variables['success']}
-                    inference_class = LW(self_worth_model, self.variables['f'])
-                    estimates, logW_sum = inference_class.inferLW (*self.get_inference_params(), obs, *self.get_intuitive_theory_params())
-                    # Get values after conditioning
-                    post = {elem.name: estimates[elem.name] for elem in self.get_intuitive_theory_params()}
+                    post = self.infer_self_worth(prior, inference_class.samples)
                     # Do attribution
-                    return self.do_attribution(prior, post, 1, 1 + abs(diff))
\ No newline at end of file
+                    return self.do_attribution(prior, post, 1, 1 + abs(diff))
+
+    def infer_self_worth(self, prior, samples=None, batch_size=None):
+        '''
+        Inference with the intuitive theory extended by the self-worth, which is conditioned on the
+        self-worth before the event happened (Step 9).
+
+        If the variables contain a 'reuse_threshold', the particles of the automatic inference (Step 2)
+        are reweighted instead of drawing new ones. New particles are only drawn if the effective sample
+        size of the reweighted particles drops below reuse_threshold * number of particles. Engines that do
+        not reuse particles (e.g. quadrature, see LW.reuses_particles) always do a new inference.
+
+        :param prior: (dict) contains the parameters of the variables of the intuitive theory
+        :param samples: (dict) particles of the automatic inference
+        :param batch_size: (int) number of participants that are inferred at once
+
+        :return: (dict) contains estimates of the variables of the intuitive theory after inference
+        '''
+
+        # Determine self-worth before the event happened
+        self_worth = self.get_self_worth(prior)
+        # Extend the intutive theory to contain self-worth
+        self_worth_model = self.decorate_self_worth()
+        # Condition the model on self_worth and do inference
+        obs = {'self-worth': self_worth, 'success': self.variables['success']}
+        inference_class = self.get_inference_class(self_worth_model, batch_size=batch_size)
+
+        threshold = self.variables.get('reuse_threshold')
+        if samples is not None and threshold is not None and inference_class.reuses_particles:
+            estimates, logW_sum = inference_class.reweight(samples, obs, *self.get_intuitive_theory_params())
+            low = inference_class.ess < threshold * inference_class.weights.shape[-1]
+            if low.any() and batch_size is not None:
+                # Draw new particles only for the participants whose particles degenerated
+                index = low.nonzero().squeeze(-1)
+                fresh_class = self.get_inference_class(self_worth_model, batch_size=len(index))
+                fresh, logW_sum = fresh_class.inferLW(*self.get_inference_params(), obs, *self.get_intuitive_theory_params())
+                for key in fresh:
+                    for name in fresh[key]:
+                        estimates[key][name][index] = fresh[key][name]
+            elif low.any():
+                estimates, logW_sum = inference_class.inferLW(*self.get_inference_params(), obs, *self.get_intuitive_theory_params())
+        else:
+            estimates, logW_sum = inference_class.inferLW(*self.get_inference_params(), obs, *self.get_intuitive_theory_params())
+
+        # Get values after conditioning
+        return {elem.name: estimates[elem.name] for elem in self.get_intuitive_theory_params()}
+
+    def batch_inference(self, N, values=None):
+        '''
+        Runs the process model of inference for N participants of the same condition at once.
+        Every inference call works on a participants x particles tensor, the branches of the
+        process model (Steps 3-9) are selected per participant with masks. The step in which
+        each participant made the attribution is kept in self.branch.
+
+        :param N: (int) number of participants
+        :param values: (dict) values of Variables (e.g. SA, PI, TI) that were drawn for each participant,
+                              tensors of shape (N,). The ones that are missing are drawn here.
+
+        :return: (list) for each participant a value that quantifies how strong the internal attribution is
+        '''
+        import torch
+
+        ## Step 1:  Observe the outcome
+
+        obs = {'success': self.variables['success']}
+
+        ## Step 2:  Perform inference only letting the internal variables vary ##
+
+        prior = {elem.name: elem.param for elem in self.get_intuitive_theory_params()}
+        for elem in self.get_intuitive_theory_params():
+            if elem.internal == 0:
+                obs[elem.name] = prior[elem.name]['mean']
+
+        inference_class = self.get_inference_class(self.intuitive_theory, batch_size=N)
+        estimates, logW_sum = inference_class.inferLW(*self.get_inference_params(), obs, *self.get_intuitive_theory_params())
+        post = {elem.name: estimates[elem.name] for elem in self.get_intuitive_theory_params()}
+
+        # Values of the Variables of each participant
+        values = dict(values or {})
+        for elem in ['SA', 'PI'] + self.relevance:
+            if elem not in values:
+                values[elem] = self.variables[elem].sample_batch(N)
+        self.batch_values = values
+
+        ## Step 3: Self-awareness of each participant
+
+        high_sa = values['SA'] > 0
+
+        ## Step 5: Discrepancy weighted by task-relevance
+
+        relevance = sum([values[elem] for elem in self.relevance])
+        diff = relevance * self.discrepancy(prior, post)
+
+        ## Step 7: Probability of improvement of each participant
+
+        high_pi = values['PI'] > 0
+
+        # Step 6 puts a higher weight on the internal attribution, Steps 4 and 8 use the automatic inference
+        alpha = torch.where(high_sa & (diff >= 0), 1 + diff, torch.ones_like(diff))
+        attr = alpha * self.shift(prior, post, 1)
+
+        ## Step 9: Inference with fixed self-worth for the participants that end up there
+
+        step9 = high_sa & (diff < 0) & ~high_pi
+        # Step in which the attribution of each participant is made
+        self.branch = torch.where(~high_sa, 4, torch.where(diff >= 0, 6, torch.where(high_pi, 8, 9))).tolist()
+        index = step9.nonzero().squeeze(-1)
+        if len(index) > 0:
+            # Engines without particles (e.g. the 'table' engine) leave samples empty
+            samples = None
+            if inference_class.samples is not None:
+                samples = {key: value[index] for key, value in inference_class.samples.items()}
+            post = self.infer_self_worth(prior, samples, batch_size=len(index))
+            attr[index] = self.shift(prior, post, 1) - (1 + abs(diff[index])) * self.shift(prior, post, 0)
+
+        return attr.tolist()
+
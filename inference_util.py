@@ -1,11 +1,82 @@
 ### All classes that are necessary to perform inference
 
 from collections import defaultdict
+from collections import OrderedDict
+from contextlib import ExitStack
+from functools import lru_cache
+import itertools
+import time
+import warnings
+import zlib
+
 import numpy as np
 import pyro.distributions
+from pyro.distributions.transforms import biject_to
 import pyro.poutine as poutine
+from pyro.poutine.messenger import Messenger
+import pyro.util
 import torch
 
+from generative_processes import get_structure
+from numpy_backend import get_backend
+from numpy_backend import NumpyTrace
+from profiling import stage
+from utils import Variable
+
+
+# Number of coordinates of the Sobol sequence in the quasi-Monte Carlo mode,
+# unobserved sites beyond that are sampled as usual
+QMC_DIMENSION = 32
+
+# Smallest number of nodes per unobserved site of the quadrature rule. With fewer nodes the rule is biased
+# (e.g. with 3 nodes the mean attribution of PI0SA1 of duval-silvia is -1.02 instead of -0.944), and a
+# deterministic bias does not average out over the participants.
+QUADRATURE_MIN_NODES = 8
+
+
+class QMCMessenger(Messenger):
+    '''
+    Replaces the sampling of the unobserved sites of a model by randomised quasi-Monte Carlo points.
+
+    The k-th unobserved site of an execution takes the k-th coordinate of a scrambled Sobol sequence
+    (one point per particle) pushed through the inverse CDF of its distribution. In the batched mode each
+    copy of the problem gets its own random digital shift (XOR) of the points, which keeps their
+    low-discrepancy structure at the cost of a single scrambled sequence. Sites whose distribution has no inverse
+    CDF (e.g. Bernoulli) are sampled as usual. The scrambling is drawn from the torch random stream,
+    so pyro.set_rng_seed makes the points reproducible.
+    '''
+
+    def __init__(self, shape, dimension=QMC_DIMENSION):
+        '''
+        :param shape: (tuple) (L,) or (batch_size, L)
+        :param dimension: (int) number of coordinates of the Sobol sequence
+        '''
+
+        super().__init__()
+        dtype = torch.get_default_dtype()
+        engine = torch.quasirandom.SobolEngine(dimension, scramble=True, seed=int(torch.randint(2 ** 31 - 1, ())))
+        # The points as 32-bit integers, the digital shift of a copy is a XOR with random bits
+        points = (engine.draw(shape[-1], dtype=torch.float64) * 2 ** 32).long()
+        if len(shape) == 2:
+            points = points ^ torch.randint(0, 2 ** 32, (shape[0], 1, dimension))
+        points = ((points.double() + 0.5) / 2 ** 32).to(dtype)
+        # The inverse CDF is infinite at 0 and 1
+        eps = torch.finfo(dtype).eps
+        self.points = points.clamp(eps, 1 - eps)
+        self.dimension = dimension
+        self.coordinate = 0
+
+    def _pyro_sample(self, msg):
+        if msg['is_observed'] or msg['value'] is not None or self.coordinate >= self.dimension:
+            return
+        if msg['fn'].event_shape:
+            return
+        try:
+            value = msg['fn'].icdf(self.points[..., self.coordinate])
+        except NotImplementedError:
+            return
+        self.coordinate += 1
+        msg['value'] = value
 
 
 class LW(object):
@@ -15,16 +86,152 @@ class LW(object):
     The model is a probability distribution p(X,Y), where X are the unobservable variables
     and Y are the observable variables. Given observations Y the goal is to estimate
     E[f(X)], where the expectation is taken over p(X|Y).
+
+    After each call of inferLW the normalised weights and the sampled values of the unobserved
+    variables are kept as contiguous tensors in self.weights and self.samples, the effective sample
+    size of the weights is kept in self.ess.
     '''
 
-    def __init__(self, model, f={}):
+    # Whether reweight reuses the particles of an earlier call. Engines whose reweight does a new inference
+    # (e.g. a deterministic rule) set it to False, the reuse of Human.infer_self_worth then skips them.
+    reuses_particles = True
+
+    def __init__(self, model, f={}, vectorized=None, batch_size=None, adaptive=None, profiler=None, fast_backend=None,
+                 qmc=False):
         '''
         :param model: (callable) a stochastic generative process that contains named sample statements
         :param f: (dict) a dictionary containing functions for which the expectation should be determined
+        :param vectorized: (bool) if true all particles are drawn in a single traced execution of the model
+                                  inside a pyro.plate. The model has to broadcast over the particle dimension.
+                                  Explicitly false draws the particles one by one with pyro.
+        :param batch_size: (int) if given, inference is done for batch_size independent copies of the problem
+                                 at once (e.g. one per participant). Implies vectorized. The estimates are then
+                                 tensors of shape (batch_size,).
+        :param adaptive: (dict) if given, particles are drawn in chunks of L until one of the targets is reached:
+                                'ess': effective sample size,
+                                'se': Monte Carlo standard error of every estimate,
+                                'max': maximal number of particles (default 100 * L).
+                                The number of particles that was used is kept in self.n_particles.
+        :param profiler: (Profiler) if given, the time spent in each stage of an inference call is recorded
+        :param fast_backend: (bool) if true and a NumPy version of the model is registered (see numpy_backend.py),
+                                    the particles are drawn with the NumPy version instead of with pyro. By default
+                                    it is used automatically, unless vectorized is explicitly false. False opts out.
+        :param qmc: (bool) if true the continuous unobserved variables are drawn with randomised quasi-Monte Carlo
+                           (see QMCMessenger) instead of pseudo-random numbers. Implies vectorized, the NumPy
+                           version of the model is not used.
         '''
 
         self.model = model
         self.f = f
+        self.qmc = qmc
+        self.vectorized = bool(vectorized) or batch_size is not None or qmc
+        self.batch_size = batch_size
+        self.adaptive = adaptive
+        self.profiler = profiler
+        self.fast_backend = vectorized is not False if fast_backend is None else fast_backend
+        self.times = defaultdict(float)
+        self.n_particles = None
+        self.weights = None
+        self.samples = None
+        self.ess = None
+
+    def draw_sequential(self, cond_model, L, *args, **kwargs):
+        '''
+        Draw the particles one at a time, each one in its own traced execution of the model.
+
+        :param cond_model: (callable) the model conditioned on the observations
+        :param L: (int) Number of samples
+
+        :return: logWs (tensor of shape (L,)), samples (dict of tensors of shape (L,))
+        '''
+
+        # collect the sum of the log-probabilities of the observables by executing the conditioned model
+        logWs = []
+        # collect sampled values of the unobserved variables
+        samples = defaultdict(list)
+
+        for _ in range(L):
+            # Run the conditioned model and construct the directed graphical model
+            with self.stage('trace'):
+                trace_DS = poutine.trace(cond_model).get_trace(*args, **kwargs)
+            # Determine the log-probability of each sampled value
+            with self.stage('log_prob'):
+                trace_DS.log_prob_sum()
+            # Get the observational nodes from the data structure
+            obs_nodes = trace_DS.observation_nodes
+            # For each observational node extract the log-probabilities of the sampled values
+            # Sum those values up to obtain the log-probability of the observed values
+            logWs.append(torch.as_tensor(sum([trace_DS.nodes[elem]['log_prob_sum'] for elem in obs_nodes])))
+            # Add the sampled values for each unobserved variable to a list
+            __ = [samples[elem].append(trace_DS.nodes[elem]['value']) for elem in trace_DS.stochastic_nodes]
+
+        return torch.stack(logWs), {key: torch.stack(value) for key, value in samples.items()}
+
+    def draw_vectorized(self, cond_model, L, *args, weight_sites=None, **kwargs):
+        '''
+        Draw all particles in one traced execution of the model. The particles live in the
+        rightmost batch dimension, which is declared by a pyro.plate. If a batch size is set, the
+        independent copies of the problem live in the dimension left of it.
+
+        :param cond_model: (callable) the model conditioned on the observations
+        :param L: (int) Number of samples
+        :param weight_sites: (iterable) names of the sites whose log-probabilities make up the weights.
+                                        By default these are all observed sites.
+
+        :return: logWs (tensor of shape (L,) or (batch_size, L)), samples (dict of tensors of the same shape)
+        '''
+
+        shape = (L,) if self.batch_size is None else (self.batch_size, L)
+        messenger = self.get_messenger(shape)
+        with ExitStack() as stack:
+            stack.enter_context(self.stage('trace'))
+            if self.batch_size is not None:
+                stack.enter_context(pyro.plate('batch', self.batch_size, dim=-2))
+            stack.enter_context(pyro.plate('particles', L, dim=-1))
+            if messenger is not None:
+                stack.enter_context(messenger)
+            trace_DS = poutine.trace(cond_model).get_trace(*args, **kwargs)
+        # Log-probabilities per particle, i.e. without summing over the plates
+        with self.stage('log_prob'):
+            trace_DS.compute_log_prob()
+        if weight_sites is None:
+            weight_sites = trace_DS.observation_nodes
+        weight_sites = [elem for elem in weight_sites if elem in trace_DS.nodes]
+        logWs = sum([trace_DS.nodes[elem]['log_prob'] for elem in weight_sites])
+        logWs = torch.as_tensor(logWs).expand(shape)
+        samples = {elem: torch.as_tensor(site['value']).expand(shape) for elem, site in trace_DS.nodes.items()
+                   if site['type'] == 'sample' and elem not in weight_sites}
+        return logWs, samples
+
+    def get_messenger(self, shape):
+        '''
+        :param shape: (tuple) (L,) or (batch_size, L)
+        :return: (Messenger) that sets the values of the unobserved sites in draw_vectorized, None if they are sampled
+        '''
+
+        return QMCMessenger(shape) if self.qmc else None
+
+    def draw_numpy(self, backend, observation, L, *args, weight_sites=None, **kwargs):
+        '''
+        Draw all particles at once with the registered NumPy version of the model.
+
+        :param backend: (callable) NumPy version of the model
+        :param observation: (dict) dictionary that contains the obs. The keys are the sample-names
+        :param L: (int) Number of samples
+        :param weight_sites: (iterable) names of the sites whose log-probabilities make up the weights.
+                                        By default these are all observed sites.
+
+        :return: logWs (tensor of shape (L,) or (batch_size, L)), samples (dict of tensors of the same shape)
+        '''
+
+        shape = (L,) if self.batch_size is None else (self.batch_size, L)
+        with self.stage('trace'):
+            trace = NumpyTrace(shape, {key: np.asarray(value) for key, value in observation.items()})
+            backend(trace, *args, **kwargs)
+        with self.stage('log_prob'):
+            logWs, samples = trace.get_weights(weight_sites)
+        dtype = torch.get_default_dtype()
+        return torch.tensor(logWs, dtype=dtype), {key: torch.tensor(value, dtype=dtype) for key, value in samples.items()}
 
     def inferLW(self, L, observation, *args, **kwargs):
         '''
@@ -43,40 +250,847 @@ class LW(object):
 
         '''
 
-        # Condition the model on the given observations
+        start = self.start()
+        # Condition the model on the given observations, distributions only accept tensors as values
+        observation = {key: torch.as_tensor(value, dtype=torch.get_default_dtype())
+                       for key, value in observation.items()}
         cond_model = pyro.condition(self.model, data=observation)
-        # collect the sum of the log-probabilities of the observables by executing the conditioned model
-        logWs = []
+        logWs, samples = self.draw(cond_model, observation, L, *args, **kwargs)
+        if self.adaptive is not None:
+            # Draw further chunks of particles until the estimates are precise enough
+            while not self.converged(logWs, samples, L):
+                new_logWs, new_samples = self.draw(cond_model, observation, L, *args, **kwargs)
+                logWs = torch.cat([logWs, new_logWs], -1)
+                samples = {key: torch.cat([value, new_samples[key]], -1) for key, value in samples.items()}
+        with self.stage('aggregation'):
+            result = self.estimate(logWs, samples)
+        self.record('inferLW', start)
+        return result
+
+    def stage(self, name):
+        '''
+        Context manager that times a stage of an inference call if a profiler is registered
+
+        :param name: (string) name of the stage
+        '''
+
+        return stage(self.profiler, self.times, name)
+
+    def start(self):
+        '''
+        Reset the stage times at the start of an inference call
+
+        :return: (float) start time if a profiler is registered
+        '''
+
+        if self.profiler is None:
+            return None
+        self.times = defaultdict(float)
+        return time.perf_counter()
+
+    def record(self, kind, start):
+        '''
+        Pass the statistics of an inference call to the profiler
+
+        :param kind: (string) type of the inference call
+        :param start: (float) start time of the call
+        '''
+
+        if self.profiler is None:
+            return
+        self.profiler.record_call({'kind': kind, 'model': getattr(self.model, '__name__', repr(self.model)),
+                                   'seconds': time.perf_counter() - start, 'stages': dict(self.times),
+                                   'n_particles': self.n_particles, 'ess': self.ess.mean().item(),
+                                   'min ess': self.ess.min().item()})
+
+    def get_backend(self):
+        '''
+        :return: (callable) the registered NumPy version of the model if it should be used, otherwise None
+        '''
+
+        if not self.fast_backend or self.qmc:
+            return None
+        return get_backend(self.model)
+
+    def draw(self, cond_model, observation, L, *args, **kwargs):
+        '''
+        Draw L particles with the NumPy version of the model if there is one, otherwise either
+        in one traced execution or one by one
+
+        :return: logWs (tensor), samples (dict of tensors)
+        '''
+
+        backend = self.get_backend()
+        if backend is not None:
+            try:
+                return self.draw_numpy(backend, observation, L, *args, **kwargs)
+            except NotImplementedError:
+                # e.g. a distribution that has no NumPy version
+                pass
+        if self.vectorized:
+            return self.draw_vectorized(cond_model, L, *args, **kwargs)
+        return self.draw_sequential(cond_model, L, *args, **kwargs)
+
+    def converged(self, logWs, samples, L):
+        '''
+        Check whether the particles drawn so far reach one of the targets of the adaptive mode.
+        In the batched mode the target has to be reached for every copy of the problem.
+
+        :param logWs: (tensor) log-likelihood of the observations for each particle
+        :param samples: (dict) sampled values of the unobserved variables for each particle
+        :param L: (int) number of particles in a chunk
+
+        :return: (bool)
+        '''
+
+        if logWs.shape[-1] >= self.adaptive.get('max', 100 * L):
+            return True
+        weights = torch.softmax(logWs, -1)
+        if 'ess' in self.adaptive and (1 / (weights ** 2).sum(-1)).min() >= self.adaptive['ess']:
+            return True
+        if 'se' in self.adaptive:
+            # Standard error of a self-normalised importance sampling estimate
+            se = [((weights * (elem(value) - (elem(value) * weights).sum(-1, keepdim=True))) ** 2).sum(-1).sqrt().max()
+                  for value in samples.values() for elem in self.f.values()]
+            if max(se, default=0) <= self.adaptive['se']:
+                return True
+        return False
+
+    def reweight(self, samples, observation, *args, **kwargs):
+        '''
+        Reuse the particles of an earlier inference call for new observations. The values in samples are kept,
+        all other unobserved variables are drawn from the prior (pseudo-randomly, also in the quasi-Monte Carlo
+        mode) and each particle is weighted with the likelihood of the new observations. This is valid as long
+        as the samples were drawn from the prior, as they are in likelihood weighting. The particles are drawn
+        in one traced execution, i.e. the model has to broadcast over the particle dimension.
+
+        :param samples: (dict) tensors of sampled values, e.g. self.samples of an earlier call
+        :param observation: (dict) dictionary that contains the obs. The keys are the sample-names
+        :param args: arguments to evaluate the model
+        :param kwargs: key-word arguments to evaluate the model
+
+        :return: estimates (dictionary), logW_sum (float)
+        '''
+
+        start = self.start()
+        observation = {key: torch.as_tensor(value, dtype=torch.get_default_dtype())
+                       for key, value in observation.items()}
+        L = next(iter(samples.values())).shape[-1]
+        data = {**samples, **observation}
+        # The kept values took the first coordinates of the quasi-Monte Carlo points, giving the other sites
+        # the same coordinates would couple them to the kept values, so these are drawn pseudo-randomly
+        qmc, self.qmc = self.qmc, False
+        try:
+            backend = self.get_backend()
+            if backend is None:
+                raise NotImplementedError()
+            logWs, samples = self.draw_numpy(backend, data, L, *args, weight_sites=list(observation), **kwargs)
+        except NotImplementedError:
+            cond_model = pyro.condition(self.model, data=data)
+            logWs, samples = self.draw_vectorized(cond_model, L, *args, weight_sites=list(observation), **kwargs)
+        finally:
+            self.qmc = qmc
+        with self.stage('aggregation'):
+            result = self.estimate(logWs, samples)
+        self.record('reweight', start)
+        return result
+
+    def estimate(self, logWs, samples):
+        '''
+        Turn the log-likelihoods of the particles into normalised weights and determine the estimates
+        of the expectations for each function f registered with the class.
+
+        :param logWs: (tensor) log-likelihood of the observations for each particle
+        :param samples: (dict) sampled values of the unobserved variables for each particle
+
+        :return: estimates (dictionary), logW_sum (float)
+        '''
+
         # E[f(X)] is saved in estimates for each unobserved variable
         estimates = defaultdict(dict)
-        # collect sampled values of the unobserved variables
-        samples = defaultdict(list)
+        # Compute likelihood weights, normalised in log-space for numerical stability
+        self.weights = torch.softmax(logWs, -1)
+        self.samples = samples
+        self.ess = 1 / (self.weights ** 2).sum(-1)
+        self.n_particles = logWs.shape[-1]
+        logW_sum = torch.logsumexp(logWs, -1).exp()
+        for key, value in samples.items():
+            for name, elem in self.f.items():
+                estimates[key][name] = (elem(value) * self.weights).sum(-1)
+        return estimates, logW_sum
 
-        for _ in range(L):
-            # Run the conditioned model and construct the directed graphical model
+
+class QuadratureMessenger(Messenger):
+    '''
+    Sets the values of the unobserved Normal sites of a model to the nodes of a quadrature rule.
+    The k-th unobserved Normal site takes the k-th coordinate of the nodes (standard normal nodes that are
+    scaled and shifted to the site). Without nodes each site is set to its mean and the sites are only counted.
+    Other unobserved sites are sampled as usual.
+    '''
+
+    def __init__(self, nodes=None):
+        '''
+        :param nodes: (tensor) of shape (number of nodes, number of sites), None to count the sites
+        '''
+
+        super().__init__()
+        self.nodes = nodes
+        self.coordinate = 0
+
+    def _pyro_sample(self, msg):
+        if msg['is_observed'] or msg['value'] is not None or not isinstance(msg['fn'], torch.distributions.Normal):
+            return
+        if self.nodes is None:
+            msg['value'] = msg['fn'].loc
+        elif self.coordinate < self.nodes.shape[-1]:
+            msg['value'] = msg['fn'].loc + msg['fn'].scale * self.nodes[..., self.coordinate]
+        else:
+            raise ValueError('The model has more unobserved Normal sites than the quadrature rule has dimensions')
+        self.coordinate += 1
+
+
+@lru_cache(maxsize=32)
+def hermite_grid(n, d):
+    '''
+    Tensor-product Gauss-Hermite rule for the d-dimensional standard normal distribution
+
+    :param n: (int) number of nodes per dimension
+    :param d: (int) number of dimensions
+
+    :return: nodes (np.array of shape (n**d, d)), log_weights (np.array of shape (n**d,)), the weights sum to one
+    '''
+
+    x, w = np.polynomial.hermite.hermgauss(n)
+    # Change of variables from exp(-x**2) to the standard normal density
+    x, w = np.sqrt(2) * x, w / np.sqrt(np.pi)
+    nodes = np.array(list(itertools.product(x, repeat=d))).reshape(-1, d)
+    log_weights = np.log(np.array(list(itertools.product(w, repeat=d))).reshape(-1, d)).sum(-1)
+    return nodes, log_weights
+
+
+class Quadrature(LW):
+    '''
+    Deterministic inference for models whose unobserved variables have Normal priors (e.g. the intuitive theory)
+
+    The posterior expectations are computed with a tensor-product Gauss-Hermite rule over the unobserved Normal
+    sites: every node is a particle whose weight is the quadrature weight times the likelihood of the observations.
+    The interface, estimates, weights and effective sample size are the same as the ones of LW. Unobserved sites
+    that are not Normal are sampled once per node, the result is then no longer deterministic.
+    '''
+
+    reuses_particles = False
+
+    def __init__(self, model, f={}, n_nodes=None, batch_size=None, profiler=None, **options):
+        '''
+        :param model: (callable) a stochastic generative process that contains named sample statements
+        :param f: (dict) a dictionary containing functions for which the expectation should be determined
+        :param n_nodes: (int) number of nodes per unobserved site, by default the largest number for
+                              which the grid has at most L nodes, but at least QUADRATURE_MIN_NODES
+                              (i.e. the grid can have more than L nodes)
+        :param batch_size: (int) if given, inference is done for batch_size independent copies of the problem at once
+        :param profiler: (Profiler) if given, the time spent in each stage of an inference call is recorded
+        :param options: options of LW (e.g. vectorized, adaptive), they have no effect
+        '''
+
+        super().__init__(model, f, vectorized=True, batch_size=batch_size, profiler=profiler, fast_backend=False)
+        self.n_nodes = n_nodes
+        self.messenger = None
+        # Number of unobserved Normal sites for each set of observed sites
+        self.dimensions = {}
+
+    def get_messenger(self, shape):
+        return self.messenger
+
+    def draw(self, cond_model, observation, L, *args, **kwargs):
+        '''
+        Evaluate the model at the nodes of the quadrature rule
+
+        :return: logWs (tensor), samples (dict of tensors), each node is one particle
+        '''
+
+        key = tuple(sorted(observation))
+        if key not in self.dimensions:
+            # Count the unobserved Normal sites in one execution without tracing it
+            messenger = QuadratureMessenger()
+            with ExitStack() as stack:
+                stack.enter_context(self.stage('trace'))
+                if self.batch_size is not None:
+                    stack.enter_context(pyro.plate('batch', self.batch_size, dim=-2))
+                stack.enter_context(pyro.plate('particles', 1, dim=-1))
+                stack.enter_context(messenger)
+                cond_model(*args, **kwargs)
+            self.dimensions[key] = messenger.coordinate
+        d = self.dimensions[key]
+        n = (self.n_nodes or max(QUADRATURE_MIN_NODES, int(L ** (1 / d) + 1e-9))) if d else 1
+        nodes, log_weights = hermite_grid(n, d)
+        dtype = torch.get_default_dtype()
+        self.messenger = QuadratureMessenger(torch.as_tensor(nodes, dtype=dtype))
+        logWs, samples = self.draw_vectorized(cond_model, len(log_weights), *args, **kwargs)
+        self.messenger = None
+        return logWs + torch.as_tensor(log_weights, dtype=dtype), samples
+
+    def reweight(self, samples, observation, *args, **kwargs):
+        '''
+        The nodes are cheap and deterministic, so instead of reusing the particles of an earlier call
+        the rule is evaluated for the new observations (see LW.reweight)
+
+        :return: estimates (dictionary), logW_sum (float)
+        '''
+
+        return self.inferLW(next(iter(samples.values())).shape[-1], observation, *args, **kwargs)
+
+
+class RaoBlackwell(LW):
+    '''
+    Inference for generative processes in which the outcome depends on Normal Variables only through their sum S
+    (e.g. the intuitive theory, see generative_processes.register_structure)
+
+    A Gaussian observation of a sum of some of the Variables (the self-worth in Step 9) is absorbed in closed form
+    with a rank-1 update of the prior. Given S the Variables are jointly Gaussian, so only the one-dimensional
+    integral over S is done numerically, with Gauss-Hermite quadrature. The expectation of each f given S is
+    computed with an inner Gauss-Hermite rule over the Gaussian conditional of the Variable.
+
+    Each node of S is a particle in self.weights and self.samples (the samples are the conditional means of the
+    Variables at the nodes). Models without a registered structure, Variables that are not Normal and observations
+    of other sites are handed to LW.
+    '''
+
+    reuses_particles = False
+
+    def __init__(self, model, f={}, n_nodes=None, batch_size=None, profiler=None, **options):
+        '''
+        :param model: (callable) a stochastic generative process that contains named sample statements
+        :param f: (dict) a dictionary containing functions for which the expectation should be determined
+        :param n_nodes: (int) number of nodes of the integral over S and of the inner rule, by default min(L, 20)
+        :param batch_size: (int) if given, inference is done for batch_size independent copies of the problem at once
+        :param profiler: (Profiler) if given, the time spent in each stage of an inference call is recorded
+        :param options: options of LW that are used if the inference is handed to LW
+        '''
+
+        super().__init__(model, f, batch_size=batch_size, profiler=profiler, **options)
+        self.n_nodes = n_nodes
+        self.structure = get_structure(model)
+
+    def supports(self, observation, args, kwargs):
+        '''
+        :return: (bool) whether the inference can be done in closed form up to the integral over S
+        '''
+
+        if self.structure is None or kwargs:
+            return False
+        if not all(isinstance(elem, Variable) and elem.dist == 'Normal' for elem in args):
+            return False
+        names = [elem.name for elem in args] + [self.structure['outcome']]
+        if 'observation' in self.structure:
+            names.append(self.structure['observation']['site'])
+        return set(observation) <= set(names)
+
+    def inferLW(self, L, observation, *args, **kwargs):
+        '''
+        Perform inference for a given set of observations, see LW.inferLW
+
+        :param L: (int) the number of nodes is min(L, 20) unless n_nodes is set
+
+        :return: estimates (dictionary), logW_sum (float)
+        '''
+
+        if not self.supports(observation, args, kwargs):
+            return super().inferLW(L, observation, *args, **kwargs)
+
+        start = self.start()
+        dtype = torch.get_default_dtype()
+
+        def column(value):
+            # Batch dimension first, nodes last
+            return torch.as_tensor(value, dtype=dtype).reshape(-1, 1)
+
+        with self.stage('aggregation'):
+            ## Prior of the unobserved Variables, the observed ones only shift S
+            hidden = [elem for elem in args if elem.name not in observation]
+            offset = sum([column(observation[elem.name]) for elem in args if elem.name in observation], column(0.))
+            m = [column(elem.param['mean']) for elem in hidden]
+            d = [column(elem.param['std']) ** 2 for elem in hidden]
+            log_evidence = column(0.)
+
+            ## Absorb the Gaussian observation of the concept with a rank-1 update
+            # Sigma = D - D a a^T D / (a^T D a + r), mu = m + D a (y - a^T m - c) / (a^T D a + r)
+            a = [0.] * len(hidden)
+            gain = column(0.)
+            if 'observation' in self.structure and self.structure['observation']['site'] in observation:
+                gaussian = self.structure['observation']
+                a = [1. if elem.name in gaussian['concept'] else 0. for elem in hidden]
+                shift = sum([column(observation[elem.name]) for elem in args
+                             if elem.name in observation and elem.name in gaussian['concept']], column(0.))
+                variance = sum([a_j * d_j for a_j, d_j in zip(a, d)], column(gaussian['std'] ** 2))
+                residual = column(observation[gaussian['site']]) - shift - sum([a_j * m_j for a_j, m_j in zip(a, m)], column(0.))
+                log_evidence = -0.5 * (residual ** 2 / variance + variance.log() + np.log(2 * np.pi))
+                m = [m_j + d_j * a_j * residual / variance for m_j, d_j, a_j in zip(m, d, a)]
+                gain = 1 / variance
+            aDa = sum([a_j * d_j for a_j, d_j in zip(a, d)], column(0.))
+            # Covariance of each Variable with S and its variance
+            cov_S = [d_j - d_j * a_j * aDa * gain for d_j, a_j in zip(d, a)]
+            var = [d_j - d_j ** 2 * a_j * gain for d_j, a_j in zip(d, a)]
+            mean_S = sum(m, offset)
+            var_S = sum(cov_S, column(0.)).clamp_min(torch.finfo(dtype).tiny)
+
+            ## Integrate over S
+            n = self.n_nodes or min(L, 20)
+            nodes, log_weights = hermite_grid(n, 1)
+            z = torch.as_tensor(nodes[:, 0], dtype=dtype)
+            S = mean_S + var_S.sqrt() * z
+            logWs = torch.as_tensor(log_weights, dtype=dtype) + log_evidence
+            outcome = self.structure['outcome']
+            if outcome in observation:
+                y = column(observation[outcome])
+                logWs = logWs - y * torch.nn.functional.softplus(-S) - (1 - y) * torch.nn.functional.softplus(S)
+
+            ## Gaussian conditional of each Variable given S, expectations with the inner rule
+            inner, inner_log_weights = hermite_grid(n, 1)
+            inner = torch.as_tensor(inner[:, 0], dtype=dtype)
+            inner_weights = torch.as_tensor(inner_log_weights, dtype=dtype).exp()
+
+            def particles(value):
+                # Shape (n,) or (batch_size, n) like the particles of LW
+                value = value.expand(self.batch_size or 1, n)
+                return value if self.batch_size is not None else value[0]
+
+            samples = {}
+            conditional = {}
+            for elem, m_j, c_j, v_j in zip(hidden, m, cov_S, var):
+                samples[elem.name] = particles(m_j + c_j * (S - mean_S) / var_S)
+                conditional[elem.name] = particles((v_j - c_j ** 2 / var_S).clamp_min(0).sqrt())
+            logWs = particles(logWs)
+
+            self.weights = torch.softmax(logWs, -1)
+            self.samples = samples
+            self.ess = 1 / (self.weights ** 2).sum(-1)
+            self.n_particles = n
+            logW_sum = torch.logsumexp(logWs, -1).exp()
+            estimates = defaultdict(dict)
+            for key, value in samples.items():
+                points = value.unsqueeze(-1) + conditional[key].unsqueeze(-1) * inner
+                for name, elem in self.f.items():
+                    estimates[key][name] = ((elem(points) * inner_weights).sum(-1) * self.weights).sum(-1)
+        self.record('inferLW', start)
+        return estimates, logW_sum
+
+    def reweight(self, samples, observation, *args, **kwargs):
+        '''
+        The inference is cheap and deterministic, so instead of reusing the particles of an earlier call
+        it is done for the new observations (see LW.reweight)
+
+        :return: estimates (dictionary), logW_sum (float)
+        '''
+
+        return self.inferLW(next(iter(samples.values())).shape[-1], observation, *args, **kwargs)
+
+
+class ImportanceSampling(LW):
+    '''
+    Importance sampling with a Gaussian proposal that is fitted to the posterior instead of the prior of LW
+
+    The unobserved sites are mapped to an unconstrained space (pyro's biject_to of their support), in which
+    the proposal is a multivariate Normal distribution. It is either
+        'laplace': centred at the mode of the posterior with the inverse of the negative Hessian as covariance,
+        'moments': with the weighted mean and covariance of a pilot run of LW.
+    The proposal is fitted once per inference call (per copy of the problem in the batched mode), every
+    particle is weighted with p(X,Y)/q(X). The effective sample size of each call is kept in self.ess and
+    passed to the profiler, if it drops below min_ess a warning is issued. Models with discrete or
+    multivariate unobserved sites are handed to LW.
+    '''
+
+    reuses_particles = False
+
+    def __init__(self, model, f={}, proposal='laplace', scale=1., steps=20, n_pilot=None, min_ess=None,
+                 batch_size=None, profiler=None, **options):
+        '''
+        :param model: (callable) a stochastic generative process that contains named sample statements
+        :param f: (dict) a dictionary containing functions for which the expectation should be determined
+        :param proposal: (string) 'laplace' or 'moments'
+        :param scale: (float) factor the standard deviations of the proposal are multiplied with
+        :param steps: (int) maximal number of L-BFGS iterations to find the mode ('laplace')
+        :param n_pilot: (int) number of particles of the pilot run ('moments'), by default L
+        :param min_ess: (float) a warning is issued for inference calls with a smaller effective sample size
+        :param batch_size: (int) if given, inference is done for batch_size independent copies of the problem at once
+        :param profiler: (Profiler) if given, the time spent in each stage of an inference call is recorded
+        :param options: options of LW (e.g. adaptive), they are also used if the inference is handed to LW
+        '''
+
+        if proposal not in ('laplace', 'moments'):
+            raise ValueError(f'Unknown proposal {proposal}, choose laplace or moments')
+        super().__init__(model, f, batch_size=batch_size, profiler=profiler, **options)
+        self.proposal = proposal
+        self.scale = scale
+        self.steps = steps
+        self.n_pilot = n_pilot
+        self.min_ess = min_ess
+        self.fitted = None
+
+    def inferLW(self, L, observation, *args, **kwargs):
+        '''
+        Perform inference for a given set of observations, see LW.inferLW
+
+        :return: estimates (dictionary), logW_sum (float)
+        '''
+
+        self.fitted = None
+        try:
+            result = super().inferLW(L, observation, *args, **kwargs)
+        finally:
+            self.fitted = None
+        if self.min_ess is not None and self.ess.min() < self.min_ess:
+            warnings.warn(f'Effective sample size {self.ess.min().item():.1f} of {self.n_particles} particles '
+                          f'is below {self.min_ess}')
+        return result
+
+    def plates(self, stack, L):
+        '''
+        Enter the plates of the particles (and copies of the problem) of a vectorized execution
+
+        :param stack: (ExitStack)
+        :param L: (int) number of particles
+        '''
+
+        if self.batch_size is not None:
+            stack.enter_context(pyro.plate('batch', self.batch_size, dim=-2))
+        stack.enter_context(pyro.plate('particles', L, dim=-1))
+
+    def log_joint(self, cond_model, values, L, *args, **kwargs):
+        '''
+        :param values: (dict) values of all unobserved sites, tensors of shape (L,) or (batch_size, L)
+        :return: (tensor) log-probability of all sites for each particle
+        '''
+
+        with ExitStack() as stack:
+            self.plates(stack, L)
+            trace_DS = poutine.trace(poutine.condition(cond_model, data=values)).get_trace(*args, **kwargs)
+        trace_DS.compute_log_prob()
+        return sum([site['log_prob'] for site in trace_DS.nodes.values() if site['type'] == 'sample'])
+
+    def get_sites(self, cond_model, *args, **kwargs):
+        '''
+        Find the unobserved sites in one execution of the model
+
+        :return: (list) of (name, transform to the support, initial unconstrained value) per site
+        '''
+
+        with ExitStack() as stack:
+            self.plates(stack, 1)
             trace_DS = poutine.trace(cond_model).get_trace(*args, **kwargs)
-            # Determine the log-probability of each sampled value
-            trace_DS.log_prob_sum()
-            # Get the observational nodes from the data structure
-            obs_nodes = trace_DS.observation_nodes
-            # For each observational node extract the log-probabilities of the sampled values
-            # Sum those values up to obtain the log-probability of the observed values
-            logWs.append(sum([trace_DS.nodes[elem]['log_prob_sum'] for elem in obs_nodes]))
-            # Add the sampled values for each unobserved variable to a list
-            __ = [samples[elem].append(trace_DS.nodes[elem]['value']) for elem in trace_DS.stochastic_nodes]
+        sites = []
+        for name, site in trace_DS.nodes.items():
+            if site['type'] != 'sample' or site['is_observed']:
+                continue
+            fn = site['fn']
+            if fn.event_shape or fn.support.is_discrete:
+                raise NotImplementedError(f'The site {name} is not a continuous scalar')
+            transform = biject_to(fn.support)
+            try:
+                init = transform.inv(fn.mean.expand(fn.batch_shape))
+            except NotImplementedError:
+                init = transform.inv(site['value'])
+            if not torch.isfinite(init).all():
+                init = transform.inv(site['value'])
+            sites.append((name, transform, init.detach()))
+        if not sites:
+            raise NotImplementedError('The model has no unobserved sites')
+        return sites
 
-        # need likelihoods not log-likelihoods
-        logWs = [np.exp(elem) for elem in logWs]
-        logW_sum = sum(logWs)
-        # Compute likelihood weights
-        weights = np.array(logWs) / logW_sum.item()
-        # Determine the estimates of the expectations for each function f regsitered with the class
-        for key in samples.keys():
-            for name, elem in self.f.items():
-                estimates[key][name] = \
-                    sum(elem(np.array(samples[key])) * weights)
+    def constrain(self, sites, z):
+        '''
+        :param sites: (list) see get_sites
+        :param z: (tensor) unconstrained values, the last dimension indexes the sites
+
+        :return: values (dict), log_det (tensor) log-determinant of the Jacobian of the transforms
+        '''
+
+        values = {}
+        log_det = 0
+        for i, (name, transform, _) in enumerate(sites):
+            values[name] = transform(z[..., i])
+            log_det = log_det + transform.log_abs_det_jacobian(z[..., i], values[name])
+        return values, log_det
+
+    def fit_laplace(self, cond_model, sites, *args, **kwargs):
+        '''
+        :return: loc (tensor of shape (copies, d)), covariance (tensor of shape (copies, d, d))
+        '''
+
+        z = torch.stack([init for _, _, init in sites], -1).clone().requires_grad_(True)
+        d = len(sites)
+
+        def log_posterior(z):
+            values, log_det = self.constrain(sites, z)
+            return (self.log_joint(cond_model, values, 1, *args, **kwargs) + log_det).sum()
+
+        optimizer = torch.optim.LBFGS([z], max_iter=self.steps, tolerance_grad=1e-4, line_search_fn='strong_wolfe')
+
+        def closure():
+            optimizer.zero_grad()
+            loss = -log_posterior(z)
+            loss.backward()
+            return loss
+
+        optimizer.step(closure)
+        z = z.detach()
+        # The copies are independent, i.e. the Hessian is block-diagonal
+        copies = z.numel() // d
+        hessian = torch.autograd.functional.hessian(log_posterior, z).reshape(copies, d, copies, d)
+        index = torch.arange(copies)
+        precision = -hessian[index, :, index, :]
+        precision = (precision + precision.transpose(-1, -2)) / 2
+        eigenvalues, eigenvectors = torch.linalg.eigh(precision)
+        # Flat or non-concave directions get a unit variance
+        eigenvalues = torch.where(eigenvalues > 1e-6, eigenvalues, torch.ones_like(eigenvalues))
+        covariance = eigenvectors @ torch.diag_embed(1 / eigenvalues) @ eigenvectors.transpose(-1, -2)
+        return z.reshape(copies, d), covariance
+
+    def fit_moments(self, cond_model, observation, sites, L, *args, **kwargs):
+        '''
+        :return: loc (tensor of shape (copies, d)), covariance (tensor of shape (copies, d, d))
+        '''
+
+        logWs, samples = super().draw(cond_model, observation, self.n_pilot or L, *args, **kwargs)
+        z = torch.stack([transform.inv(samples[name]) for name, transform, _ in sites], -1)
+        z = z.reshape(-1, z.shape[-2], len(sites))
+        weights = torch.softmax(logWs, -1).reshape(len(z), -1, 1)
+        loc = (weights * z).sum(-2)
+        centred = z - loc.unsqueeze(-2)
+        covariance = (weights * centred).transpose(-1, -2) @ centred
+        covariance = covariance + 1e-6 * torch.eye(len(sites))
+        return loc, covariance
+
+    def draw(self, cond_model, observation, L, *args, **kwargs):
+        '''
+        Draw L particles from the fitted proposal, the proposal is fitted at the first draw of an inference call
+
+        :return: logWs (tensor of shape (L,) or (batch_size, L)), samples (dict of tensors of the same shape)
+        '''
+
+        try:
+            if self.fitted is None:
+                with self.stage('proposal'):
+                    sites = self.get_sites(cond_model, *args, **kwargs)
+                    if self.proposal == 'laplace':
+                        loc, covariance = self.fit_laplace(cond_model, sites, *args, **kwargs)
+                    else:
+                        loc, covariance = self.fit_moments(cond_model, observation, sites, L, *args, **kwargs)
+                    scale_tril = self.scale * torch.linalg.cholesky(covariance)
+                    if self.batch_size is None:
+                        q = torch.distributions.MultivariateNormal(loc[0], scale_tril=scale_tril[0])
+                    else:
+                        # Batch shape (batch_size, 1), i.e. one proposal per copy shared by its particles
+                        q = torch.distributions.MultivariateNormal(loc.unsqueeze(-2), scale_tril=scale_tril.unsqueeze(-3))
+                self.fitted = (sites, q)
+        except NotImplementedError:
+            return super().draw(cond_model, observation, L, *args, **kwargs)
+
+        sites, q = self.fitted
+        with self.stage('trace'):
+            # (L, d) or (batch_size, L, d)
+            z = q.sample((L,)).squeeze(-2).transpose(0, 1) if self.batch_size is not None else q.sample((L,))
+            values, log_det = self.constrain(sites, z)
+            shape = (L,) if self.batch_size is None else (self.batch_size, L)
+            log_joint = self.log_joint(cond_model, values, L, *args, **kwargs)
+        with self.stage('log_prob'):
+            logWs = (log_joint + log_det - q.log_prob(z)).expand(shape)
+        return logWs, {name: value.expand(shape) for name, value in values.items()}
+
+    def reweight(self, samples, observation, *args, **kwargs):
+        '''
+        The particles of an earlier call were drawn from its proposal and not from the prior, so they cannot be
+        reweighted like the ones of LW. A new proposal is fitted for the new observations instead.
+
+        :return: estimates (dictionary), logW_sum (float)
+        '''
+
+        return self.inferLW(next(iter(samples.values())).shape[-1], observation, *args, **kwargs)
+
+
+# Inference engines that can be selected with the 'engine' entry of the inference options of a Human
+def model_key(model):
+    '''
+    Content hash of a generative process: its source and, for a process that was built by another one (e.g.
+    Human.decorate_self_worth), the specification it keeps in its 'specification' attribute.
+
+    :param model: (callable)
+    :return: (string)
+    '''
+    from store import specification_hash
+
+    return specification_hash(('model', model, getattr(model, 'specification', None)))
+
+
+class TableInference(LW):
+    '''
+    Inference engine that interpolates the estimates from PosteriorTables (see posterior_table.py). A table is
+    used if it was built for the same generative process (see model_key), the same observed sites and the same
+    functions f and the call lies inside of its grid. All other calls are handed to LW.
+    '''
+
+    def __init__(self, model, f={}, tables=(), tolerance=None, batch_size=None, profiler=None, **options):
+        '''
+        :param model: (callable) a stochastic generative process that contains named sample statements
+        :param f: (dict) a dictionary containing functions for which the expectation should be determined
+        :param tables: (list) of PosteriorTable
+        :param tolerance: (float) calls in cells with a larger interpolation error are handed to LW
+        :param batch_size: (int) if given, the estimates are tensors of shape (batch_size,)
+        :param profiler: (Profiler) if given, the calls that are handed to LW are profiled
+        :param options: options of LW
+        '''
+
+        super().__init__(model, f, batch_size=batch_size, profiler=profiler, **options)
+        self.key = model_key(model)
+        self.tables = tables
+        self.tolerance = tolerance
+        # Interpolation error of the last call, None if it was handed to LW
+        self.error = None
+
+    def inferLW(self, L, observation, *args, **kwargs):
+        '''
+        Look up the estimates in the tables, see LW.inferLW
+
+        :return: estimates (dictionary), logW_sum (float, NaN for estimates from a table)
+        '''
+
+        for table in self.tables:
+            if table.model_key != self.key or not set(self.f) <= set(table.f) or kwargs:
+                continue
+            found = table.lookup(observation, args, self.tolerance)
+            if found is None:
+                continue
+            estimates, self.error = found
+            shape = () if self.batch_size is None else (self.batch_size,)
+            dtype = torch.get_default_dtype()
+            self.weights = None
+            self.samples = None
+            result = defaultdict(dict)
+            for key, value in estimates.items():
+                result[key] = {elem: torch.full(shape, value[elem], dtype=dtype) for elem in self.f}
+            return result, torch.tensor(float('nan'))
+        self.error = None
+        return super().inferLW(L, observation, *args, **kwargs)
+
+
+engines = {'LW': LW, 'quadrature': Quadrature, 'rao-blackwell': RaoBlackwell, 'importance': ImportanceSampling,
+           'table': TableInference}
+
+
+class InferenceCache(object):
+    '''
+    A least-recently-used cache for the results of inference calls.
+
+    Inference calls with the same model, observations, Variable distributions/parameters and number
+    of samples estimate the same posterior, they only differ in their Monte Carlo noise. The cache
+    returns the stored result for those calls instead of running the inference again. Note that
+    all hits of an entry share its Monte Carlo noise. With oversample > 1 each entry is estimated with
+    oversample times the number of samples, i.e. the particles are pooled across the hits.
+
+    The inference of a stored result is seeded from its key (see get_seed), so a stored result does not depend
+    on which call fills it. A run with worker processes, each with its own copy of the cache, therefore
+    gives the same results as a serial run.
+    '''
+
+    def __init__(self, maxsize=128, oversample=1):
+        '''
+        :param maxsize: (int) maximal number of stored results, the least recently used one is evicted first
+        :param oversample: (int) factor by which the number of samples is increased for a stored result
+        '''
+
+        self.maxsize = maxsize
+        self.oversample = oversample
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, inference_class, L, observation, *args):
+        '''
+        Determine the key of an inference call
+
+        :return: (tuple)
+        '''
+
+        return (inference_class.model, type(inference_class), inference_class.vectorized, inference_class.batch_size,
+                inference_class.fast_backend, getattr(inference_class, 'qmc', False),
+                getattr(inference_class, 'n_nodes', None),
+                tuple(sorted((inference_class.adaptive or {}).items())), tuple(inference_class.f.items()), L,
+                tuple((name, hashable(value)) for name, value in sorted(observation.items())),
+                tuple(hashable(elem) for elem in args))
+
+    def get_seed(self, key):
+        '''
+        Seed of the inference of a stored result, derived from the key only. Functions (the model and the
+        functions of the estimates) are described by their qualified names, so the seed is the same in every process.
+
+        :param key: (tuple) see get_key
+        :return: (int)
+        '''
+
+        def describe(value):
+            if isinstance(value, tuple):
+                return tuple(describe(elem) for elem in value)
+            if callable(value):
+                return f'{value.__module__}.{value.__qualname__}'
+            return value
+
+        return zlib.crc32(repr(describe(key)).encode())
+
+    def inferLW(self, inference_class, L, observation, *args):
+        '''
+        Same as inference_class.inferLW(L, observation, *args) but looks up the result in the cache first.
+        On a hit the weights and samples of the stored result are restored on the inference class.
+        On a miss the inference is run with the seed of the key, the random state of the caller is restored
+        afterwards, i.e. neither hits nor misses consume random numbers of the caller.
+
+        :param inference_class: (LW)
+        :return: estimates (dictionary), logW_sum (float)
+        '''
+
+        key = self.get_key(inference_class, L, observation, *args)
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        else:
+            self.misses += 1
+            state = pyro.util.get_rng_state()
+            pyro.set_rng_seed(self.get_seed(key))
+            try:
+                estimates, logW_sum = inference_class.inferLW(L * self.oversample, observation, *args)
+            finally:
+                pyro.util.set_rng_state(state)
+            self.entries[key] = (estimates, logW_sum, inference_class.weights, inference_class.samples)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        estimates, logW_sum, inference_class.weights, inference_class.samples = self.entries[key]
         return estimates, logW_sum
 
+    def clear(self):
+        '''
+        Remove all stored results and reset the counters
+        '''
+
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def hashable(value):
+    '''
+    Turn an argument or observation of an inference call into a hashable value.
+    Variables are described by their distribution and parameters.
+
+    :param value: (Variable/tensor/float)
+    :return: hashable value
+    '''
+
+    if hasattr(value, 'param') and hasattr(value, 'dist'):
+        return (value.name, value.internal, value.dist, tuple(hashable(elem) for elem in value.param.items()))
+    if isinstance(value, tuple):
+        return tuple(hashable(elem) for elem in value)
+    if isinstance(value, (torch.Tensor, np.ndarray)):
+        return tuple(np.asarray(value).ravel().tolist())
+    return value
+
 
 if __name__ == '__main__':
     '''
@@ -92,7 +1106,7 @@ if __name__ == '__main__':
 
     def beta_binomial_model(n,a,b):
         theta = pyro.sample('theta', pyro.distributions.Beta(a,b))
-        k = pyro.sample('successes', pyro.distributions.Binomial(torch.tensor(n, dtype=torch.float32), theta))
+        k = pyro.sample('successes', pyro.distributions.Binomial(torch.as_tensor(n, dtype=torch.float32), theta))
         return k
 
 
@@ -116,5 +1130,37 @@ if __name__ == '__main__':
     print(f'The estimated expectation is: {estimates["theta"]["identity"]}')
     print(f'The difference is: {abs(theoretical_post_expectation-estimates["theta"]["identity"])}')
 
+    # the same inference with all particles drawn in one traced execution
+    lw = LW(beta_binomial_model,f = {'identity':lambda x:x},vectorized=True)
+    estimates, _  = lw.inferLW(L,obs,n,a,b)
+
+    print(f'The estimated expectation (vectorized) is: {estimates["theta"]["identity"]}')
+    print(f'The difference (vectorized) is: {abs(theoretical_post_expectation-estimates["theta"]["identity"])}')
+
+    # draw chunks of 100 particles until the standard error of the estimate is below 0.002
+    lw = LW(beta_binomial_model,f = {'identity':lambda x:x},vectorized=True,adaptive={'se':0.002})
+    estimates, _  = lw.inferLW(100,obs,n,a,b)
+
+    print(f'The estimated expectation (adaptive) is: {estimates["theta"]["identity"]}')
+    print(f'The difference (adaptive) is: {abs(theoretical_post_expectation-estimates["theta"]["identity"])}')
+    print(f'Number of particles (adaptive): {lw.n_particles}')
+
+
+
+
+    # quasi-Monte Carlo in a Normal-Normal model (the Beta distribution has no inverse CDF in torch)
+    # theta ~ N(0,1), y | theta ~ N(theta,1), E[theta | y] = y/2
+
+    def normal_model():
+        theta = pyro.sample('theta', pyro.distributions.Normal(0., 1.))
+        return pyro.sample('y', pyro.distributions.Normal(theta, 1.))
 
+    obs = {'y': torch.tensor(1.)}
+    for qmc in [False, True]:
+        lw = LW(normal_model,f = {'identity':lambda x:x},vectorized=True,qmc=qmc)
+        errors = torch.tensor([lw.inferLW(256,obs)[0]['theta']['identity'] - 0.5 for _ in range(200)])
+        print(f'RMSE with 256 particles ({"qmc" if qmc else "pseudo-random"}): {errors.pow(2).mean().sqrt().item()}')
 
+    # the same posterior with Gauss-Hermite quadrature, 16 nodes
+    estimates, _ = Quadrature(normal_model,f = {'identity':lambda x:x}).inferLW(16,obs)
+    print(f'Error with 16 quadrature nodes: {abs(estimates["theta"]["identity"].item() - 0.5)}')
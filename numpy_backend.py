@@ -0,0 +1,174 @@
+# NumPy versions of generative processes and likelihood-weighting inference that do not need torch or pyro.
+#
+# A NumPy version of a generative process is registered next to its pyro version with register_backend.
+# It gets a NumpyTrace as first argument, followed by the arguments of the pyro version, and creates its
+# sample sites with trace.sample. LW picks the registered version automatically.
+
+from collections import defaultdict
+import weakref
+
+import numpy as np
+
+
+# Registered NumPy versions, keyed by the pyro version of the generative process
+backends = weakref.WeakKeyDictionary()
+
+
+def register_backend(model, backend):
+    '''
+    Register the NumPy version of a generative process
+
+    :param model: (callable) pyro version of the generative process
+    :param backend: (callable) NumPy version, takes a NumpyTrace and the arguments of the pyro version
+    '''
+    backends[model] = backend
+
+
+def get_backend(model):
+    '''
+    :param model: (callable) pyro version of the generative process
+    :return: (callable) the registered NumPy version, None if there is none
+    '''
+    try:
+        return backends.get(model)
+    except TypeError:
+        return None
+
+
+class NumpyTrace(object):
+    '''
+    Executes the sample sites of a NumPy generative process for a batch of particles.
+    Observed sites take the observed value and record its log-probability, all other sites are sampled.
+    '''
+
+    def __init__(self, shape, observation):
+        '''
+        :param shape: (tuple) batch shape of the particles, e.g. (L,)
+        :param observation: (dict) observed values, the keys are the sample-names
+        '''
+        self.shape = shape
+        self.observation = observation
+        self.values = {}
+        self.log_probs = {}
+
+    def sample(self, name, site):
+        '''
+        :param name: (string) name of the sample site
+        :param site: (tuple) functions that sample values of a given shape and that compute the log-probability of values
+
+        :return: (np.array) the observed or sampled value
+        '''
+        sampler, log_prob = site
+        if name in self.observation:
+            value = np.asarray(self.observation[name], dtype=float)
+            self.log_probs[name] = log_prob(value)
+        else:
+            value = sampler(self.shape)
+        self.values[name] = value
+        return value
+
+    def get_weights(self, weight_sites=None):
+        '''
+        :param weight_sites: (iterable) names of the sites whose log-probabilities make up the weights,
+                                        by default all observed sites
+
+        :return: logWs (np.array of shape self.shape), samples (dict of np.arrays with the values of the other sites)
+        '''
+        if weight_sites is None:
+            weight_sites = self.log_probs.keys()
+        weight_sites = [elem for elem in weight_sites if elem in self.log_probs]
+        logWs = np.broadcast_to(sum([self.log_probs[elem] for elem in weight_sites], np.zeros(self.shape)), self.shape)
+        samples = {name: np.broadcast_to(value, self.shape) for name, value in self.values.items()
+                   if name not in weight_sites}
+        return logWs, samples
+
+
+def normal_site(mean, std):
+    '''
+    :return: (tuple) sampler and log-probability of a Normal distribution
+    '''
+    return (lambda shape: np.random.normal(mean, std, shape),
+            lambda value: -0.5 * ((value - mean) / std) ** 2 - np.log(std) - 0.5 * np.log(2 * np.pi))
+
+
+def exponential_site(rate):
+    '''
+    :return: (tuple) sampler and log-probability of an Exponential distribution
+    '''
+    return (lambda shape: np.random.exponential(1 / rate, shape),
+            lambda value: np.where(value >= 0, np.log(rate) - rate * value, -np.inf))
+
+
+def bernoulli_logits_site(logits):
+    '''
+    :return: (tuple) sampler and log-probability of a Bernoulli distribution with success probability sigmoid(logits)
+    '''
+    return (lambda shape: (np.random.random_sample(shape) < 1 / (1 + np.exp(-logits))).astype(float),
+            lambda value: -value * np.logaddexp(0, -logits) - (1 - value) * np.logaddexp(0, logits))
+
+
+def fixed_site(fixed):
+    '''
+    :return: (tuple) sampler and log-probability of a fixed value
+    '''
+    return (lambda shape: np.full(shape, float(fixed)),
+            lambda value: np.where(value == fixed, 0., -np.inf))
+
+
+def variable_site(variable):
+    '''
+    Sample site of a Variable
+
+    :param variable: (Variable)
+    :return: (tuple) sampler and log-probability
+    '''
+    # Same predicate as Variable, e.g. 'fixed' and other fixed-like distributions
+    if 'fixed' in variable.dist:
+        return fixed_site(variable.param['fixed'])
+    if variable.dist == 'Normal':
+        return normal_site(*variable.param.values())
+    if variable.dist == 'Exponential':
+        return exponential_site(*variable.param.values())
+    raise NotImplementedError(f'The NumPy backend does not support the distribution {variable.dist}')
+
+
+class NumpyLW(object):
+    '''
+    Likelihood-Weighting inference with the NumPy version of a generative process, same interface as LW
+    '''
+
+    def __init__(self, model, f={}):
+        '''
+        :param model: (callable) pyro version of a generative process with a registered NumPy version,
+                                 or the NumPy version itself
+        :param f: (dict) a dictionary containing functions for which the expectation should be determined
+        '''
+        self.model = model
+        self.backend = get_backend(model) or model
+        self.f = f
+        self.weights = None
+        self.samples = None
+        self.ess = None
+        self.n_particles = None
+
+    def inferLW(self, L, observation, *args, **kwargs):
+        '''
+        Perform inference for a given set of observations, see LW.inferLW
+
+        :return: estimates (dictionary), logW_sum (float)
+        '''
+        trace = NumpyTrace((L,), observation)
+        self.backend(trace, *args, **kwargs)
+        logWs, self.samples = trace.get_weights()
+
+        estimates = defaultdict(dict)
+        logW_max = logWs.max()
+        weights = np.exp(logWs - logW_max)
+        logW_sum = weights.sum() * np.exp(logW_max)
+        self.weights = weights / weights.sum()
+        self.ess = 1 / (self.weights ** 2).sum()
+        self.n_particles = L
+        for key, value in self.samples.items():
+            for name, elem in self.f.items():
+                estimates[key][name] = (elem(value) * self.weights).sum()
+        return estimates, logW_sum
@@ -0,0 +1,379 @@
+# Precomputed posterior moments of a generative process over a grid of Variable parameters and observations
+#
+# A PosteriorTable is built once (e.g. with the Rao-Blackwellised engine) and saved to disk. The 'table'
+# inference engine interpolates the estimates from the tables instead of doing inference and hands
+# calls outside the grid, or with a too large interpolation error, to LW. To tabulate the posteriors
+# of Human.inference, e.g.
+#
+#   python3 posterior_table.py --axis skill.mean -2 2 9 --axis effort.mean -2 2 9 --output tables
+#
+# and use them with variables['inference_options'] = {'engine': 'table', 'tables': load_tables('tables')}, the
+# 'table' engine is inference_util.TableInference
+
+import argparse
+import json
+import os
+
+import numpy as np
+import torch
+
+from inference_util import engines
+from inference_util import model_key
+from utils import Variable
+
+
+class PosteriorTable(object):
+    '''
+    Estimates of E[f(X)] for the unobserved Variables X of a generative process on a grid.
+
+    The axes of the grid are parameters of the Variables (e.g. 'skill.mean') or values of observed sites
+    (e.g. 'success'). The observation template says where the value of each observed site comes from:
+    a number, an axis, a parameter of a Variable (e.g. 'external.mean') or a list of parameters whose sum
+    is observed (e.g. the self-worth). Between the nodes of the grid the estimates are interpolated
+    multilinearly, the interpolation error of each cell is estimated by comparing with the exact estimate
+    at its midpoint.
+    '''
+
+    def __init__(self, name, model, variables, template, f):
+        '''
+        :param name: (string) name of the table, e.g. 'automatic'
+        :param model: (callable) generative process, None for a table that is only looked up
+        :param variables: (list) Variables the generative process is called with, their parameters are the
+                                 values of the parameters that are not on an axis
+        :param template: (dict) has the observed sites as keys and the source of their value as values
+        :param f: (dict) a dictionary containing functions for which the expectation is tabulated
+        '''
+
+        self.name = name
+        self.model = model
+        self.model_name = getattr(model, '__qualname__', None)
+        # Content hash of the generative process, tables are only used for the same one (see TableInference)
+        self.model_key = model_key(model) if model is not None else None
+        self.base = [{'name': elem.name, 'internal': elem.internal, 'dist': elem.dist,
+                      'param': {key: float(value) for key, value in elem.param.items()}} for elem in variables]
+        self.template = template
+        self.f = f
+        self.axes = []
+        self.estimates = {}
+        self.errors = None
+
+    def add_axis(self, name, values, interpolate=True):
+        '''
+        :param name: (string) parameter of a Variable ('skill.mean') or name of an axis of the observation template
+        :param values: (iterable) increasing values of the axis
+        :param interpolate: (bool) if false only the values themselves can be looked up (e.g. for success)
+        '''
+
+        values = np.asarray(values, dtype=float)
+        if np.any(np.diff(values) <= 0):
+            raise ValueError(f'The values of the axis {name} have to be increasing')
+        if not self.is_parameter(name) and name not in self.template.values():
+            raise KeyError(f'{name} is neither a parameter of a Variable nor an axis of the observation template')
+        self.axes.append({'name': name, 'values': values, 'interpolate': interpolate and len(values) > 1})
+
+    def is_parameter(self, name):
+        '''
+        :param name: (string)
+        :return: (bool) whether name is a parameter of a Variable, e.g. 'skill.mean'
+        '''
+
+        variable, _, key = name.partition('.')
+        return any(elem['name'] == variable and key in elem['param'] for elem in self.base)
+
+    @property
+    def shape(self):
+        return tuple(len(axis['values']) for axis in self.axes)
+
+    def resolve(self, entry, point, params):
+        '''
+        Value of an entry of the observation template
+
+        :param entry: number, name of an axis, parameter or list of parameters
+        :param point: (dict) values of the axes
+        :param params: (dict) parameters of the Variables, keys are e.g. 'skill.mean'
+        '''
+
+        if isinstance(entry, list):
+            return sum(self.resolve(elem, point, params) for elem in entry)
+        if isinstance(entry, str):
+            return point[entry] if entry in point else params[entry]
+        return entry
+
+    def get_arguments(self, point):
+        '''
+        Variables and observations of a point of the grid
+
+        :param point: (dict) values of the axes
+        :return: variables (list), observation (dict)
+        '''
+
+        params = {f'{elem["name"]}.{key}': value for elem in self.base for key, value in elem['param'].items()}
+        params.update({name: value for name, value in point.items() if name in params})
+        variables = []
+        for elem in self.base:
+            param = {key: params[f'{elem["name"]}.{key}'] for key in elem['param']}
+            variables.append(Variable(elem['internal'], elem['name'], elem['dist'], param))
+        observation = {site: self.resolve(entry, point, params) for site, entry in self.template.items()}
+        return variables, observation
+
+    def build(self, engine='rao-blackwell', L=100, check=True, **options):
+        '''
+        Compute the estimates at every node of the grid (and the interpolation error of every cell)
+
+        :param engine: (string) inference engine, see inference_util.engines
+        :param L: (int) number of samples (or nodes) of each inference call
+        :param check: (bool) if true the interpolation error of every cell is estimated at its midpoint
+        :param options: options of the inference engine
+        '''
+
+        if self.model is None:
+            raise ValueError('A table without a generative process cannot be built')
+        inference = engines[engine](self.model, self.f, **options)
+        estimates = {}
+        for index in np.ndindex(*self.shape):
+            point = {axis['name']: axis['values'][i] for axis, i in zip(self.axes, index)}
+            variables, observation = self.get_arguments(point)
+            result, _ = inference.inferLW(L, observation, *variables)
+            for key, value in result.items():
+                for name, elem in value.items():
+                    estimates.setdefault((key, name), np.zeros(self.shape))[index] = float(elem)
+        self.estimates = estimates
+        self.errors = self.check(inference, L) if check else None
+
+    def check(self, inference, L):
+        '''
+        Interpolation error of every cell of the grid at its midpoint
+
+        :param inference: inference class the table was built with
+        :param L: (int) number of samples (or nodes) of each inference call
+
+        :return: (np.array) maximal absolute error over all estimates, one entry per cell
+        '''
+
+        shape = tuple(len(axis['values']) - 1 if axis['interpolate'] else len(axis['values']) for axis in self.axes)
+        errors = np.zeros(shape)
+        for index in np.ndindex(*shape):
+            point = {}
+            for axis, i in zip(self.axes, index):
+                values = axis['values']
+                point[axis['name']] = (values[i] + values[i + 1]) / 2 if axis['interpolate'] else values[i]
+            variables, observation = self.get_arguments(point)
+            result, _ = inference.inferLW(L, observation, *variables)
+            interpolated = self.interpolate(point)
+            errors[index] = max(abs(float(result[key][name]) - value) for (key, name), value in interpolated.items())
+        return errors
+
+    def locate(self, point):
+        '''
+        :param point: (dict) values of the axes
+        :return: (list) index of the cell and position inside of it on each axis, None if outside of the grid
+        '''
+
+        location = []
+        for axis in self.axes:
+            values, x = axis['values'], point[axis['name']]
+            if not axis['interpolate']:
+                match = np.flatnonzero(np.isclose(values, x))
+                if len(match) == 0:
+                    return None
+                location.append((match[0], 0.))
+                continue
+            if x < values[0] and not np.isclose(x, values[0]) or x > values[-1] and not np.isclose(x, values[-1]):
+                return None
+            i = min(max(np.searchsorted(values, x, side='right') - 1, 0), len(values) - 2)
+            location.append((i, min(max((x - values[i]) / (values[i + 1] - values[i]), 0.), 1.)))
+        return location
+
+    def interpolate(self, point):
+        '''
+        Multilinear interpolation of the estimates
+
+        :param point: (dict) values of the axes
+        :return: (dict) has (variable name, function name) as keys and the interpolated estimates as values,
+                        None if the point is outside of the grid
+        '''
+
+        location = self.locate(point)
+        if location is None:
+            return None
+        corners = [[(i, 1 - t), (i + 1, t)] if axis['interpolate'] else [(i, 1.)]
+                   for axis, (i, t) in zip(self.axes, location)]
+        result = {key: 0. for key in self.estimates}
+        for corner in np.ndindex(*[len(elem) for elem in corners]):
+            index = tuple(corners[j][k][0] for j, k in enumerate(corner))
+            weight = np.prod([corners[j][k][1] for j, k in enumerate(corner)])
+            if weight == 0:
+                continue
+            for key, value in self.estimates.items():
+                result[key] += weight * value[index]
+        return result
+
+    def match(self, observation, variables):
+        '''
+        Find the point of the grid that corresponds to an inference call
+
+        :param observation: (dict) observed values of the call
+        :param variables: (list) Variables of the call
+
+        :return: (dict) values of the axes, None if the call is not covered by the table
+        '''
+
+        if [elem.name for elem in variables] != [elem['name'] for elem in self.base]:
+            return None
+        if set(observation) != set(self.template):
+            return None
+        axes = {axis['name'] for axis in self.axes}
+        params = {}
+        point = {}
+        for elem, base in zip(variables, self.base):
+            if not isinstance(elem, Variable) or elem.dist != base['dist'] or set(elem.param) != set(base['param']):
+                return None
+            for key, value in elem.param.items():
+                name = f'{elem.name}.{key}'
+                params[name] = float(value)
+                if name in axes:
+                    point[name] = float(value)
+                elif not np.isclose(float(value), base['param'][key]):
+                    return None
+        for site, entry in self.template.items():
+            value = torch.as_tensor(observation[site])
+            if value.numel() != 1:
+                return None
+            if isinstance(entry, str) and entry in axes and not self.is_parameter(entry):
+                point[entry] = value.item()
+            elif not np.isclose(value.item(), self.resolve(entry, point, params)):
+                return None
+        return point
+
+    def lookup(self, observation, variables, tolerance=None):
+        '''
+        :param observation: (dict) observed values of the inference call
+        :param variables: (list) Variables of the inference call
+        :param tolerance: (float) maximal interpolation error of the cell
+
+        :return: estimates (dict of dicts like the ones of LW.inferLW), error (float) of the cell,
+                 None if the call is not covered by the table
+        '''
+
+        point = self.match(observation, variables)
+        if point is None:
+            return None
+        interpolated = self.interpolate(point)
+        if interpolated is None:
+            return None
+        error = 0.
+        if self.errors is not None:
+            location = self.locate(point)
+            error = float(self.errors[tuple(min(i, n - 1) for (i, _), n in zip(location, self.errors.shape))])
+        if tolerance is not None and error > tolerance:
+            return None
+        estimates = {}
+        for (key, name), value in interpolated.items():
+            estimates.setdefault(key, {})[name] = value
+        return estimates, error
+
+    def save(self, path):
+        '''
+        :param path: (string) .npz file
+        '''
+
+        meta = {'name': self.name, 'model': self.model_name, 'model_key': self.model_key, 'base': self.base, 'template': self.template,
+                'f': list(self.f), 'axes': [{'name': axis['name'], 'interpolate': axis['interpolate']} for axis in self.axes],
+                'estimates': [list(key) for key in self.estimates]}
+        arrays = {f'axis_{i}': axis['values'] for i, axis in enumerate(self.axes)}
+        arrays.update({f'estimate_{i}': value for i, value in enumerate(self.estimates.values())})
+        if self.errors is not None:
+            arrays['errors'] = self.errors
+        np.savez(path, meta=json.dumps(meta), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        :param path: (string) .npz file written by PosteriorTable.save
+        :return: (PosteriorTable) that can be looked up but not built
+        '''
+
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            table = cls(meta['name'], None, [], meta['template'], {name: None for name in meta['f']})
+            table.model_name = meta['model']
+            table.model_key = meta.get('model_key')
+            table.base = meta['base']
+            table.axes = [{'name': axis['name'], 'values': data[f'axis_{i}'], 'interpolate': axis['interpolate']}
+                          for i, axis in enumerate(meta['axes'])]
+            table.estimates = {tuple(key): data[f'estimate_{i}'] for i, key in enumerate(meta['estimates'])}
+            table.errors = data['errors'] if 'errors' in data else None
+        return table
+
+
+def build_human_tables(human, variables, axes, engine='rao-blackwell', L=100, **options):
+    '''
+    Tabulate the two posteriors of Human.inference: the automatic inference (Step 2) and the inference
+    with the self-worth (Step 9). Success is an axis with the values 0 and 1.
+
+    :param human: (Human)
+    :param variables: (dict) variables of the participant, the parameters that are not on an axis are taken from it
+    :param axes: (dict) has parameters (e.g. 'skill.mean') as keys and their values as values
+    :param engine: (string) inference engine the tables are built with
+    :param L: (int) number of samples (or nodes) of each inference call
+    :param options: options of the inference engine
+
+    :return: (list) of PosteriorTable
+    '''
+
+    human.variables = variables
+    params = human.get_intuitive_theory_params()
+    automatic = {'success': 'success'}
+    automatic.update({elem.name: f'{elem.name}.mean' for elem in params if elem.internal == 0})
+    self_worth = {'success': 'success', 'self-worth': [f'{name}.mean' for name in human.concept]}
+
+    tables = [PosteriorTable('automatic', human.intuitive_theory, params, automatic, variables['f']),
+              PosteriorTable('self-worth', human.decorate_self_worth(), params, self_worth, variables['f'])]
+    for table in tables:
+        for name, values in axes.items():
+            table.add_axis(name, values)
+        table.add_axis('success', [0., 1.], interpolate=False)
+        table.build(engine, L, **options)
+    return tables
+
+
+def save_tables(tables, directory):
+    '''
+    :param tables: (list) of PosteriorTable
+    :param directory: (string) one .npz file per table is written to it
+    '''
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    for table in tables:
+        table.save(os.path.join(directory, f'{table.name}.npz'))
+
+
+def load_tables(directory):
+    '''
+    :param directory: (string) written by save_tables
+    :return: (list) of PosteriorTable
+    '''
+
+    return [PosteriorTable.load(os.path.join(directory, elem)) for elem in sorted(os.listdir(directory))
+            if elem.endswith('.npz')]
+
+
+if __name__ == '__main__':
+    from experiments import setup
+
+    parser = argparse.ArgumentParser(description='Tabulate the posteriors of Human.inference')
+    parser.add_argument('--axis', nargs=4, action='append', metavar=('PARAMETER', 'MIN', 'MAX', 'POINTS'), default=[],
+                        help='parameter of a Variable (e.g. skill.mean) and its grid')
+    parser.add_argument('--engine', default='rao-blackwell', help='inference engine the tables are built with')
+    parser.add_argument('--L', type=int, default=100, help='number of samples (or nodes) of each inference call')
+    parser.add_argument('--output', default='tables', help='directory the tables are saved to')
+    args = parser.parse_args()
+
+    human, variables = setup()
+    axes = {name: np.linspace(float(low), float(high), int(points)) for name, low, high, points in args.axis}
+    tables = build_human_tables(human, variables, axes, args.engine, args.L)
+    save_tables(tables, args.output)
+    for table in tables:
+        error = table.errors.max() if table.errors is not None else float('nan')
+        print(f'Table {table.name}: {int(np.prod(table.shape))} nodes, maximal interpolation error {error:.4f}')
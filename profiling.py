@@ -0,0 +1,124 @@
+# Instrumentation of the inference. Nothing is recorded unless a Profiler is registered.
+
+from collections import Counter
+from collections import defaultdict
+from contextlib import nullcontext
+import json
+import time
+
+import numpy as np
+
+
+class Stage(object):
+    '''
+    Context manager that adds the time spent inside of it to an entry of a dictionary
+    '''
+
+    def __init__(self, times, name):
+        '''
+        :param times: (dict) accumulated time of each stage
+        :param name: (string) name of the stage
+        '''
+        self.times = times
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.times[self.name] += time.perf_counter() - self.start
+
+
+def stage(profiler, times, name):
+    '''
+    Time a stage of an inference call if a profiler is registered, otherwise do nothing
+
+    :param profiler: (Profiler/None)
+    :param times: (dict) accumulated time of each stage
+    :param name: (string) name of the stage
+
+    :return: context manager
+    '''
+    if profiler is None:
+        return nullcontext()
+    return Stage(times, name)
+
+
+class Profiler(object):
+    '''
+    Records for each participant which branch of Human.inference was taken and for each inference call
+    the time spent in it, the split of that time into stages, the number of particles and the
+    effective sample size.
+    '''
+
+    def __init__(self):
+        self.records = []
+        self.calls = []
+        self.start = time.perf_counter()
+
+    def start_participant(self):
+        '''
+        Start the record of a new participant (or a batch of participants)
+        '''
+        self.calls = []
+        self.start = time.perf_counter()
+
+    def record_call(self, call):
+        '''
+        :param call: (dict) statistics of an inference call
+        '''
+        self.calls.append(call)
+
+    def end_participant(self, branch, n=1):
+        '''
+        Finish the record of the current participant
+
+        :param branch: (int/list) step of Human.inference the attribution was made in,
+                                  a list with one step per participant for a batch of participants
+        :param n: (int) number of participants in the record
+        '''
+        self.records.append({'branch': branch, 'participants': n,
+                             'seconds': time.perf_counter() - self.start, 'calls': self.calls})
+        self.calls = []
+
+    def report(self):
+        '''
+        Aggregate the records
+
+        :return: (dict)
+        '''
+
+        branches = Counter()
+        for record in self.records:
+            if isinstance(record['branch'], list):
+                branches.update(record['branch'])
+            else:
+                branches[record['branch']] += 1
+        calls = [call for record in self.records for call in record['calls']]
+        stages = defaultdict(float)
+        for call in calls:
+            for name, seconds in call['stages'].items():
+                stages[name] += seconds
+
+        participants = sum(record['participants'] for record in self.records)
+        seconds = sum(record['seconds'] for record in self.records)
+        return {'participants': participants,
+                'seconds': seconds,
+                'seconds/participant': seconds / max(participants, 1),
+                'branches': {f'Step {branch}': count for branch, count in sorted(branches.items())},
+                'inference calls': len(calls),
+                'inference seconds': sum(call['seconds'] for call in calls),
+                'stages': dict(stages),
+                'mean particles': float(np.mean([call['n_particles'] for call in calls])) if calls else 0,
+                'mean ess': float(np.mean([call['ess'] for call in calls])) if calls else 0,
+                'min ess': float(np.min([call['min ess'] for call in calls])) if calls else 0}
+
+    def export(self, path):
+        '''
+        Save the report and the records of all participants as JSON
+
+        :param path: (string)
+        '''
+        with open(path, 'w') as f:
+            json.dump({'report': self.report(), 'participants': self.records}, f, indent=2)
@@ -1,133 +1,160 @@
 # Set up an experiment and execute it from the command line
-
-from collections import OrderedDict
+#
+# Interactively:               python3 run_experiments.py
+# From a configuration file:   python3 run_experiments.py --config experiment.json
+#
+# A configuration file is a JSON object like
+#
+#   {"name": "My experiment",
+#    "variables": {"L": 50},
+#    "conditions": [{"name": "high", "N": 10, "SA": "h", "success": 0},
+#                   {"name": "low", "N": 10, "SA": "l", "success": 0}],
+#    "run": true}
+#
+# The values of the conditions are 'h'/'l' for the variables in utils.library_variables, any other
+# value is used as it is. "variables" overrides default values of the experiment, "run" is optional.
+
+import argparse
+import json
 import os
 
-from experiment import Experiment
-from generative_processes import intuitive_theory
-from human import Human
 from utils import check_int
 from utils import library_variables
-from utils import Variable
-
-
-# Set up the basics of an experiment
-variables = {}
-
-default = OrderedDict()
-default['mean'] = 0
-default['std'] = 1
-positive_bias = OrderedDict()
-positive_bias['mean'] = 0.5
-positive_bias['std'] = 1
-negative_bias = OrderedDict()
-negative_bias['mean'] = -0.5
-negative_bias['std'] = 1
-
-# Experimental parameters
-
-# Task importance
-variables['TI'] = Variable(1,'TI','fixed',{'fixed':1})
-
-# Controlled parameters
-variables['SA'] = Variable(0,'SA','Normal',positive_bias)
-variables['PI'] = Variable(0,'PI','Normal',negative_bias)
-variables['success'] = 0
-
-# IT Process parameters
-variables['skill'] = Variable(1,'skill','Normal',default)
-variables['effort'] = Variable(1,'effort','Normal',default)
-variables['external'] = Variable(0,'external','Normal',default)
-variables['luck'] = Variable(0,'luck','Normal',default)
-
-# Inferencee parameters
-variables['L']=100
-variables['f']={'mean':lambda x:x,'2ndMoment':lambda x:x**2}
-
-
-intuitive_theory_params = ['skill','effort','external','luck']
-self_concept = ['skill','effort']
-relevance = ['TI']
-inference_params = ['L']
-
-human = Human(self_concept,relevance,intuitive_theory_params,intuitive_theory,inference_params)
 
-# Create a directory to save the plots in
-directory = os.path.join(os.getcwd(),'plots')
-# Check whether directory exists, if not create it
-if not os.path.exists(directory):
-    os.makedirs(directory)
 
+def condition_value(var, value):
+    '''
+    :param var: (string) name of the variable
+    :param value: high/low ('h'/'l') for a variable of the library, otherwise the value itself
+
+    :return: value of the variable in the condition
+    '''
+    if var in library_variables and value in library_variables[var]:
+        return library_variables[var][value]
+    return value
+
+
+def build_experiment(config, human=None, variables=None):
+    '''
+    Set up an experiment from a configuration (see the top of this file)
+
+    :param config: (dict)
+    :param human: (Human) by default the participant of experiments.setup is used
+    :param variables: (dict) by default the variables of experiments.setup are used
+
+    :return: (Experiment)
+    '''
+    from experiment import Experiment
+    from experiments import setup
+
+    if human is None or variables is None:
+        human, variables = setup()
+    variables = dict(variables)
+    variables.update(config.get('variables', {}))
+
+    new_experiment = Experiment(config['name'], human, variables)
+    for elem in config['conditions']:
+        condition = {'name': elem['name'], 'N': int(elem['N'])}
+        for var, value in elem.items():
+            if var != 'N' and var != 'name':
+                condition[var] = condition_value(var, value)
+        new_experiment.register_condition(condition)
+    return new_experiment
+
+
+def load_config(path):
+    '''
+    :param path: (string) JSON configuration file
+    :return: (dict)
+    '''
+    with open(path) as f:
+        return json.load(f)
+
+
+def interactive():
+    '''
+    Ask for the configuration of an experiment
+
+    :return: (dict) configuration, see the top of this file
+    '''
+
+    print('This is supposed to be an interactive guide to setting up and running an experiment')
+
+    name_experiment = input('What is the name of your experiment? (string): ')
+    num_conditions = input('How many conditions does the experiment have? (0-10): ')
+    num_conditions = check_int(num_conditions,0,10)
+
+    variables_input = input(
+        'What variables should be manipulated? Enter their abbreviations (in brackets) with spaces inbetween. A possible list follows\n'
+        'success - (success)\n'
+        'task importance - (TI)\n'
+        'self-awareness - (SA)\n'
+        'probability of improvement - (PI)\n'
+        'number of samples in experiment - (L)\n'
+        'skill - (skill)\n'
+        'effort - (effort)\n'
+        'external - (external)\n'
+        'luck - (luck)\n'
+        'E.g. SI TI PI'
+        'Any variable that is not set is sampled from a default distribution\n'
+        'The possible values for the variables will be displayed at choosing time\n'
+        ': ')
+
+    # Create a list of variables
+
+    variables_input = variables_input.strip().split(" ")
+
+    # Register the conditions
+    conditions = []
+    for i in range(num_conditions):
+        condition = {}
+        name_condition = input(f'What is the name of the condition {i} (string) :')
+        condition['name'] = name_condition
+        num_participant = input('What is the number of participants (int) :')
+        num_participant = check_int(num_participant,0)
+        condition['N'] = num_participant
+        for var in variables_input:
+            var_value = input(f'Value of {var} in condition: {condition["name"]} - onlroy high/low possible [h/l]: ')
+            if var_value not in library_variables.get(var, {}):
+                print(f'{var_value} is not a valid entry')
+                exit()
+            condition[var] = var_value
+
+        print(condition)
+        conditions.append(condition)
+
+    yes = input('Do you want to run the experiment [y/n]: ')
+
+    while yes not in ('y', 'n'):
+        print('This was not a valid answer')
+        yes = input('Next try: ')
 
-print('This is supposed to be an interactive guide to setting up and running an experiment')
-
-name_experiment = input('What is the name of your experiment? (string): ')
-num_conditions = input('How many conditions does the experiment have? (0-10): ')
-num_conditions = check_int(num_conditions,0,10)
-
-variables_input = input(
-    'What variables should be manipulated? Enter their abbreviations (in brackets) with spaces inbetween. A possible list follows\n'
-    'success - (success)\n'
-    'task importance - (TI)\n'
-    'self-awareness - (SA)\n'
-    'probability of improvement - (PI)\n'
-    'number of samples in experiment - (L)\n'
-    'skill - (skill)\n'
-    'effort - (effort)\n'
-    'external - (external)\n'
-    'luck - (luck)\n'
-    'E.g. SI TI PI'
-    'Any variable that is not set is sampled from a default distribution\n'
-    'The possible values for the variables will be displayed at choosing time\n'
-    ': ')
-
-# Create a list of variables
-
-variables_input = variables_input.strip().split(" ")
-
-# Set up an experiment
-new_experiment = Experiment(name_experiment,human,variables)
+    return {'name': name_experiment, 'conditions': conditions, 'run': yes == 'y'}
 
-# Register the conditions
-for i in range(num_conditions):
-    condition = {}
-    name_condition = input(f'What is the name of the condition {i} (string) :')
-    condition['name'] = name_condition
-    num_participant = input('What is the number of participants (int) :')
-    num_participant = check_int(num_participant,0)
-    condition['N'] = num_participant
-    for var in variables_input:
-        var_value = input(f'Value of {var} in condition: {condition["name"]} - onlroy high/low possible [h/l]: ')
-        try:
-            condition[var] = library_variables[var][var_value]
-        except KeyError:
-            print(f'{var_value} is not a valid entry')
-            exit()
 
-    print(condition)
-    new_experiment.register_condition(condition)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Set up an experiment and run it')
+    parser.add_argument('--config', help='JSON configuration file, if not given the experiment is set up interactively')
+    parser.add_argument('--plots', default=os.path.join(os.getcwd(),'plots'), help='directory the plot is saved to')
+    parser.add_argument('--dry-run', action='store_true', help='only print the summary of the experiment')
+    args = parser.parse_args(argv)
 
+    config = load_config(args.config) if args.config else interactive()
+    new_experiment = build_experiment(config)
 
-## Create a summary of the experiment
+    ## Create a summary of the experiment
 
-new_experiment.summary()
-
-# Run it
+    new_experiment.summary()
 
-yes = input('Do you want to run the experiment [y/n]: ')
-
-valid_answer = True
+    # Run it
 
-while valid_answer:
-    if yes=='y':
+    if config.get('run', True) and not args.dry_run:
+        # Check whether directory exists, if not create it
+        if not os.path.exists(args.plots):
+            os.makedirs(args.plots)
         new_experiment.run()
-        new_experiment.plot_result(False,directory)
-        valid_answer=False
-    elif yes=='n':
-        valid_answer=False
-        pass
-    else:
-        print('This was not a valid answer')
-        yes = input('Next try: ')
+        new_experiment.plot_result(False,args.plots)
 
 
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,10 @@ setup(
     author='Niklas Höpner',
     author_email='nhopner@gmail.com',
     description='A simple framework for simulating experiments about the self-serving bias',
-    python_requires='>3.5',
-    install_requires=['pyro-ppl','tqdm','numpy','matplotlib']
+    python_requires='>=3.7',
+    install_requires=['pyro-ppl','tqdm','numpy','matplotlib'],
+    py_modules=['analysis','benchmarks','cli','experiment','experiments','generative_processes','human',
+                'inference_util','numpy_backend','posterior_table','profiling','run_experiments','stats','store',
+                'sweep','utils'],
+    entry_points={'console_scripts': ['cog-sim=cli:main']}
 )
@@ -0,0 +1,186 @@
+# Constant-memory summaries of the attributions of an experiment
+
+import math
+
+import numpy as np
+
+
+class RunningStats(object):
+    '''
+    Running count, mean and sum of squared deviations of a stream of values (Welford's algorithm).
+
+    Batches of values are added with the pairwise update of Chan et al., so the state of summaries that
+    were kept separately (e.g. by several workers or for several conditions) can be merged into the
+    summary of all their values.
+    '''
+
+    def __init__(self, n=0, mean=0., m2=0.):
+        '''
+        :param n: (int) number of values
+        :param mean: (float) mean of the values
+        :param m2: (float) sum of the squared deviations from the mean
+        '''
+
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, values):
+        '''
+        Add a value or a batch of values
+
+        :param values: (float/iterable)
+        '''
+
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) == 0:
+            return
+        mean = values.mean()
+        self.merge(RunningStats(len(values), mean, ((values - mean) ** 2).sum()))
+
+    def merge(self, other):
+        '''
+        Add the values of another summary
+
+        :param other: (RunningStats)
+        :return: (RunningStats) self
+        '''
+
+        n = self.n + other.n
+        if n == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta ** 2 * self.n * other.n / n
+        self.n = n
+        return self
+
+    @classmethod
+    def combine(cls, summaries):
+        '''
+        :param summaries: (iterable) of RunningStats
+        :return: (RunningStats) summary of the values of all summaries
+        '''
+
+        result = cls()
+        for elem in summaries:
+            result.merge(elem)
+        return result
+
+    def variance(self, ddof=0):
+        '''
+        :param ddof: (int) delta degrees of freedom, as for np.var
+        :return: (float) NaN if there are not more than ddof values
+        '''
+
+        if self.n <= ddof:
+            return float('nan')
+        return self.m2 / (self.n - ddof)
+
+    def std(self, ddof=0):
+        '''
+        :param ddof: (int) delta degrees of freedom, as for np.std
+        :return: (float)
+        '''
+        return float(np.sqrt(self.variance(ddof)))
+
+    def se(self, ddof=0):
+        '''
+        :param ddof: (int) delta degrees of freedom of the standard deviation
+        :return: (float) standard error of the mean
+        '''
+        return self.std(ddof) / np.sqrt(self.n) if self.n else float('nan')
+
+    def __repr__(self):
+        return f'RunningStats(n={self.n}, mean={self.mean}, m2={self.m2})'
+
+
+def incomplete_beta(a, b, x):
+    '''
+    Regularized incomplete beta function I_x(a, b), evaluated with the continued fraction of
+    Numerical Recipes (modified Lentz's method)
+
+    :param a: (float) > 0
+    :param b: (float) > 0
+    :param x: (float) in [0, 1]
+    :return: (float)
+    '''
+
+    if x <= 0 or x >= 1:
+        return float(x >= 1)
+    if x > (a + 1) / (a + b + 2):
+        # The continued fraction converges quickly on the other side
+        return 1 - incomplete_beta(b, a, 1 - x)
+    tiny = 1e-300
+    c, d = 1., 1 - (a + b) * x / (a + 1)
+    d = 1 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 10000):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1 + numerator * d
+            d = 1 / (d if abs(d) > tiny else tiny)
+            c = 1 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+        if abs(d * c - 1) < 1e-15:
+            break
+    return math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1 - x)) * h / a
+
+
+def invert_two_sided(two_sided, p):
+    '''
+    Quantile of a distribution that is symmetric around zero
+
+    :param two_sided: (function) t -> P(|T| > t), decreasing in t
+    :param p: (float) probability in (0, 1)
+    :return: (float) q with P(T <= q) = p
+    '''
+
+    if not 0 < p < 1:
+        raise ValueError('The probability of a quantile has to be in (0, 1)')
+    tail = 2 * min(p, 1 - p)
+    low, high = 0., 1.
+    while two_sided(high) > tail:
+        low, high = high, 2 * high
+    for _ in range(200):
+        middle = (low + high) / 2
+        if two_sided(middle) > tail:
+            low = middle
+        else:
+            high = middle
+        if high - low <= 1e-12 * high:
+            break
+    return math.copysign((low + high) / 2, p - 0.5)
+
+
+def normal_quantile(p):
+    '''
+    :param p: (float) probability in (0, 1)
+    :return: (float) quantile of the standard normal distribution
+    '''
+    return invert_two_sided(lambda t: math.erfc(t / math.sqrt(2)), p)
+
+
+def student_t_quantile(p, df):
+    '''
+    Quantile of Student's t distribution, i.e. the inverse of its cumulative distribution function
+
+    :param p: (float) probability in (0, 1)
+    :param df: (float) degrees of freedom
+    :return: (float)
+    '''
+
+    # P(|T| > t) = I_{df / (df + t^2)}(df / 2, 1 / 2)
+    return invert_two_sided(lambda t: incomplete_beta(df / 2, 0.5, df / (df + t ** 2)), p)
+
+
+def obrien_fleming(alpha, t):
+    '''
+    Alpha spending function of O'Brien-Fleming type (Lan & DeMets), alpha(t) = 2 - 2 Phi(z_{1-alpha/2} / sqrt(t))
+
+    :param alpha: (float) error probability of all looks together
+    :param t: (float) information fraction in (0, 1], e.g. n / max_N
+    :return: (float) error probability that is spent up to t, alpha at t = 1
+    '''
+    return math.erfc(normal_quantile(1 - alpha / 2) / math.sqrt(2 * t))
@@ -0,0 +1,339 @@
+# On-disk storage of experiment results
+
+from collections.abc import Mapping
+import hashlib
+import inspect
+import json
+import os
+import re
+
+import numpy as np
+
+from utils import Variable
+
+
+def records_to_array(records):
+    '''
+    :param records: (list) participant records with the keys 'participant', 'attribution', 'branch' and 'values'
+    :return: (np.array) structured array with one row per record
+    '''
+
+    names = sorted(records[0]['values']) if records else []
+    dtype = [('participant', 'i8'), ('attribution', 'f8'), ('branch', 'i1')] + [(name, 'f8') for name in names]
+    return np.array([(record['participant'], record['attribution'], record['branch'],
+                      *[record['values'][name] for name in names]) for record in records], dtype=dtype)
+
+
+def array_to_records(array):
+    '''
+    :param array: (np.array) structured array, see records_to_array
+    :return: (list) participant records
+    '''
+
+    names = [name for name in array.dtype.names if name not in ('participant', 'attribution', 'branch')]
+    return [{'participant': int(row['participant']), 'attribution': float(row['attribution']),
+             'branch': int(row['branch']), 'values': {name: float(row[name]) for name in names}} for row in array]
+
+
+class ResultStore(object):
+    '''
+    Append-only store of the participant records of an experiment.
+
+    The records of each condition are written in chunks of .npy files (structured arrays with the
+    participant index, attribution, branch and the values of the Variables). A manifest keeps the
+    number of stored records of each condition, every written chunk is a checkpoint a run can be
+    resumed from.
+    '''
+
+    def __init__(self, directory, chunk_size=100):
+        '''
+        :param directory: (string) directory the results are stored in, it is created if it does not exist
+        :param chunk_size: (int) number of records per chunk
+        '''
+
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.buffers = {}
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'seed': None, 'conditions': {}}
+
+    def write_manifest(self):
+        '''
+        Atomically replace the manifest on disk
+        '''
+
+        path = self.manifest_path + '.tmp'
+        with open(path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(path, self.manifest_path)
+
+    def get_seed(self):
+        '''
+        :return: (int) seed of the stored run, None if nothing has been stored yet
+        '''
+        return self.manifest['seed']
+
+    def set_seed(self, seed):
+        '''
+        :param seed: (int) seed of the run the records belong to
+        '''
+        self.manifest['seed'] = seed
+        self.write_manifest()
+
+    def count(self, condition):
+        '''
+        Number of records of a condition that are on disk
+
+        :param condition: (string) name of the condition
+        :return: (int)
+        '''
+
+        if condition not in self.manifest['conditions']:
+            return 0
+        return self.manifest['conditions'][condition]['count']
+
+    def append(self, condition, record):
+        '''
+        Add the record of a participant. It is written to disk once the chunk is full.
+
+        :param condition: (string) name of the condition
+        :param record: (dict) with the keys 'participant', 'attribution', 'branch' and 'values'
+        '''
+
+        buffer = self.buffers.setdefault(condition, [])
+        buffer.append(record)
+        if len(buffer) >= self.chunk_size:
+            self.flush(condition)
+
+    def flush(self, condition=None):
+        '''
+        Write the buffered records of a condition (default: of all conditions) to disk
+
+        :param condition: (string) name of the condition
+        '''
+
+        if condition is None:
+            for name in list(self.buffers):
+                self.flush(name)
+            return
+
+        records = self.buffers.pop(condition, [])
+        if not records:
+            return
+        if condition not in self.manifest['conditions']:
+            # A short hash of the name keeps conditions apart whose names only differ in special characters
+            directory = re.sub(r'[^\w.-]+', '_', condition) + '-' + hashlib.sha256(condition.encode()).hexdigest()[:8]
+            self.manifest['conditions'][condition] = {'directory': directory, 'count': 0, 'chunks': []}
+        entry = self.manifest['conditions'][condition]
+        directory = os.path.join(self.directory, entry['directory'])
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        array = records_to_array(records)
+
+        # Write the chunk before it is registered in the manifest
+        chunk = f'chunk_{len(entry["chunks"]):05d}.npy'
+        path = os.path.join(directory, chunk)
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, array)
+        os.replace(path + '.tmp', path)
+        entry['chunks'].append(chunk)
+        entry['count'] += len(records)
+        self.write_manifest()
+
+    def load(self, condition):
+        '''
+        Read all records of a condition, the chunks are memory-mapped
+
+        :param condition: (string) name of the condition
+        :return: (np.array) structured array
+        '''
+
+        entry = self.manifest['conditions'].get(condition)
+        if entry is None:
+            return np.zeros(0, dtype=[('participant', 'i8'), ('attribution', 'f8'), ('branch', 'i1')])
+        directory = os.path.join(self.directory, entry['directory'])
+        chunks = [np.load(os.path.join(directory, chunk), mmap_mode='r') for chunk in entry['chunks']]
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.concatenate(chunks)
+
+    def results(self, conditions=None):
+        '''
+        :param conditions: (list) names of the conditions, by default all stored conditions
+        :return: (LazyResults) attributions of each condition, read from disk on access
+        '''
+
+        if conditions is None:
+            conditions = list(self.manifest['conditions'])
+        return LazyResults(self, conditions)
+
+
+class LazyResults(Mapping):
+    '''
+    Read-only dictionary with the condition names as keys and the attributions as values.
+    The attributions are only read from the ResultStore when they are accessed.
+    '''
+
+    def __init__(self, store, conditions):
+        '''
+        :param store: (ResultStore)
+        :param conditions: (list) names of the conditions
+        '''
+        self.store = store
+        self.conditions = conditions
+
+    def __getitem__(self, condition):
+        if condition not in self.conditions:
+            raise KeyError(condition)
+        return self.store.load(condition)['attribution']
+
+    def __iter__(self):
+        return iter(self.conditions)
+
+    def __len__(self):
+        return len(self.conditions)
+
+
+def canonical(value, seen=None):
+    '''
+    Turn a value into nested tuples of builtin types whose repr only depends on the content of the value,
+    e.g. functions are described by their source code and arrays by a hash of their data
+
+    :param value: any value of a condition or of the variables of an experiment
+    :param seen: (set) ids of the objects that are being described, to break cycles
+
+    :return: (tuple/builtin)
+    '''
+
+    seen = set() if seen is None else seen
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, np.generic):
+        return canonical(value.item(), seen)
+    if hasattr(value, 'detach') and hasattr(value, 'numpy'):
+        value = value.detach().cpu().numpy()
+    if isinstance(value, np.ndarray):
+        return ('array', str(value.dtype), value.shape, hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest())
+    if id(value) in seen:
+        return ('cycle', type(value).__qualname__)
+    seen = seen | {id(value)}
+    if isinstance(value, Variable):
+        # The order of the parameters matters, they are passed positionally to the distribution
+        return ('Variable', value.internal, value.name, value.dist,
+                tuple((key, canonical(elem, seen)) for key, elem in value.param.items()))
+    if isinstance(value, Mapping):
+        return ('dict', tuple(sorted((repr(key), canonical(elem, seen)) for key, elem in value.items())))
+    if isinstance(value, (list, tuple)):
+        return tuple(canonical(elem, seen) for elem in value)
+    if isinstance(value, (set, frozenset)):
+        return ('set', tuple(sorted(repr(canonical(elem, seen)) for elem in value)))
+    if inspect.isfunction(value) or inspect.ismethod(value):
+        function = getattr(value, '__func__', value)
+        try:
+            source = inspect.getsource(function)
+        except (OSError, TypeError):
+            source = repr((function.__code__.co_code, function.__code__.co_consts))
+        return ('function', function.__qualname__, source, canonical(function.__defaults__, seen))
+    if hasattr(value, '__dict__'):
+        return (type(value).__qualname__, canonical(vars(value), seen))
+    return repr(value)
+
+
+def source_of(obj):
+    '''
+    :param obj: function, class or module
+    :return: (string) source code of the module obj is defined in, empty if it is not available
+    '''
+
+    module = inspect.getmodule(obj)
+    try:
+        return inspect.getsource(module) if module is not None else ''
+    except (OSError, TypeError):
+        return ''
+
+
+def specification_hash(specification):
+    '''
+    :param specification: value that describes e.g. a condition, see canonical
+    :return: (string) SHA-256 of the canonical description of the specification
+    '''
+
+    return hashlib.sha256(repr(canonical(specification)).encode()).hexdigest()
+
+
+class ConditionCache(object):
+    '''
+    Content-addressed store of the participant records of whole conditions.
+
+    The records of a condition are saved under the hash of its full specification (see
+    Experiment.get_condition_key), so a rerun of an experiment only simulates the conditions whose
+    specification is new or has changed and loads the others. An index maps the hashes to the names of
+    the experiments and conditions they were computed for.
+    '''
+
+    def __init__(self, directory):
+        '''
+        :param directory: (string) directory the results are stored in, it is created if it does not exist
+        '''
+
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.index_path = os.path.join(directory, 'index.json')
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_path(self, key):
+        '''
+        :param key: (string) hash of the specification of a condition
+        :return: (string) path of the .npy file of the condition
+        '''
+        return os.path.join(self.directory, key[:2], f'{key}.npy')
+
+    def __contains__(self, key):
+        return os.path.exists(self.get_path(key))
+
+    def load(self, key):
+        '''
+        :param key: (string) hash of the specification of a condition
+        :return: (np.array) structured array of the records, None if the condition is not in the cache
+        '''
+
+        if key not in self:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.load(self.get_path(key))
+
+    def save(self, key, array, description=None):
+        '''
+        :param key: (string) hash of the specification of a condition
+        :param array: (np.array) structured array of the records, see records_to_array
+        :param description: (dict) e.g. names of the experiment and the condition, kept in the index
+        '''
+
+        path = self.get_path(key)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, np.asarray(array))
+        os.replace(path + '.tmp', path)
+        self.index[key] = description or {}
+        path = self.index_path + '.tmp'
+        with open(path, 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(path, self.index_path)
@@ -0,0 +1,186 @@
+# Parameter sweeps: an experiment with one condition per point of a grid over parameters of Variables
+
+import os
+
+import numpy as np
+
+from experiment import Experiment
+from utils import Variable
+
+
+class Sweep(object):
+    '''
+    Class to support simulating an experiment over a grid of parameter values
+
+    Each axis of the grid sweeps one parameter of a Variable (e.g. the 'mean' of skill or the 'fixed'
+    value of TI) or the value of a plain variable (e.g. success). Every point of the grid becomes a
+    condition of a single Experiment, so the participants of all points are scheduled together across
+    the workers. The mean attribution and its standard error are kept as arrays indexed by the grid
+    coordinates.
+    '''
+
+    def __init__(self, name, human, variables, N, condition=None):
+        '''
+        :param name: (string) Name of the sweep
+        :param human: (Human)
+        :param variables: (dict) variables of the experiment, see Experiment
+        :param N: (int) number of participants at each point of the grid
+        :param condition: (dict) values that are shared by all points of the grid, e.g. {'success': 0}
+        '''
+
+        self.name = name
+        self.human = human
+        self.variables = variables
+        self.N = N
+        self.condition = dict(condition) if condition is not None else {}
+        self.axes = []
+        self.experiment = None
+        self.mean = None
+        self.se = None
+        self.counts = None
+
+    def add_axis(self, variable, key, values):
+        '''
+        Add an axis to the grid
+
+        :param variable: (string) name of the variable
+        :param key: (string) key of the param of the Variable that is swept (e.g. 'mean', 'std', 'fixed'),
+                             None if the value of the variable itself is swept
+        :param values: (iterable) values of the parameter, e.g. np.linspace(-1, 4, 11)
+        '''
+
+        if key is not None:
+            base = self.condition.get(variable, self.variables.get(variable))
+            if not isinstance(base, Variable):
+                raise TypeError(f'{variable} is not a Variable, sweep its value with key=None')
+            if key not in base.param:
+                raise KeyError(f'{variable} has no parameter {key}, its parameters are {", ".join(base.param)}')
+        values = [elem.item() if isinstance(elem, np.generic) else elem for elem in values]
+        self.axes.append({'variable': variable, 'key': key, 'values': values})
+
+    @property
+    def shape(self):
+        return tuple(len(axis['values']) for axis in self.axes)
+
+    def get_label(self, axis):
+        '''
+        :param axis: (dict) axis of the grid
+        :return: (string) e.g. 'skill.mean'
+        '''
+        return axis['variable'] if axis['key'] is None else f'{axis["variable"]}.{axis["key"]}'
+
+    def get_condition(self, coordinates):
+        '''
+        Set up the condition of a point of the grid
+
+        :param coordinates: (tuple) index of the value on each axis
+        :return: (dict) condition, see Experiment.register_condition
+        '''
+
+        condition = dict(self.condition)
+        names = []
+        for axis, i in zip(self.axes, coordinates):
+            value = axis['values'][i]
+            variable = axis['variable']
+            if axis['key'] is None:
+                condition[variable] = value
+            else:
+                # Several axes can sweep parameters of the same Variable
+                base = condition.get(variable, self.variables.get(variable))
+                param = type(base.param)(base.param)
+                param[axis['key']] = value
+                condition[variable] = Variable(base.internal, base.name, base.dist, param)
+            names.append(f'{self.get_label(axis)}={value}')
+        condition['name'] = ', '.join(names)
+        condition['N'] = self.N
+        return condition
+
+    def build_experiment(self):
+        '''
+        :return: (Experiment) with one condition per point of the grid, in the order of np.ndindex(self.shape)
+        '''
+
+        if not self.axes:
+            raise ValueError('The sweep has no axes, see Sweep.add_axis')
+        experiment = Experiment(self.name, self.human, self.variables)
+        for coordinates in np.ndindex(*self.shape):
+            experiment.register_condition(self.get_condition(coordinates))
+        return experiment
+
+    def run(self, batched=False, workers=1, seed=None, store=None, common_random_numbers=False, cache=None,
+            online=False):
+        '''
+        Run the experiment of the grid and summarise its results, see Experiment.run for the arguments
+        '''
+
+        self.experiment = self.build_experiment()
+        self.experiment.run(batched=batched, workers=workers, seed=seed, store=store,
+                            common_random_numbers=common_random_numbers, cache=cache, online=online)
+        self.summarise()
+
+    def summarise(self):
+        '''
+        Compute the mean attribution, its standard error and the number of participants at each point of the grid
+        '''
+
+        self.mean = np.full(self.shape, np.nan)
+        self.se = np.full(self.shape, np.nan)
+        self.counts = np.zeros(self.shape, dtype=int)
+        summaries = self.experiment.get_summaries()
+        for coordinates, condition in zip(np.ndindex(*self.shape), self.experiment.conditions):
+            summary = summaries[condition['name']]
+            self.counts[coordinates] = summary.n
+            if summary.n:
+                self.mean[coordinates] = summary.mean
+                self.se[coordinates] = summary.se()
+
+    def curve(self, axis=0, coordinates=None):
+        '''
+        Dose-response curve along one axis of the grid
+
+        :param axis: (int) index of the axis
+        :param coordinates: (tuple) index of the value on each of the other axes, by default the first values
+
+        :return: values (list), mean (np.array), se (np.array)
+        '''
+
+        index = list(coordinates) if coordinates is not None else [0] * (len(self.axes) - 1)
+        index.insert(axis, slice(None))
+        return self.axes[axis]['values'], self.mean[tuple(index)], self.se[tuple(index)]
+
+    def plot_result(self, plot, directory):
+        '''
+        Plot the mean attribution along the first axis, one curve per value of the second axis
+
+        :param plot: (bool) If true: additionally to saving the plot it also outputs it.
+        :param directory: (string) directory the plot is saved to
+        '''
+        import matplotlib.pyplot as plt
+
+        if len(self.axes) > 2:
+            raise ValueError('Only sweeps with one or two axes can be plotted, use Sweep.curve')
+        plt.clf()
+        others = self.axes[1]['values'] if len(self.axes) == 2 else [None]
+        for j, other in enumerate(others):
+            values, mean, se = self.curve(0, (j,) if other is not None else ())
+            label = f'{self.get_label(self.axes[1])}={other}' if other is not None else None
+            plt.errorbar(values, mean, yerr=se, fmt='o-', capsize=3, label=label)
+        if len(self.axes) == 2:
+            plt.legend()
+        plt.title(self.name)
+        plt.xlabel(self.get_label(self.axes[0]))
+        plt.ylabel('Level of internal attribution')
+        plt.savefig(os.path.join(directory, self.name + ' Sweep '))
+        if plot:
+            plt.show()
+
+    def save(self, path):
+        '''
+        Save the grid and the summarised results as .npz
+
+        :param path: (string)
+        '''
+
+        axes = {f'axis_{i}': np.asarray(axis['values']) for i, axis in enumerate(self.axes)}
+        np.savez(path, mean=self.mean, se=self.se, counts=self.counts,
+                 labels=np.array([self.get_label(axis) for axis in self.axes]), **axes)
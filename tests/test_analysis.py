@@ -0,0 +1,83 @@
+# Checks of the bootstrap and of the permutation tests on data with a known distribution
+
+import numpy as np
+import pytest
+
+from analysis import analyse
+from analysis import bootstrap
+from analysis import interaction
+from analysis import permutation_test
+
+contrast = {'high': 1, 'low': -1}
+design = {'SA': {'PI0SA1': 0.5, 'PI1SA1': 0.5, 'PI0SA0': -0.5, 'PI1SA0': -0.5},
+          'SA x PI': interaction('PI1SA1', 'PI1SA0', 'PI0SA1', 'PI0SA0')}
+strata = {'SA': [['PI0SA1', 'PI0SA0'], ['PI1SA1', 'PI1SA0']]}
+
+
+def two_conditions(seed, effect=0., n=50):
+    rng = np.random.default_rng(seed)
+    return {'high': rng.normal(effect, 1, n), 'low': rng.normal(0, 1, n)}
+
+
+def two_by_two(seed, n=20):
+    '''
+    Large effect of PI, no effect of SA and no interaction
+    '''
+    rng = np.random.default_rng(seed)
+    return {f'PI{pi}SA{sa}': rng.normal(3. * pi, 1, n) for pi in (0, 1) for sa in (0, 1)}
+
+
+def test_bootstrap_coverage():
+    covered = [bootstrap(two_conditions(seed), contrast, 1000, seed=seed)['ci'] for seed in range(200)]
+    coverage = np.mean([lower <= 0 <= upper for lower, upper in covered])
+    assert 0.9 <= coverage <= 0.99
+
+
+def test_bootstrap_se():
+    results = two_conditions(0, n=400)
+    # Standard error of the difference of two means of 400 values with variance 1
+    assert bootstrap(results, contrast, 4000, seed=0)['se'] == pytest.approx(np.sqrt(2 / 400), rel=0.1)
+
+
+@pytest.mark.parametrize('paired', [False, True])
+def test_permutation_null(paired):
+    p_values = np.array([permutation_test(two_conditions(seed), contrast, 499, paired, seed)['p_value']
+                         for seed in range(200)])
+    assert 0.01 <= np.mean(p_values < 0.05) <= 0.1
+    # Uniform under the null hypothesis
+    assert np.mean(p_values) == pytest.approx(0.5, abs=0.06)
+
+
+def test_permutation_alternative():
+    assert permutation_test(two_conditions(0, effect=1.), contrast, 999, seed=0)['p_value'] == pytest.approx(1 / 1000)
+
+
+def test_permutation_is_reproducible():
+    results = two_conditions(0)
+    assert permutation_test(results, contrast, 999, seed=3) == permutation_test(results, contrast, 999, seed=3)
+
+
+@pytest.mark.parametrize('paired', [False, True])
+def test_restricted_permutation_null(paired):
+    # Shuffling within the levels of PI keeps its effect out of the permutation distribution of SA
+    p_values = np.array([permutation_test(two_by_two(seed), design['SA'], 499, paired, seed, strata=strata['SA'])['p_value']
+                         for seed in range(200)])
+    assert 0.01 <= np.mean(p_values < 0.05) <= 0.1
+
+
+def test_permutation_needs_strata():
+    with pytest.raises(ValueError):
+        permutation_test(two_by_two(0), design['SA'])
+    with pytest.raises(ValueError):
+        permutation_test(two_by_two(0), design['SA'], strata=[['PI0SA1', 'PI1SA1'], ['PI0SA0', 'PI1SA0']])
+
+
+def test_analyse_bootstraps_interaction_only():
+    class Experiment(object):
+        results = two_by_two(0)
+        common_random_numbers = False
+
+    analysis = analyse(Experiment, design, 499, seed=0, strata=strata)
+    assert 'p_value' in analysis['SA']
+    assert 'p_value' not in analysis['SA x PI']
+    assert analysis['SA x PI']['ci'][0] <= analysis['SA x PI']['estimate'] <= analysis['SA x PI']['ci'][1]
@@ -0,0 +1,58 @@
+# Smoke tests of the subcommands of cog-sim
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from cli import main
+
+
+@pytest.mark.parametrize('argv', [['list'], ['run', '--all', '--dry-run'], ['sweep', 'task-importance', '--dry-run']])
+def test_lazy_imports(argv):
+    # The commands that do not simulate anything start without torch, pyro and matplotlib
+    code = ('import sys; from cli import main; status = main(sys.argv[1:]); '
+            'print(status, *sorted(name for name in ("torch", "pyro", "matplotlib") if name in sys.modules))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', code] + argv, cwd=root, capture_output=True, text=True, check=True)
+    assert output.stdout.split('\n')[-2] == '0'
+
+
+@pytest.mark.parametrize('argv', [['run', 'duval-silvia', '--dry-run'], ['run', '--all', '--dry-run'],
+                                  ['sweep', 'task-importance', '--dry-run']])
+def test_dry_run(argv):
+    assert main(['--headless'] + argv) == 0
+
+
+def test_unknown_names():
+    assert main(['run', 'unknown']) == 1
+    assert main(['sweep', 'unknown']) == 1
+    assert main(['run']) == 1
+
+
+def test_run_and_plot(tmp_path):
+    store, plots = str(tmp_path / 'results'), str(tmp_path / 'plots')
+    assert main(['--headless', 'run', 'duval-silvia', '--L', '10', '--seed', '0', '--store', store, '--plots', plots,
+                 '--analyse', '--resamples', '100']) == 0
+    assert any(name.endswith('Analysis.json') for name in os.listdir(plots))
+    replotted = str(tmp_path / 'replotted')
+    assert main(['--headless', 'plot', os.path.join(store, 'duval-silvia'), '--plots', replotted]) == 0
+    assert os.listdir(replotted)
+
+
+def test_sweep(tmp_path):
+    plots = str(tmp_path / 'plots')
+    assert main(['--headless', 'sweep', 'task-importance', '--points', '2', '--N', '2', '--L', '10', '--seed', '0',
+                 '--plots', plots]) == 0
+    assert os.path.exists(os.path.join(plots, 'sweep-task-importance.npz'))
+
+
+def test_sequential(tmp_path):
+    assert main(['--headless', 'run', 'task-importance', '--sequential', 'HighTI - LowTI', '--max-N', '10',
+                 '--batch-size', '5', '--L', '10', '--seed', '0', '--plots', str(tmp_path)]) == 0
+
+
+@pytest.mark.parametrize('option', [['--store', 'results'], ['--cache', 'cache'], ['--online']])
+def test_sequential_options_conflict(option):
+    assert main(['run', 'task-importance', '--sequential', 'HighTI - LowTI'] + option) == 1
@@ -0,0 +1,126 @@
+# Checks of small runs of an experiment of experiments.py
+
+import numpy as np
+import pytest
+
+from experiments import build_experiment
+from experiments import contrasts
+from experiments import setup
+
+
+@pytest.fixture
+def experiment():
+    '''
+    Effect of Task Importance with 10 participants per condition and 20 particles per inference call
+    '''
+    human, variables = setup()
+    variables['L'] = 20
+    experiment = build_experiment('task-importance', human, variables)
+    for elem in experiment.conditions:
+        elem['N'] = 10
+    return experiment
+
+
+def test_online_matches_results(experiment):
+    experiment.run(seed=0)
+    results = {name: np.asarray(value, dtype=float) for name, value in experiment.results.items()}
+    experiment.run(seed=0, online=True)
+    summaries = experiment.get_summaries()
+    assert set(summaries) == set(results)
+    for name, value in results.items():
+        assert summaries[name].n == len(value)
+        assert summaries[name].mean == pytest.approx(value.mean(), rel=1e-9)
+        assert summaries[name].variance(ddof=1) == pytest.approx(np.var(value, ddof=1), rel=1e-9)
+
+
+def test_sequential(experiment):
+    contrast = contrasts['task-importance']['HighTI - LowTI']
+    sequential = experiment.run_sequential(contrast, batch_size=10, max_N=40, alpha=0.05, seed=0)
+    assert sequential['reason'] == 'excludes zero'
+    assert sequential['N'] < 40
+    looks = sequential['looks']
+    assert [elem['N'] for elem in looks] == list(range(10, sequential['N'] + 1, 10))
+    # The alpha of the looks is spent, never more than alpha in total
+    assert sum(elem['alpha'] for elem in looks) <= 0.05
+    for elem in looks:
+        assert elem['ci'][0] <= elem['estimate'] <= elem['ci'][1]
+    assert looks[-1]['ci'][1] < 0 or looks[-1]['ci'][0] > 0
+    # The participants are the first ones of a run with max_N participants per condition
+    results = {name: list(value) for name, value in experiment.results.items()}
+    for elem in experiment.conditions:
+        elem['N'] = 40
+    experiment.run(seed=0)
+    for name, value in results.items():
+        assert value == pytest.approx(list(experiment.results[name])[:sequential['N']])
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_workers_match_serial(experiment, batched):
+    # Every participant has its own random stream, the results do not depend on the number of processes
+    experiment.run(batched=batched, seed=0)
+    serial = {name: list(value) for name, value in experiment.results.items()}
+    experiment.run(batched=batched, workers=2, seed=0)
+    assert set(experiment.results) == set(serial)
+    for name, value in serial.items():
+        assert list(experiment.results[name]) == value
+
+
+@pytest.mark.parametrize('batched', [False, True])
+@pytest.mark.parametrize('crash', [False, True])
+def test_resume_matches_uninterrupted(experiment, tmp_path, batched, crash):
+    from store import ResultStore
+
+    complete = ResultStore(str(tmp_path / 'complete'), chunk_size=3)
+    experiment.run(batched=batched, seed=0, store=complete)
+    # Stop the run after 13 participants, the first condition is done and the second one is interrupted
+    store = ResultStore(str(tmp_path / 'interrupted'), chunk_size=3)
+    records = experiment.iter_run(batched=batched, seed=0, store=store)
+    for _ in range(13):
+        next(records)
+    if crash:
+        # Only the chunks that were written before the crash are kept
+        store.buffers.clear()
+    records.close()
+    store = ResultStore(str(tmp_path / 'interrupted'))
+    stored = sum(store.count(elem['name']) for elem in experiment.conditions)
+    assert stored == (12 if crash else 13)
+    # A new run on the store only simulates the missing participants
+    resumed = list(experiment.iter_run(batched=batched, store=store))
+    assert len(resumed) == 20 - stored
+    store = ResultStore(str(tmp_path / 'interrupted'))
+    for elem in experiment.conditions:
+        expected = complete.load(elem['name'])
+        assert list(store.load(elem['name'])['participant']) == list(range(10))
+        assert list(store.load(elem['name'])['attribution']) == list(expected['attribution'])
+
+
+@pytest.mark.parametrize('common_random_numbers', [False, True])
+def test_common_random_numbers(common_random_numbers):
+    # With common random numbers participant i of every condition has the same values of the Variables that
+    # are not fixed by the condition, even though each condition fixes other Variables (SA and PI)
+    human, variables = setup()
+    variables['L'] = 20
+    experiment = build_experiment('duval-silvia', human, variables)
+    for elem in experiment.conditions:
+        elem['N'] = 5
+    values = {}
+    for record in experiment.iter_run(seed=0, common_random_numbers=common_random_numbers):
+        values.setdefault(record['participant'], []).append(record['values'])
+    shared = ('skill', 'effort', 'external', 'luck')
+    for records in values.values():
+        assert len(records) == experiment.n_conditions
+        equal = all(elem[name] == records[0][name] for elem in records for name in shared)
+        assert equal == common_random_numbers
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_iter_run_matches_run(experiment, workers):
+    experiment.run(seed=0)
+    results = {name: list(value) for name, value in experiment.results.items()}
+    records = list(experiment.iter_run(workers=workers, seed=0))
+    # The records of a condition come in the order of its participants
+    for index, elem in enumerate(experiment.conditions):
+        streamed = [record for record in records if record['condition_index'] == index]
+        assert [record['participant'] for record in streamed] == list(range(elem['N']))
+        assert all(record['condition'] == elem['name'] for record in streamed)
+        assert [record['attribution'] for record in streamed] == results[elem['name']]
@@ -0,0 +1,69 @@
+# Checks of the process model of Human.inference with different inference engines
+
+import numpy as np
+import pytest
+
+from experiments import build_experiment
+from experiments import setup
+from inference_util import LW
+from inference_util import Quadrature
+
+
+def run_condition(name, N, inference_options, batched=False, seed=0, **settings):
+    '''
+    :param name: (string) condition of duval-silvia
+    :param N: (int) number of participants
+    :param inference_options: (dict) see experiments.setup
+    :param settings: further entries of the variables, e.g. L or reuse_threshold
+    :return: (np.array) attributions of the participants
+    '''
+    human, variables = setup()
+    variables['L'] = 20
+    variables['inference_options'] = dict(inference_options)
+    variables.update(settings)
+    experiment = build_experiment('duval-silvia', human, variables)
+    experiment.conditions = [dict(elem, N=N) for elem in experiment.conditions if elem['name'] == name]
+    experiment.run(batched=batched, seed=seed)
+    return np.asarray(experiment.results[name], dtype=float)
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_no_reuse_with_quadrature(monkeypatch, batched):
+    # Step 9 (PI0SA1) with a deterministic rule does one inference, the reuse threshold has no effect
+    expected = run_condition('PI0SA1', 4, {'engine': 'quadrature'}, batched)
+
+    def reweight(*args, **kwargs):
+        raise AssertionError('The nodes of a quadrature rule are not reweighted')
+
+    monkeypatch.setattr(Quadrature, 'reweight', reweight)
+    attributions = run_condition('PI0SA1', 4, {'engine': 'quadrature'}, batched, reuse_threshold=0.1)
+    assert attributions == pytest.approx(expected, abs=1e-6)
+
+
+@pytest.mark.parametrize('name', ['PI0SA1', 'PI1SA1'])
+def test_batched_matches_participants(name):
+    # Batched and participant-by-participant runs draw different particles, their condition means agree
+    # within four standard errors of the difference
+    attributions = run_condition(name, 400, {'vectorized': True}, L=100)
+    batched = run_condition(name, 400, {'vectorized': True}, batched=True, L=100)
+    se = np.sqrt((attributions.var(ddof=1) + batched.var(ddof=1)) / 400)
+    assert batched.mean() == pytest.approx(attributions.mean(), abs=4 * se)
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_reuse_matches_new_inference(monkeypatch, batched):
+    # Step 9 (PI0SA1) with the reweighted particles of Step 2 agrees with a new inference within four
+    # standard errors of the difference of the condition means
+    attributions = run_condition('PI0SA1', 400, {'vectorized': True}, batched, L=100)
+    calls = []
+    reweight = LW.reweight
+
+    def counted(self, *args, **kwargs):
+        calls.append(1)
+        return reweight(self, *args, **kwargs)
+
+    monkeypatch.setattr(LW, 'reweight', counted)
+    reused = run_condition('PI0SA1', 400, {'vectorized': True}, batched, L=100, reuse_threshold=0.1)
+    assert calls
+    se = np.sqrt((attributions.var(ddof=1) + reused.var(ddof=1)) / 400)
+    assert reused.mean() == pytest.approx(attributions.mean(), abs=4 * se)
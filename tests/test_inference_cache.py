@@ -0,0 +1,69 @@
+# Checks of the cache of inference calls
+
+import numpy as np
+import pytest
+
+from experiments import build_experiment
+from experiments import setup
+from generative_processes import intuitive_theory
+from inference_util import InferenceCache
+from inference_util import LW
+from utils import Variable
+
+f = {'mean': lambda x: x}
+
+
+def theory_variables(skill_mean=0.):
+    '''
+    :param skill_mean: (float) prior mean of the skill
+    :return: (list) Variables of the intuitive theory, skill and effort are internal
+    '''
+    return [Variable(1, 'skill', 'Normal', {'mean': skill_mean, 'std': 1}),
+            Variable(1, 'effort', 'Normal', {'mean': 0, 'std': 1}),
+            Variable(0, 'external', 'Normal', {'mean': 0, 'std': 1}),
+            Variable(0, 'luck', 'Normal', {'mean': 0, 'std': 1})]
+
+
+def test_hit_and_miss():
+    cache = InferenceCache(maxsize=2)
+    inference_class = LW(intuitive_theory, f, vectorized=True)
+    observation = {'success': 1., 'external': 0., 'luck': 0.}
+    first, _ = cache.inferLW(inference_class, 100, observation, *theory_variables())
+    second, _ = cache.inferLW(inference_class, 100, observation, *theory_variables())
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert second['skill']['mean'] == first['skill']['mean']
+    # Another prior or number of samples is another entry, the least recently used one is evicted
+    cache.inferLW(inference_class, 100, observation, *theory_variables(0.5))
+    cache.inferLW(inference_class, 200, observation, *theory_variables())
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert len(cache.entries) == 2
+    cache.clear()
+    assert (cache.hits, cache.misses, len(cache.entries)) == (0, 0, 0)
+
+
+def test_miss_depends_on_key_only():
+    # A stored result does not depend on the random state of the call that fills it
+    observation = {'success': 1., 'external': 0., 'luck': 0.}
+    results = []
+    for seed in (0, 1):
+        np.random.seed(seed)
+        estimates, _ = InferenceCache().inferLW(LW(intuitive_theory, f, vectorized=True), 100, observation,
+                                                *theory_variables())
+        results.append(estimates['skill']['mean'])
+    assert results[0] == results[1]
+
+
+def test_workers_match_serial():
+    human, variables = setup()
+    variables['L'] = 20
+    human.cache = InferenceCache()
+    experiment = build_experiment('task-importance', human, variables)
+    for elem in experiment.conditions:
+        elem['N'] = 6
+    experiment.run(seed=0)
+    serial = {name: list(value) for name, value in experiment.results.items()}
+    # The conditions share the inference of Step 2, each worker fills its own copy of the cache
+    human.cache.clear()
+    experiment.run(seed=0, workers=2)
+    for name, value in serial.items():
+        assert list(experiment.results[name]) == pytest.approx(value, abs=0)
@@ -0,0 +1,243 @@
+# Checks of the inference engines against closed-form posteriors and against likelihood weighting with many particles
+
+import pyro
+import pyro.distributions
+import pytest
+import torch
+
+from generative_processes import intuitive_theory
+from generative_processes import register_structure
+from inference_util import ImportanceSampling
+from inference_util import LW
+from inference_util import QUADRATURE_MIN_NODES
+from inference_util import Quadrature
+from inference_util import RaoBlackwell
+from utils import Variable
+from utils import sigmoid
+
+f = {'mean': lambda x: x, '2ndMoment': lambda x: x ** 2}
+
+
+def theory_variables(skill_mean=0.):
+    '''
+    :param skill_mean: (float) prior mean of the skill
+    :return: (list) Variables of the intuitive theory, skill and effort are internal
+    '''
+    return [Variable(1, 'skill', 'Normal', {'mean': skill_mean, 'std': 1}),
+            Variable(1, 'effort', 'Normal', {'mean': 0, 'std': 1}),
+            Variable(0, 'external', 'Normal', {'mean': 0, 'std': 1}),
+            Variable(0, 'luck', 'Normal', {'mean': 0, 'std': 1})]
+
+
+def normal_model():
+    '''
+    theta ~ N(0,1), y | theta ~ N(theta,1), so E[theta | y] = y/2
+    '''
+    theta = pyro.sample('theta', pyro.distributions.Normal(0., 1.))
+    return pyro.sample('y', pyro.distributions.Normal(theta, 1.))
+
+
+def precise_model():
+    '''
+    theta ~ N(0,1), y | theta ~ N(theta,0.1), so E[theta | y] = y/1.01, the prior is a poor proposal
+    '''
+    theta = pyro.sample('theta', pyro.distributions.Normal(0., 1.))
+    return pyro.sample('y', pyro.distributions.Normal(theta, 0.1))
+
+
+def self_worth_model(Skill, Effort, External, Luck):
+    '''
+    Intuitive theory with a Gaussian observation of the self-worth skill + effort (as in Step 9 of Human.inference)
+    '''
+    skill = pyro.sample(Skill.name, Skill.return_dist())
+    effort = pyro.sample(Effort.name, Effort.return_dist())
+    external = pyro.sample(External.name, External.return_dist())
+    luck = pyro.sample(Luck.name, Luck.return_dist())
+    pyro.sample('success', pyro.distributions.Bernoulli(sigmoid(skill + effort + external + luck)))
+    return pyro.sample('self_worth', pyro.distributions.Normal(skill + effort, 0.5))
+
+
+register_structure(self_worth_model, {'outcome': 'success',
+                                      'observation': {'site': 'self_worth', 'concept': ['skill', 'effort'], 'std': 0.5}})
+
+
+@pytest.mark.parametrize('success', [0., 1.])
+def test_vectorized_matches_sequential(success):
+    # All particles in one traced execution estimate the same posterior as drawing them one by one
+    observation = {'success': success, 'external': 0., 'luck': 0.}
+    exact, _ = Quadrature(intuitive_theory, f).inferLW(400, observation, *theory_variables(0.5))
+    pyro.set_rng_seed(0)
+    sequential, _ = LW(intuitive_theory, f, vectorized=False).inferLW(2000, observation, *theory_variables(0.5))
+    pyro.set_rng_seed(0)
+    vectorized, _ = LW(intuitive_theory, f, vectorized=True, fast_backend=False).inferLW(
+        20000, observation, *theory_variables(0.5))
+    for name in ('skill', 'effort'):
+        assert sequential[name]['mean'].item() == pytest.approx(exact[name]['mean'].item(), abs=0.1)
+        assert vectorized[name]['mean'].item() == pytest.approx(exact[name]['mean'].item(), abs=0.03)
+
+
+def test_adaptive_stops_at_targets():
+    observation = {'y': torch.tensor(1.)}
+    pyro.set_rng_seed(0)
+    lw = LW(normal_model, f, vectorized=True, adaptive={'ess': 500})
+    lw.inferLW(100, observation)
+    # Chunks of L particles are drawn until the effective sample size is reached
+    assert lw.n_particles > 100 and lw.n_particles % 100 == 0
+    assert lw.ess.item() >= 500
+    lw = LW(normal_model, f, vectorized=True, adaptive={'se': 0.02})
+    estimates, _ = lw.inferLW(100, observation)
+    assert lw.n_particles > 100
+    assert estimates['theta']['mean'].item() == pytest.approx(0.5, abs=0.08)
+    # An unreachable target stops at the maximal number of particles
+    lw = LW(normal_model, f, vectorized=True, adaptive={'ess': 10 ** 6, 'max': 300})
+    lw.inferLW(100, observation)
+    assert lw.n_particles == 300
+
+
+@pytest.fixture(scope='module')
+def reference():
+    '''
+    Posterior of the automatic inference (Step 2 of Human.inference) after a failure and after a success,
+    estimated with likelihood weighting and 200000 particles
+    '''
+    pyro.set_rng_seed(0)
+    lw = LW(intuitive_theory, f, vectorized=True)
+    return {success: lw.inferLW(200000, {'success': success, 'external': 0., 'luck': 0.}, *theory_variables(0.5))[0]
+            for success in (0., 1.)}
+
+
+def test_quadrature_normal_model():
+    estimates, _ = Quadrature(normal_model, f).inferLW(16, {'y': torch.tensor(1.)})
+    assert estimates['theta']['mean'].item() == pytest.approx(0.5, abs=1e-5)
+    # Posterior variance 1/2
+    assert estimates['theta']['2ndMoment'].item() == pytest.approx(0.75, abs=1e-5)
+
+
+@pytest.mark.parametrize('success', [0., 1.])
+def test_quadrature_matches_lw(reference, success):
+    observation = {'success': success, 'external': 0., 'luck': 0.}
+    estimates, _ = Quadrature(intuitive_theory, f).inferLW(400, observation, *theory_variables(0.5))
+    for name in ('skill', 'effort'):
+        for key in f:
+            assert estimates[name][key].item() == pytest.approx(reference[success][name][key].item(), abs=0.01)
+
+
+def test_quadrature_default_nodes():
+    # Step 9 of Human.inference: four unobserved Variables and the Gaussian observation of the self-worth
+    from experiments import setup
+
+    human, variables = setup()
+    human.variables = variables
+    model = human.decorate_self_worth()
+    observation = {'success': 0., 'self-worth': 1.}
+    exact, _ = RaoBlackwell(model, f).inferLW(60, observation, *theory_variables(0.5))
+    # The default number of nodes does not follow the particle budget L below the accuracy floor
+    quadrature = Quadrature(model, f)
+    estimates, _ = quadrature.inferLW(100, observation, *theory_variables(0.5))
+    assert quadrature.n_particles == QUADRATURE_MIN_NODES ** 4
+    for name in ('skill', 'effort', 'external', 'luck'):
+        for key in f:
+            assert estimates[name][key].item() == pytest.approx(exact[name][key].item(), abs=1e-3)
+
+
+def test_quadrature_is_deterministic():
+    observation = {'success': 1., 'external': 0., 'luck': 0.}
+    first, _ = Quadrature(intuitive_theory, f).inferLW(100, observation, *theory_variables())
+    second, _ = Quadrature(intuitive_theory, f).inferLW(100, observation, *theory_variables())
+    assert first['skill']['mean'].item() == second['skill']['mean'].item()
+
+
+@pytest.mark.parametrize('success', [0., 1.])
+def test_rao_blackwell_matches_quadrature(success):
+    observation = {'success': success, 'external': 0., 'luck': 0.}
+    estimates, _ = RaoBlackwell(intuitive_theory, f).inferLW(20, observation, *theory_variables(0.5))
+    exact, _ = Quadrature(intuitive_theory, f).inferLW(400, observation, *theory_variables(0.5))
+    for name in ('skill', 'effort'):
+        for key in f:
+            assert estimates[name][key].item() == pytest.approx(exact[name][key].item(), abs=1e-4)
+
+
+def test_rao_blackwell_gaussian_observation():
+    observation = {'success': 0., 'external': 0., 'luck': 0., 'self_worth': 1.}
+    estimates, _ = RaoBlackwell(self_worth_model, f).inferLW(20, observation, *theory_variables(0.5))
+    pyro.set_rng_seed(0)
+    reference, _ = LW(self_worth_model, f, vectorized=True).inferLW(400000, observation, *theory_variables(0.5))
+    for name in ('skill', 'effort'):
+        for key in f:
+            assert estimates[name][key].item() == pytest.approx(reference[name][key].item(), abs=0.02)
+
+
+def test_rao_blackwell_batch():
+    observation = {'success': torch.tensor([[0.], [1.]]), 'external': 0., 'luck': 0.}
+    estimates, _ = RaoBlackwell(intuitive_theory, f, batch_size=2).inferLW(20, observation, *theory_variables())
+    for i, success in enumerate((0., 1.)):
+        single, _ = RaoBlackwell(intuitive_theory, f).inferLW(20, dict(observation, success=success), *theory_variables())
+        assert estimates['skill']['mean'][i].item() == pytest.approx(single['skill']['mean'].item(), abs=1e-5)
+
+
+def test_laplace_proposal_normal_model():
+    observation = {'y': torch.tensor(2.)}
+    pyro.set_rng_seed(0)
+    importance = ImportanceSampling(precise_model, f)
+    estimates, _ = importance.inferLW(2000, observation)
+    assert estimates['theta']['mean'].item() == pytest.approx(2 / 1.01, abs=0.01)
+    assert estimates['theta']['2ndMoment'].item() == pytest.approx((2 / 1.01) ** 2 + 1 / 101, abs=0.05)
+    # The posterior is Gaussian, so the Laplace proposal is exact and all weights are equal
+    assert importance.ess.item() > 0.99 * 2000
+    lw = LW(precise_model, f, vectorized=True)
+    lw.inferLW(2000, observation)
+    assert lw.ess.item() < 0.1 * 2000
+
+
+def test_laplace_proposal_matches_quadrature():
+    observation = {'success': 1., 'external': 0., 'luck': 0.}
+    pyro.set_rng_seed(0)
+    estimates, _ = ImportanceSampling(intuitive_theory, f).inferLW(5000, observation, *theory_variables(0.5))
+    exact, _ = Quadrature(intuitive_theory, f).inferLW(400, observation, *theory_variables(0.5))
+    for name in ('skill', 'effort'):
+        assert estimates[name]['mean'].item() == pytest.approx(exact[name]['mean'].item(), abs=0.05)
+
+
+def test_qmc_error():
+    # Over repeated randomisations the error of quasi-Monte Carlo is far below the one of pseudo-random particles
+    observation = {'success': 1., 'external': 0., 'luck': 0.}
+    exact, _ = Quadrature(intuitive_theory, f).inferLW(400, observation, *theory_variables(0.5))
+    errors = {False: [], True: []}
+    for qmc in errors:
+        for seed in range(10):
+            pyro.set_rng_seed(seed)
+            lw = LW(intuitive_theory, f, vectorized=True, fast_backend=False, qmc=qmc)
+            estimates, _ = lw.inferLW(256, observation, *theory_variables(0.5))
+            errors[qmc].append(estimates['skill']['mean'].item() - exact['skill']['mean'].item())
+    rmse = {qmc: sum(elem ** 2 for elem in value) ** 0.5 / len(value) ** 0.5 for qmc, value in errors.items()}
+    assert rmse[True] < 0.01
+    assert rmse[True] < rmse[False] / 5
+
+
+def test_qmc_is_reproducible():
+    observation = {'success': 1., 'external': 0., 'luck': 0.}
+    estimates = []
+    for _ in range(2):
+        pyro.set_rng_seed(0)
+        lw = LW(intuitive_theory, f, qmc=True)
+        estimates.append(lw.inferLW(64, observation, *theory_variables())[0]['skill']['mean'].item())
+    assert estimates[0] == estimates[1]
+    # Every copy of the batched mode has its own shift of the points
+    lw = LW(intuitive_theory, f, batch_size=3, qmc=True)
+    batch, _ = lw.inferLW(64, observation, *theory_variables())
+    assert len(set(batch['skill']['mean'].tolist())) == 3
+
+
+@pytest.mark.parametrize('qmc', [False, True])
+def test_reweight_matches_exact(qmc):
+    # As in Step 9 of Human.inference: the particles of the automatic inference are kept and the
+    # external Variables, which were observed there, are drawn again
+    pyro.set_rng_seed(0)
+    lw = LW(self_worth_model, f, vectorized=True, qmc=qmc)
+    lw.inferLW(20000, {'success': 0., 'external': 0., 'luck': 0.}, *theory_variables(0.5))
+    samples = {name: lw.samples[name] for name in ('skill', 'effort')}
+    observation = {'success': 0., 'self_worth': 1.}
+    estimates, _ = lw.reweight(samples, observation, *theory_variables(0.5))
+    exact, _ = RaoBlackwell(self_worth_model, f).inferLW(40, observation, *theory_variables(0.5))
+    for name in ('skill', 'effort', 'external'):
+        assert estimates[name]['mean'].item() == pytest.approx(exact[name]['mean'].item(), abs=0.05)
@@ -0,0 +1,57 @@
+# Checks of the NumPy versions of the generative processes against the pyro versions
+
+import numpy as np
+import pyro
+import pytest
+
+from generative_processes import intuitive_theory
+from inference_util import LW
+from inference_util import Quadrature
+from numpy_backend import NumpyLW
+from utils import Variable
+
+f = {'mean': lambda x: x, '2ndMoment': lambda x: x ** 2}
+
+
+def theory_variables(skill_mean=0.):
+    '''
+    :param skill_mean: (float) prior mean of the skill
+    :return: (list) Variables of the intuitive theory, skill and effort are internal
+    '''
+    return [Variable(1, 'skill', 'Normal', {'mean': skill_mean, 'std': 1}),
+            Variable(1, 'effort', 'Normal', {'mean': 0, 'std': 1}),
+            Variable(0, 'external', 'Normal', {'mean': 0, 'std': 1}),
+            Variable(0, 'luck', 'Normal', {'mean': 0, 'std': 1})]
+
+
+@pytest.mark.parametrize('success', [0., 1.])
+def test_numpy_lw_matches_pyro(success):
+    observation = {'success': success, 'external': 0., 'luck': 0.}
+    exact, _ = Quadrature(intuitive_theory, f).inferLW(400, observation, *theory_variables(0.5))
+    np.random.seed(0)
+    numpy_estimates, _ = NumpyLW(intuitive_theory, f).inferLW(200000, observation, *theory_variables(0.5))
+    pyro.set_rng_seed(0)
+    pyro_estimates, _ = LW(intuitive_theory, f, vectorized=True, fast_backend=False).inferLW(
+        200000, observation, *theory_variables(0.5))
+    for name in ('skill', 'effort'):
+        for key in f:
+            assert numpy_estimates[name][key] == pytest.approx(exact[name][key].item(), abs=0.01)
+            assert pyro_estimates[name][key].item() == pytest.approx(exact[name][key].item(), abs=0.01)
+
+
+def test_numpy_lw_with_fixed_variable():
+    # A fixed Variable is a constant in both versions
+    variables = theory_variables()
+    variables[0] = Variable(1, 'skill', 'fixed', {'fixed': 1.5})
+    observation = {'success': 1., 'external': 0., 'luck': 0.}
+    estimates, _ = NumpyLW(intuitive_theory, f).inferLW(1000, observation, *variables)
+    assert estimates['skill']['mean'] == pytest.approx(1.5)
+
+
+def test_backend_is_picked_automatically():
+    assert LW(intuitive_theory, f).get_backend() is not None
+    assert LW(intuitive_theory, f, vectorized=True).get_backend() is not None
+    # Opt-outs: an explicitly sequential pyro run, fast_backend=False and quasi-Monte Carlo
+    assert LW(intuitive_theory, f, vectorized=False).get_backend() is None
+    assert LW(intuitive_theory, f, fast_backend=False).get_backend() is None
+    assert LW(intuitive_theory, f, qmc=True).get_backend() is None
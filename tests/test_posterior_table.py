@@ -0,0 +1,92 @@
+# Checks of the posterior tables and of the 'table' inference engine against the engine the tables are built with
+
+import numpy as np
+import pytest
+
+from generative_processes import intuitive_theory
+from inference_util import RaoBlackwell
+from inference_util import TableInference
+from posterior_table import PosteriorTable
+from posterior_table import load_tables
+from posterior_table import save_tables
+from utils import Variable
+
+f = {'mean': lambda x: x, '2ndMoment': lambda x: x ** 2}
+
+
+def theory_variables(skill_mean=0.):
+    '''
+    :param skill_mean: (float) prior mean of the skill
+    :return: (list) Variables of the intuitive theory, skill and effort are internal
+    '''
+    return [Variable(1, 'skill', 'Normal', {'mean': skill_mean, 'std': 1}),
+            Variable(1, 'effort', 'Normal', {'mean': 0, 'std': 1}),
+            Variable(0, 'external', 'Normal', {'mean': 0, 'std': 1}),
+            Variable(0, 'luck', 'Normal', {'mean': 0, 'std': 1})]
+
+
+def other_theory(Skill, Effort, External, Luck):
+    '''
+    A different generative process with the same sites
+    '''
+    return intuitive_theory(Skill, Effort, External, Luck)
+
+
+@pytest.fixture(scope='module')
+def table():
+    '''
+    Posterior of the automatic inference (Step 2 of Human.inference) over the prior mean of the skill
+    '''
+    template = {'success': 'success', 'external': 'external.mean', 'luck': 'luck.mean'}
+    table = PosteriorTable('automatic', intuitive_theory, theory_variables(), template, f)
+    table.add_axis('skill.mean', np.linspace(-1, 1, 9))
+    table.add_axis('success', [0., 1.], interpolate=False)
+    table.build('rao-blackwell', 20)
+    return table
+
+
+def observation(success):
+    return {'success': success, 'external': 0., 'luck': 0.}
+
+
+@pytest.mark.parametrize('skill_mean, node', [(0.5, True), (0.6, False)])
+def test_lookup_matches_engine(table, skill_mean, node):
+    for success in (0., 1.):
+        estimates, error = table.lookup(observation(success), theory_variables(skill_mean))
+        exact, _ = RaoBlackwell(intuitive_theory, f).inferLW(20, observation(success), *theory_variables(skill_mean))
+        # Exact at the nodes, between them within the interpolation error of the cell
+        tolerance = 1e-5 if node else error + 1e-5
+        assert error < 0.05
+        for name in ('skill', 'effort'):
+            for key in f:
+                assert estimates[name][key] == pytest.approx(exact[name][key].item(), abs=tolerance)
+
+
+def test_lookup_outside_of_grid(table):
+    assert table.lookup(observation(1.), theory_variables(3.)) is None
+    assert table.lookup(observation(0.5), theory_variables()) is None
+
+
+def test_table_engine(table):
+    inference = TableInference(intuitive_theory, f, tables=[table])
+    estimates, _ = inference.inferLW(100, observation(1.), *theory_variables(0.6))
+    assert inference.error is not None
+    assert estimates['skill']['mean'].item() == pytest.approx(table.lookup(observation(1.), theory_variables(0.6))[0]['skill']['mean'])
+    # Outside of the grid the call is handed to LW
+    estimates, _ = inference.inferLW(100, observation(1.), *theory_variables(3.))
+    assert inference.error is None
+    assert np.isfinite(estimates['skill']['mean'].item())
+
+
+def test_save_and_load(table, tmp_path):
+    save_tables([table], str(tmp_path))
+    loaded, = load_tables(str(tmp_path))
+    assert loaded.model_key == table.model_key
+    assert loaded.lookup(observation(0.), theory_variables(0.6)) == table.lookup(observation(0.), theory_variables(0.6))
+    inference = TableInference(intuitive_theory, f, tables=[loaded])
+    inference.inferLW(100, observation(0.), *theory_variables(0.6))
+    assert inference.error is not None
+    # A table is only used for the generative process it was built for
+    inference = TableInference(other_theory, f, tables=[loaded])
+    inference.inferLW(100, observation(0.), *theory_variables(0.6))
+    assert inference.error is None
@@ -0,0 +1,79 @@
+# Checks of the running summaries against NumPy and of the quantiles and the alpha spending against tabulated values
+
+import numpy as np
+import pytest
+
+from stats import RunningStats
+from stats import normal_quantile
+from stats import obrien_fleming
+from stats import student_t_quantile
+
+
+@pytest.fixture
+def values():
+    return np.random.default_rng(0).normal(3., 2., 1001)
+
+
+def test_update(values):
+    stats = RunningStats()
+    for elem in values:
+        stats.update(elem)
+    assert stats.n == len(values)
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert stats.variance() == pytest.approx(np.var(values), rel=1e-10)
+    assert stats.variance(ddof=1) == pytest.approx(np.var(values, ddof=1), rel=1e-10)
+    assert stats.se(ddof=1) == pytest.approx(values.std(ddof=1) / np.sqrt(len(values)), rel=1e-10)
+
+
+def test_merge(values):
+    # Uneven parts, one of them empty, merged in another order than they were split
+    parts = np.split(values, [1, 1, 300, 301, 800])
+    summaries = []
+    for part in parts:
+        summaries.append(RunningStats())
+        summaries[-1].update(part)
+    stats = RunningStats.combine(summaries[::-1])
+    assert stats.n == len(values)
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert stats.variance() == pytest.approx(np.var(values), rel=1e-10)
+
+
+def test_large_offset():
+    # The pairwise update does not lose the variance next to a large mean
+    values = 1e9 + np.random.default_rng(1).normal(0., 1., 1000)
+    stats = RunningStats()
+    for part in np.split(values, 10):
+        stats.update(part)
+    assert stats.variance(ddof=1) == pytest.approx(np.var(values, ddof=1), rel=1e-6)
+
+
+def test_too_few_values():
+    stats = RunningStats()
+    stats.update([1.])
+    assert np.isnan(stats.variance(ddof=1))
+    assert np.isnan(RunningStats().se())
+
+
+@pytest.mark.parametrize('p, df, quantile', [(0.975, 1, 12.7062047), (0.975, 9, 2.2621572), (0.995, 4, 4.6040949),
+                                             (0.95, 30, 1.6972609), (0.025, 9, -2.2621572), (0.5, 3, 0.)])
+def test_student_t_quantile(p, df, quantile):
+    assert student_t_quantile(p, df) == pytest.approx(quantile, abs=1e-6)
+
+
+def test_student_t_quantile_tends_to_normal():
+    assert student_t_quantile(0.975, 1e7) == pytest.approx(normal_quantile(0.975), abs=1e-5)
+    assert normal_quantile(0.975) == pytest.approx(1.959964, abs=1e-6)
+    assert normal_quantile(1e-12) == pytest.approx(-7.0344838, abs=1e-6)
+    with pytest.raises(ValueError):
+        student_t_quantile(1., 5)
+
+
+def test_obrien_fleming():
+    alpha = 0.05
+    levels = [obrien_fleming(alpha, n / 100) for n in range(10, 101, 10)]
+    # Spends nothing at the start, increases and has spent alpha at the last look
+    assert levels[0] < 1e-5
+    assert np.all(np.diff(levels) > 0)
+    assert levels[-1] == pytest.approx(alpha, abs=1e-10)
+    # Two looks: z_{0.975} * sqrt(2) at the first one
+    assert obrien_fleming(alpha, 0.5) == pytest.approx(0.0055746, abs=1e-7)
@@ -0,0 +1,83 @@
+# Checks of the cache of condition results
+
+import inspect
+
+import numpy as np
+import pytest
+
+import store
+from experiments import build_experiment
+from experiments import setup
+from store import ConditionCache
+from utils import Variable
+
+
+@pytest.fixture
+def experiment():
+    '''
+    Effect of Task Importance with 5 participants per condition and 10 particles per inference call
+    '''
+    human, variables = setup()
+    variables['L'] = 10
+    experiment = build_experiment('task-importance', human, variables)
+    for elem in experiment.conditions:
+        elem['N'] = 5
+    return experiment
+
+
+def simulated(experiment, cache, seed=0):
+    '''
+    :return: (dict) for each condition whether its participants were simulated (not loaded from the cache)
+    '''
+    names = {}
+    for record in experiment.iter_run(seed=seed, cache=cache):
+        names[record['condition']] = record['seconds'] is not None
+    return names
+
+
+def test_rerun_loads_conditions(experiment, tmp_path):
+    cache = ConditionCache(str(tmp_path))
+    experiment.run(seed=0, cache=cache)
+    results = {name: list(value) for name, value in experiment.results.items()}
+    assert simulated(experiment, ConditionCache(str(tmp_path))) == {'HighTI': False, 'LowTI': False}
+    experiment.run(seed=0, cache=ConditionCache(str(tmp_path)))
+    for name, value in results.items():
+        assert list(experiment.results[name]) == value
+    # The name of a condition is not part of its specification
+    experiment.conditions[0]['name'] = 'High task importance'
+    assert not any(simulated(experiment, ConditionCache(str(tmp_path))).values())
+
+
+def test_changed_condition(experiment, tmp_path):
+    cache = ConditionCache(str(tmp_path))
+    experiment.run(seed=0, cache=cache)
+    experiment.conditions[0]['TI'] = Variable(0, 'SA', 'fixed', {'fixed': 3})
+    assert simulated(experiment, cache) == {'HighTI': True, 'LowTI': False}
+    experiment.conditions[1]['N'] = 6
+    assert simulated(experiment, cache) == {'HighTI': False, 'LowTI': True}
+    assert simulated(experiment, cache, seed=1) == {'HighTI': True, 'LowTI': True}
+
+
+def test_changed_source(experiment, tmp_path, monkeypatch):
+    import inference_util
+
+    cache = ConditionCache(str(tmp_path))
+    experiment.run(seed=0, cache=cache)
+    source_of = store.source_of
+
+    def edited(obj):
+        # As if the inference module had been edited since the first run
+        return source_of(obj) + ('\n# edited' if inspect.getmodule(obj) is inference_util else '')
+
+    monkeypatch.setattr(store, 'source_of', edited)
+    assert simulated(experiment, cache) == {'HighTI': True, 'LowTI': True}
+
+
+def test_load_and_save(tmp_path):
+    cache = ConditionCache(str(tmp_path))
+    array = np.zeros(3, dtype=[('participant', int), ('attribution', float)])
+    assert cache.load('ab' * 32) is None
+    cache.save('ab' * 32, array, {'experiment': 'test'})
+    assert 'ab' * 32 in ConditionCache(str(tmp_path))
+    assert (ConditionCache(str(tmp_path)).load('ab' * 32) == array).all()
+    assert (cache.hits, cache.misses) == (0, 1)
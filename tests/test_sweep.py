@@ -0,0 +1,56 @@
+# Checks of parameter sweeps over the Variables of an experiment
+
+import numpy as np
+import pytest
+
+from experiments import setup
+from sweep import Sweep
+
+
+@pytest.fixture
+def sweep():
+    '''
+    Grid over the mean of skill and the value of success with 4 participants per point and 10 particles
+    '''
+    human, variables = setup()
+    variables['L'] = 10
+    sweep = Sweep('Skill and success', human, variables, 4)
+    sweep.add_axis('skill', 'mean', np.linspace(-1, 1, 3))
+    sweep.add_axis('success', None, [0, 1])
+    return sweep
+
+
+def test_grid(sweep):
+    assert sweep.shape == (3, 2)
+    experiment = sweep.build_experiment()
+    assert experiment.n_conditions == 6
+    condition = experiment.conditions[3]
+    assert condition['name'] == 'skill.mean=0.0, success=1'
+    assert condition['skill'].param['mean'] == 0.
+    assert condition['N'] == 4
+    # The Variables of the points are new objects, the default Variable is not changed
+    assert sweep.variables['skill'].param['mean'] == 0
+    assert condition['skill'] is not experiment.conditions[0]['skill']
+    assert experiment.conditions[0]['skill'].param['mean'] == -1.
+
+
+def test_invalid_axes(sweep):
+    with pytest.raises(TypeError):
+        sweep.add_axis('success', 'mean', [0, 1])
+    with pytest.raises(KeyError):
+        sweep.add_axis('skill', 'rate', [1, 2])
+    with pytest.raises(ValueError):
+        Sweep('Empty', sweep.human, sweep.variables, 4).build_experiment()
+
+
+def test_run(sweep):
+    sweep.run(seed=0)
+    assert sweep.mean.shape == sweep.se.shape == (3, 2)
+    assert (sweep.counts == 4).all()
+    assert np.isfinite(sweep.mean).all()
+    for coordinates, condition in zip(np.ndindex(*sweep.shape), sweep.experiment.conditions):
+        results = np.asarray(sweep.experiment.results[condition['name']], dtype=float)
+        assert sweep.mean[coordinates] == pytest.approx(results.mean())
+    values, mean, se = sweep.curve(0, (1,))
+    assert values == [-1., 0., 1.]
+    assert list(mean) == list(sweep.mean[:, 1])
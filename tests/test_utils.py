@@ -0,0 +1,64 @@
+# Checks of the Variables of the psychological process
+
+import pickle
+
+import pyro
+import pytest
+
+from utils import Variable
+
+
+def test_distribution_is_reused():
+    variable = Variable(1, 'skill', 'Normal', {'mean': 0, 'std': 1})
+    assert variable.return_dist() is variable.return_dist()
+
+
+def test_changed_parameters_build_a_new_distribution():
+    variable = Variable(1, 'skill', 'Normal', {'mean': 0, 'std': 1})
+    first = variable.return_dist()
+    variable.param = {'mean': 1, 'std': 1}
+    assert variable.return_dist() is not first
+    assert variable.return_dist().mean.item() == 1
+    # Parameters that are changed in place
+    variable.param['std'] = 2
+    assert variable.return_dist().stddev.item() == 2
+    variable.dist = 'Exponential'
+    variable.param = {'rate': 2}
+    assert variable.return_dist().mean.item() == pytest.approx(0.5)
+
+
+def test_fixed_variable():
+    variable = Variable(0, 'SA', 'fixed', {'fixed': 1})
+    assert variable.current_value == 1
+    variable.sample()
+    assert variable.current_value == 1
+    variable.dist = 'Normal'
+    variable.param = {'mean': 5, 'std': 1e-6}
+    variable.sample()
+    assert variable.current_value.item() == pytest.approx(5)
+
+
+def test_pickle():
+    # The Variables of a condition are sent to the worker processes
+    variable = Variable(1, 'skill', 'Normal', {'mean': 0, 'std': 1})
+    pyro.set_rng_seed(0)
+    variable.sample()
+    copy = pickle.loads(pickle.dumps(variable))
+    assert (copy.internal, copy.name, copy.dist, copy.param) == (1, 'skill', 'Normal', {'mean': 0, 'std': 1})
+    assert copy.current_value == variable.current_value
+    assert copy.return_dist().mean.item() == 0
+
+
+def test_sample_batch():
+    variable = Variable(0, 'external', 'Normal', {'mean': 1, 'std': 2})
+    pyro.set_rng_seed(0)
+    values = variable.sample_batch(5)
+    assert values.shape == (5,)
+    assert variable.current_value is None
+    # The same values as drawing them one by one
+    pyro.set_rng_seed(0)
+    for value in values:
+        variable.sample()
+        assert variable.current_value.item() == value.item()
+    fixed = Variable(0, 'SA', 'fixed', {'fixed': 1})
+    assert fixed.sample_batch(3).tolist() == [1., 1., 1.]
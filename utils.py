@@ -1,16 +1,18 @@
 # Utility functions
 
 import numpy as np
-import pyro.distributions
 
 
 def sigmoid(x):
     '''
-    Implements the sigmoid function for a one-dimensional input
+    Implements the sigmoid function for a one-dimensional input.
+    Tensors are handled by their own sigmoid so that batched traces stay on the tensor side.
 
-    :param x: (float)
-    :return: (float) function value at point x
+    :param x: (float/np.array/torch.tensor)
+    :return: (float/np.array/torch.tensor) function value at point x
     '''
+    if hasattr(x, 'sigmoid'):
+        return x.sigmoid()
     return 1/(1+np.exp(-x))
 
 
@@ -18,11 +20,17 @@ class Variable(object):
     '''
     Class to define a variable that is part of the psychological process.
     Wrapper around pyro.distribution object for easier interface.
+
+    The distribution object is built once and reused until the distribution or its parameters change.
+    Torch and pyro are only imported once a value is drawn, i.e. Variables can be set up without them.
     '''
 
-    distributions = {'Normal': pyro.distributions.Normal, \
-                     'Binomial': pyro.distributions.Binomial, \
-                     'Exponential': pyro.distributions.Exponential, \
+    __slots__ = ('internal', 'name', 'current_value', '_dist', '_param', '_fixed', '_key', '_distribution')
+
+    # Names of the pyro.distributions classes
+    distributions = {'Normal': 'Normal', \
+                     'Binomial': 'Binomial', \
+                     'Exponential': 'Exponential', \
                      'fixed': 0}
 
     def __init__(self, internal, name, dist, param):
@@ -39,7 +47,29 @@ class Variable(object):
         self.name = name
         self.dist = dist
         self.param = param
-        self.sample()
+        # Only a fixed value is known before the first value is drawn
+        self.current_value = None
+        if self._fixed:
+            self.sample()
+
+    @property
+    def dist(self):
+        return self._dist
+
+    @dist.setter
+    def dist(self, dist):
+        self._dist = dist
+        self._fixed = 'fixed' in dist
+        self._distribution = None
+
+    @property
+    def param(self):
+        return self._param
+
+    @param.setter
+    def param(self, param):
+        self._param = param
+        self._distribution = None
 
     def return_dist(self):
         '''
@@ -47,7 +77,13 @@ class Variable(object):
         :return: pyro.distribution object instantiated with the parameters of the Variable
         '''
 
-        return Variable.distributions[self.dist](*self.param.values())
+        # Parameters that were changed in place also lead to a new distribution object
+        key = tuple(self._param.values())
+        if self._distribution is None or key != self._key:
+            import pyro.distributions
+            self._distribution = getattr(pyro.distributions, Variable.distributions[self._dist])(*key)
+            self._key = key
+        return self._distribution
 
     def sample(self):
         '''
@@ -55,17 +91,32 @@ class Variable(object):
         If the Variable is fixed then the current value remains the fixed value.
         '''
 
-        if 'fixed' in self.dist:
-            self.current_value = self.param['fixed']
+        if self._fixed:
+            self.current_value = self._param['fixed']
         else:
-            self.current_value = Variable.distributions[self.dist](*self.param.values()).sample()
+            self.current_value = self.return_dist().sample()
+
+    def sample_batch(self, n):
+        '''
+        Sample n independent values at once, the current value is not changed.
+
+        :param n: (int) number of values
+        :return: (tensor) of shape (n,)
+        '''
+
+        if self._fixed:
+            import torch
+            return torch.full((n,), float(self._param['fixed']))
+        return self.return_dist().sample((n,))
 
     def get_current_value(self):
         '''
-        Returns the current value
+        Returns the current value, a value is drawn if none has been drawn yet
 
         :return: (float)
         '''
+        if self.current_value is None:
+            self.sample()
         return self.current_value
 
     def __gt__(self, i):